@@ -31,14 +31,14 @@ setup(
         'Operating System :: OS Independent',
         'Programming Language :: Python',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
         'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.7',
         'Topic :: Software Development :: Libraries',
     ],
 
     # Packages and dependencies
     package_dir={'': 'src'},
+    python_requires='>=3.6',
     packages=find_packages('src'),
     install_requires=[
         'jinja2',
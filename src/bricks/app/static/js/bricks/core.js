@@ -272,6 +272,216 @@ var bricks = (function ($) {
         return (args.async) ? promise : promise.responseJSON;
     };
 
+    /**
+     Call a server-side function that returns a generator and iterate over
+     its items as they are produced.
+
+     Returns an async iterator::
+
+     .. code:: javascript
+
+     for await (var item of bricks.stream('/search/', query)) {
+         showResult(item);
+     }
+
+     The value returned by the generator is stored in the "result" attribute
+     of the iterator when the iteration is over. Functions that do not return
+     generators are also accepted: if the result is an array, its elements
+     are iterated.
+     */
+    bricks.stream = function () {
+        var call = normalizeCall(arguments);
+        var payload = json.dumps({
+            jsonrpc: '2.0',
+            method: call.api,
+            params: call.params,
+            id: Math.random()
+        });
+        var decoder = new TextDecoder();
+        var buffer = '';
+        var queue = [];
+        var done = false;
+        var streaming = true;
+        var reader = null;
+        var iterator;
+
+        var started = fetch(call.api, {
+            method: 'POST',
+            body: payload,
+            credentials: 'same-origin',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': getCookie('csrftoken')
+            }
+        }).then(function (response) {
+            if (!response.ok) {
+                throw Error(response.status + ': ' + response.statusText);
+            }
+            var contentType = response.headers.get('Content-Type') || '';
+            streaming = contentType.indexOf('application/x-ndjson') !== -1;
+            reader = response.body.getReader();
+        });
+
+        function processLine(line) {
+            if (!line.trim()) {
+                return;
+            }
+            var data = json.loads(line);
+            processErrors(data.error);
+            if ('partial' in data) {
+                queue.push(data.partial);
+                return;
+            }
+            var result = data.result;
+            if (result && result.constructor == json.JsAction) {
+                processProgram(result.js);
+                result = result.result;
+            }
+            if (streaming) {
+                iterator.result = result;
+            } else if (Array.isArray(result)) {
+                Array.prototype.push.apply(queue, result);
+            } else {
+                queue.push(result);
+            }
+        }
+
+        function pull() {
+            if (queue.length) {
+                return Promise.resolve({value: queue.shift(), done: false});
+            }
+            if (done) {
+                return Promise.resolve({value: undefined, done: true});
+            }
+            return reader.read().then(function (chunk) {
+                if (chunk.done) {
+                    done = true;
+                    buffer += decoder.decode();
+                    processLine(buffer);
+                } else {
+                    buffer += decoder.decode(chunk.value, {stream: true});
+                    var lines = buffer.split('\n');
+                    buffer = lines.pop();
+                    lines.forEach(processLine);
+                }
+                return pull();
+            });
+        }
+
+        iterator = {
+            result: undefined,
+            next: function () {
+                return started.then(pull);
+            },
+            return: function () {
+                done = true;
+                queue = [];
+                if (reader !== null) {
+                    reader.cancel();
+                }
+                return Promise.resolve({value: undefined, done: true});
+            }
+        };
+        if (typeof Symbol !== 'undefined' && Symbol.asyncIterator) {
+            iterator[Symbol.asyncIterator] = function () {
+                return this;
+            };
+        }
+        return iterator;
+    };
+
+    /**
+     Open a persistent WebSocket connection to a JSON-RPC end point served by
+     bricks.rpc.websocket.WebSocketRPC.
+
+     Functions are called by their registered names and concurrent calls are
+     multiplexed over the same connection::
+
+     .. code:: javascript
+
+     var socket = bricks.socket('/ws/rpc/');
+     socket.call('myapp.add', 1, 2).then(function (result) {
+         console.log(result);
+     });
+
+     Calls to functions that return generators resolve to the list of items.
+     */
+    bricks.socket = function (url) {
+        if (url.indexOf('://') === -1) {
+            var scheme = (document.location.protocol === 'https:') ? 'wss://' : 'ws://';
+            url = scheme + document.location.host + url;
+        }
+        var ws = new WebSocket(url);
+        var pending = {};
+        var lastId = 0;
+        var opened = new Promise(function (resolve, reject) {
+            ws.addEventListener('open', resolve);
+            ws.addEventListener('error', reject);
+        });
+
+        function settle(data) {
+            var call = pending[data.id];
+            if (call === undefined) {
+                return;
+            }
+            if ('partial' in data) {
+                call.items.push(data.partial);
+                return;
+            }
+            delete pending[data.id];
+            if (data.error !== undefined) {
+                call.reject(data.error);
+                return;
+            }
+            var result = data.result;
+            if (result && result.constructor == json.JsAction) {
+                processProgram(result.js);
+                result = result.result;
+            }
+            call.resolve(call.items.length ? call.items : result);
+        }
+
+        ws.addEventListener('message', function (event) {
+            var data = json.loads(event.data);
+            if (Array.isArray(data)) {
+                data.forEach(settle);
+            } else {
+                settle(data);
+            }
+        });
+        ws.addEventListener('close', function () {
+            for (var id in pending) {
+                pending[id].reject(Error('connection closed'));
+            }
+            pending = {};
+        });
+
+        return {
+            call: function (method) {
+                var args = Array.prototype.slice.call(arguments, 1);
+                var params = args;
+                if (args.length == 1 && args[0] instanceof Object && !Array.isArray(args[0])) {
+                    params = args[0];
+                }
+                var id = ++lastId;
+                return opened.then(function () {
+                    return new Promise(function (resolve, reject) {
+                        pending[id] = {resolve: resolve, reject: reject, items: []};
+                        ws.send(json.dumps({
+                            jsonrpc: '2.0',
+                            method: method,
+                            params: params,
+                            id: id
+                        }));
+                    });
+                });
+            },
+            close: function () {
+                ws.close();
+            }
+        };
+    };
+
     function processProgram(program) {
         if (program !== undefined) {
             Function(program)();
@@ -290,7 +500,14 @@ var bricks = (function ($) {
     // Auxiliary function used to normalize input arguments to many bricks
     // methods.
     function bricks_call(args, options) {
+        var promise = bricks.rpc($.extend(normalizeCall(args), options));
+        return promise;
+    }
+
+    // Return an {api, params} object from the arguments of a bricks call.
+    function normalizeCall(args) {
         var api_url = args[0];
+        var kwargs;
         args = Array.prototype.slice.call(args, 1);
 
         if (api_url[api_url.length - 1] === '*') {
@@ -310,16 +527,10 @@ var bricks = (function ($) {
             api_url = api_url + '/';
         }
 
-        // Create promise and attach value() method
         if (args.length != 0) {
             kwargs['*args'] = args
         }
-        var promise = bricks.rpc($.extend({
-            api: api_url,
-            params: kwargs,
-        }, options));
-
-        return promise;
+        return {api: api_url, params: kwargs};
     }
 
     // Support CSRF protection for AJAX requests in Django.
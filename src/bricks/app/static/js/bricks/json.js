@@ -57,6 +57,22 @@ var bricks$json = (function ($) {
                 return result;
             },
         },
+
+        // Lists of objects in columnar format. Tables are only decoded: they
+        // are converted to arrays of regular objects.
+        table: {
+            constructor: null,
+            decode: function (x) {
+                var columns = x.columns;
+                return $.map(x.rows, function (row) {
+                    var obj = {};
+                    for (var i = 0; i < columns.length; i++) {
+                        obj[columns[i]] = json_codec_worker(row[i], false);
+                    }
+                    return [obj];
+                });
+            }
+        },
     };
 
     // Encode/decode JSON like structures. Do not follow inheritance since it tends
@@ -0,0 +1,103 @@
+"""
+Benchmarks for Bricks.
+
+Each benchmark is a runnable module::
+
+    $ python -m bricks.bench.json
+
+Run a module with ``--help`` for the list of options.
+"""
+import time
+import tracemalloc
+
+
+def measure(func, min_time=0.2, repeat=3):
+    """
+    Measure the execution time of a function with no arguments.
+
+    The function is executed in a loop that lasts at least ``min_time``
+    seconds. The loop is repeated ``repeat`` times and the best result is
+    returned.
+
+    Returns:
+        Average time (in seconds) per call.
+    """
+
+    number = 1
+    while True:
+        elapsed = _time_loop(func, number)
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(min_time / elapsed) + 1)
+
+    best = elapsed
+    for _ in range(repeat - 1):
+        best = min(best, _time_loop(func, number))
+    return best / number
+
+
+def measure_allocations(func):
+    """
+    Execute func once and return a tuple with the number of new memory blocks
+    that are still allocated when func returns (this includes the result) and
+    the peak allocated memory (in bytes).
+    """
+
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    try:
+        tracemalloc.clear_traces()
+        before = tracemalloc.take_snapshot()
+        start, _ = tracemalloc.get_traced_memory()
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        del result
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+    blocks = sum(stat.count_diff for stat in
+                 after.compare_to(before, 'filename') if stat.count_diff > 0)
+    return blocks, peak - start
+
+
+def percentile(data, q):
+    """
+    Return the q-th percentile (0 <= q <= 100) of a sorted sequence of
+    numbers.
+    """
+
+    if not data:
+        return float('nan')
+    idx = (len(data) - 1) * q / 100
+    lo = int(idx)
+    hi = min(lo + 1, len(data) - 1)
+    return data[lo] + (data[hi] - data[lo]) * (idx - lo)
+
+
+def print_table(rows, header):
+    """
+    Print a list of rows as a simple text table.
+    """
+
+    rows = [[str(x) for x in row] for row in rows]
+    widths = [max(len(row[i]) for row in rows + [header])
+              for i in range(len(header))]
+    fmt = '  '.join('{:<%s}' % w if i == 0 else '{:>%s}' % w
+                    for i, w in enumerate(widths))
+    print(fmt.format(*header))
+    print('  '.join('-' * w for w in widths))
+    for row in rows:
+        print(fmt.format(*row))
+
+
+def _time_loop(func, number):
+    clock = time.perf_counter
+    start = clock()
+    for _ in range(number):
+        func()
+    return clock() - start
@@ -0,0 +1,164 @@
+"""
+Benchmark the Bricks JSON codec against the standard library json module.
+
+Usage::
+
+    $ python -m bricks.bench.json [--payload NAME] [--size N] [--min-time T]
+
+For each payload, the baseline is the stdlib json.dumps()/json.loads() of the
+already encoded JSON structure. The difference between the baseline and
+bricks.json.dumps()/loads() is the overhead of the '@' extension layer.
+"""
+import argparse
+import datetime
+import json as _json
+import sys
+
+from bricks import json as bricks_json
+from bricks.bench import measure, measure_allocations, print_table
+
+
+#
+# Payload generators. All generators receive a size parameter and return a
+# Python object.
+#
+def flat_records(size):
+    """
+    List of dictionaries with the same string keys and atomic values.
+    """
+
+    return [{'id': i, 'name': 'user-%s' % i, 'score': i * 0.5,
+             'active': i % 2 == 0, 'email': None}
+            for i in range(size)]
+
+
+def deep_nesting(size):
+    """
+    Deeply nested dictionaries and lists.
+    """
+
+    depth = min(size, 50)
+    node = {'leaf': list(range(10))}
+    for i in range(depth):
+        node = {'level': i, 'children': [node, {'value': i}]}
+    return [node] * max(1, size // depth)
+
+
+def extension_types(size):
+    """
+    Records with many values that are not supported by plain JSON.
+    """
+
+    base = datetime.date(2000, 1, 1)
+    return [{'date': base + datetime.timedelta(days=i),
+             'tags': {'a', 'b', 'c%s' % (i % 5)},
+             'point': (i, i + 1, i + 2),
+             'raw': b'\x00\x01\x02' * 4}
+            for i in range(size)]
+
+
+def non_string_keys(size):
+    """
+    Dictionaries with non-string keys that go through the '@dict' path.
+    """
+
+    return [{i: 'a', (i, 1): 'b', None: i} for i in range(size)]
+
+
+PAYLOADS = {
+    'flat': flat_records,
+    'nested': deep_nesting,
+    'extensions': extension_types,
+    'dict-keys': non_string_keys,
+}
+
+
+#
+# Benchmark
+#
+def run(payloads=None, size=1000, min_time=0.2, allocations=True):
+    """
+    Run benchmarks and return a list of result dictionaries.
+    """
+
+    results = []
+    for name in payloads or sorted(PAYLOADS):
+        data = PAYLOADS[name](size)
+        text = bricks_json.dumps(data)
+        raw = _json.loads(text)
+
+        cases = [
+            ('stdlib.dumps', lambda: _json.dumps(raw)),
+            ('bricks.dumps', lambda: bricks_json.dumps(data)),
+            ('stdlib.loads', lambda: _json.loads(text)),
+            ('bricks.loads', lambda: bricks_json.loads(text)),
+        ]
+        for case, func in cases:
+            elapsed = measure(func, min_time=min_time)
+            result = {
+                'payload': name,
+                'case': case,
+                'time': elapsed,
+                'ops': 1 / elapsed,
+                'mb/s': len(text) / elapsed / 1e6,
+                'bytes': len(text),
+            }
+            if allocations:
+                blocks, peak = measure_allocations(func)
+                result['blocks'] = blocks
+                result['peak'] = peak
+            results.append(result)
+    return results
+
+
+def report(results):
+    """
+    Print a table with the results returned by run().
+    """
+
+    baseline = {}
+    rows = []
+    for r in results:
+        op = r['case'].split('.')[1]
+        if r['case'].startswith('stdlib'):
+            baseline[r['payload'], op] = r['time']
+        ratio = r['time'] / baseline.get((r['payload'], op), r['time'])
+        rows.append([
+            r['payload'], r['case'],
+            '%.1f' % r['ops'], '%.1f' % r['mb/s'], '%.2fx' % ratio,
+            r.get('blocks', '-'),
+            '%.1f' % (r['peak'] / 1024) if 'peak' in r else '-',
+        ])
+    header = ['payload', 'case', 'ops/s', 'MB/s', 'vs stdlib', 'blocks',
+              'peak KiB']
+    print_table(rows, header)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m bricks.bench.json',
+        description='Benchmark bricks.json against the stdlib json module.')
+    parser.add_argument('--payload', '-p', action='append',
+                        choices=sorted(PAYLOADS),
+                        help='payload to benchmark (default: all)')
+    parser.add_argument('--size', '-n', type=int, default=1000,
+                        help='number of records in each payload')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='minimum time spent in each timing loop')
+    parser.add_argument('--no-allocations', action='store_true',
+                        help='do not trace memory allocations')
+    parser.add_argument('--json', action='store_true',
+                        help='print results as JSON')
+    args = parser.parse_args(argv)
+
+    results = run(args.payload, size=args.size, min_time=args.min_time,
+                  allocations=not args.no_allocations)
+    if args.json:
+        _json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,441 @@
+"""
+Load test for RPC functions.
+
+Usage::
+
+    $ python -m bricks.bench.rpc [--mode MODE] [--function NAME]
+                                 [--payload NAME] [--size N]
+                                 [--concurrency N] [--requests N]
+
+Calls are sent by a pool of threads and the tool reports the throughput and
+the latency distribution (p50/p95/p99) of each mode:
+
+inprocess:
+    Requests are created with RequestFactory and passed directly to the
+    dispatch view, without middleware.
+client:
+    Requests go through the full Django stack with the test client.
+wsgi:
+    Requests are sent with :class:`bricks.rpc_client.RPCClient` to a local
+    threaded WSGI server (the same server used by runserver).
+url:
+    Requests are sent to an external server given by ``--url``, e.g., an
+    ASGI server started with uvicorn.
+
+Any registered function can be called. The "bench.echo" function (which
+returns its argument), "bench.noop" and "bench.sleep" are always available.
+Arguments are generated by the payload generators of :mod:`bricks.bench.json`.
+Settings are taken from DJANGO_SETTINGS_MODULE, or from the test server
+settings (bricks.tests.testserver.settings) if the variable is not set.
+"""
+import argparse
+import json as _json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bricks.bench import percentile, print_table
+from bricks.bench.json import PAYLOADS
+
+DEFAULT_SETTINGS = 'bricks.tests.testserver.settings'
+MODES = ('inprocess', 'client', 'wsgi', 'url')
+API_PATH = '/api/'
+
+
+#
+# Benchmark functions
+#
+def echo(client, data=None):
+    return data
+
+
+def noop(client, *args):
+    return None
+
+
+def sleep(client, seconds=0.01):
+    time.sleep(seconds)
+
+
+def register_functions():
+    """
+    Register the bench.* functions in the global RPC registry.
+    """
+
+    from bricks.rpc.decorators import api
+
+    api(echo, name='bench.echo', register=True)
+    api(noop, name='bench.noop', register=True)
+    api(sleep, name='bench.sleep', register=True)
+
+
+def bench_settings():
+    """
+    Return a context manager that routes API_PATH to the dispatch view.
+    """
+
+    from django.test import override_settings
+
+    return override_settings(ROOT_URLCONF='bricks.bench.rpc_urls',
+                             ALLOWED_HOSTS=['*'])
+
+
+#
+# Drivers: each driver sends calls using a different transport.
+#
+class Driver:
+    """
+    Base class for transports. Subclasses implement call().
+    """
+
+    def __init__(self, function):
+        self.function = function
+
+    def call(self, params):
+        """
+        Call the function with the given params and raise an exception on
+        errors.
+        """
+
+        raise NotImplementedError
+
+    def payload(self, params):
+        from bricks.json import dumps
+        return dumps({'jsonrpc': '2.0', 'method': self.function,
+                      'params': params, 'id': 1})
+
+    def check(self, response):
+        if response.status_code != 200:
+            raise RuntimeError('HTTP %s' % response.status_code)
+        if response.streaming:
+            content = b''.join(response.streaming_content)
+        else:
+            content = response.content
+        from bricks.json import loads
+        data = loads(content.splitlines()[-1])
+        if 'error' in data:
+            raise RuntimeError(data['error']['message'])
+
+    def close(self):
+        pass
+
+
+class InProcessDriver(Driver):
+    def __init__(self, function):
+        from django.test import RequestFactory
+        from bricks.rpc import BricksRPCDispatchView
+
+        super().__init__(function)
+        self.factory = RequestFactory()
+        self.view = BricksRPCDispatchView.as_view()
+
+    def call(self, params):
+        from django.contrib.auth.models import AnonymousUser
+
+        request = self.factory.post(API_PATH, self.payload(params),
+                                    content_type='application/json')
+        request.user = AnonymousUser()
+        self.check(self.view(request))
+
+
+class TestClientDriver(Driver):
+    def __init__(self, function):
+        super().__init__(function)
+        self.local = threading.local()
+
+    def call(self, params):
+        from django.test import Client
+
+        try:
+            client = self.local.client
+        except AttributeError:
+            client = self.local.client = Client()
+        response = client.post(API_PATH, self.payload(params),
+                               content_type='application/json')
+        self.check(response)
+
+
+class ClientDriver(Driver):
+    def __init__(self, function, url, pool_size=4):
+        from bricks.rpc_client import RPCClient
+
+        super().__init__(function)
+        self.client = RPCClient(url, pool_size=pool_size)
+
+    def call(self, params):
+        self.client.call(self.function, *params)
+
+    def close(self):
+        self.client.close()
+
+
+def start_server(host='127.0.0.1', port=0):
+    """
+    Start a threaded WSGI server with the Django application in a background
+    thread and return it. The server URL is stored in its "url" attribute.
+    """
+
+    from django.core.servers.basehttp import (ThreadedWSGIServer,
+                                              WSGIRequestHandler)
+    from django.core.wsgi import get_wsgi_application
+
+    class QuietHandler(WSGIRequestHandler):
+        # Headers and body are written separately on keep-alive
+        # connections. Without TCP_NODELAY, Nagle's algorithm and delayed
+        # ACKs add ~40ms to each response.
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadedWSGIServer((host, port), QuietHandler)
+    server.daemon_threads = True
+    server.set_app(get_wsgi_application())
+    port = server.server_address[1]
+    server.url = 'http://%s:%s%s' % (host, port, API_PATH)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+#
+# Benchmark
+#
+def make_params(function, payload, size):
+    """
+    Return the list of positional arguments for each call.
+    """
+
+    if function == 'bench.noop' or payload is None:
+        return []
+    return [PAYLOADS[payload](size)]
+
+
+def run(mode='inprocess', function='bench.echo', payload='flat', size=10,
+        concurrency=4, requests=1000, duration=None, url=None, params=None,
+        warmup=10):
+    """
+    Run the load test and return a result dictionary.
+
+    Args:
+        mode:
+            One of 'inprocess', 'client', 'wsgi' or 'url'.
+        function:
+            Name of the registered function.
+        payload, size:
+            Payload generator and size used to create the call argument.
+            Ignored if params is given.
+        concurrency:
+            Number of threads sending calls.
+        requests:
+            Total number of calls.
+        duration:
+            If given, send calls for the given number of seconds instead of
+            a fixed number of requests.
+        url:
+            Server URL for the 'url' mode.
+        params:
+            Explicit list of positional arguments.
+        warmup:
+            Number of calls sent before measuring.
+    """
+
+    if params is None:
+        params = make_params(function, payload, size)
+
+    with bench_settings():
+        driver, server = make_driver(mode, function, concurrency, url)
+        try:
+            for _ in range(warmup):
+                driver.call(params)
+            latencies, errors, elapsed = Load(
+                driver, params, requests, duration).run(concurrency)
+        finally:
+            driver.close()
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+    result = {
+        'mode': mode,
+        'function': function,
+        'payload': payload if params else None,
+        'concurrency': concurrency,
+    }
+    result.update(summarize(latencies, errors, elapsed))
+    return result
+
+
+def make_driver(mode, function, concurrency=4, url=None):
+    """
+    Return a tuple (driver, server) for the given mode. The server is None
+    unless a local server is started for the 'wsgi' mode.
+    """
+
+    if mode == 'inprocess':
+        return InProcessDriver(function), None
+    elif mode == 'client':
+        return TestClientDriver(function), None
+    elif mode == 'wsgi':
+        server = start_server()
+        return ClientDriver(function, server.url, concurrency), server
+    elif mode == 'url':
+        if url is None:
+            raise ValueError('url mode requires an url')
+        return ClientDriver(function, url, concurrency), None
+    raise ValueError('invalid mode: %r' % mode)
+
+
+def summarize(latencies, errors, elapsed):
+    """
+    Return a dictionary with the throughput and latency percentiles of a
+    load test.
+    """
+
+    latencies = sorted(latencies)
+    n = len(latencies)
+    return {
+        'requests': n,
+        'errors': errors,
+        'time': elapsed,
+        'rps': n / elapsed if elapsed else float('nan'),
+        'mean': sum(latencies) / n if n else float('nan'),
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+    }
+
+
+class Load:
+    """
+    Send calls with a driver from several threads and collect the latency
+    of each call.
+
+    Calls are sent until ``requests`` calls were made or, if ``duration``
+    is given, until the given number of seconds elapsed.
+    """
+
+    clock = staticmethod(time.perf_counter)
+
+    def __init__(self, driver, params, requests, duration=None):
+        self.driver = driver
+        self.params = params
+        self.remaining = requests
+        self.duration = duration
+        self.deadline = None
+        self.latencies = []
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def run(self, concurrency):
+        """
+        Run the load test and return a tuple (latencies, errors, elapsed).
+        """
+
+        start = self.clock()
+        if self.duration is not None:
+            self.deadline = start + self.duration
+        with ThreadPoolExecutor(concurrency) as executor:
+            futures = [executor.submit(self.worker)
+                       for _ in range(concurrency)]
+            for future in futures:
+                future.result()
+        return self.latencies, self.errors, self.clock() - start
+
+    def next_request(self):
+        if self.deadline is not None:
+            return self.clock() < self.deadline
+        with self.lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+    def worker(self):
+        clock = self.clock
+        latencies = []
+        failed = 0
+        while self.next_request():
+            t0 = clock()
+            try:
+                self.driver.call(self.params)
+            except Exception:
+                failed += 1
+            latencies.append(clock() - t0)
+        with self.lock:
+            self.latencies.extend(latencies)
+            self.errors += failed
+
+
+def report(results):
+    """
+    Print a table with the results returned by run().
+    """
+
+    rows = []
+    for r in results:
+        rows.append([
+            r['mode'], r['function'], r['concurrency'], r['requests'],
+            r['errors'], '%.1f' % r['rps'],
+            '%.2f' % (r['p50'] * 1000), '%.2f' % (r['p95'] * 1000),
+            '%.2f' % (r['p99'] * 1000),
+        ])
+    header = ['mode', 'function', 'conc', 'requests', 'errors', 'req/s',
+              'p50 ms', 'p95 ms', 'p99 ms']
+    print_table(rows, header)
+
+
+def setup_django():
+    """
+    Configure Django and register the benchmark functions.
+    """
+
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', DEFAULT_SETTINGS)
+    django.setup()
+    register_functions()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m bricks.bench.rpc',
+        description='Load test RPC functions.')
+    parser.add_argument('--mode', '-m', action='append', choices=MODES,
+                        help='transport (default: inprocess)')
+    parser.add_argument('--function', '-f', default='bench.echo',
+                        help='name of the registered function')
+    parser.add_argument('--payload', '-p', choices=sorted(PAYLOADS),
+                        default='flat', help='payload generator')
+    parser.add_argument('--size', '-n', type=int, default=10,
+                        help='number of records in the payload')
+    parser.add_argument('--params',
+                        help='JSON list of arguments (overrides --payload)')
+    parser.add_argument('--concurrency', '-c', type=int, default=4,
+                        help='number of concurrent clients')
+    parser.add_argument('--requests', '-r', type=int, default=1000,
+                        help='total number of requests')
+    parser.add_argument('--duration', '-d', type=float,
+                        help='run for the given number of seconds instead')
+    parser.add_argument('--url', help='server URL for the url mode')
+    parser.add_argument('--json', action='store_true',
+                        help='print results as JSON')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    params = None if args.params is None else _json.loads(args.params)
+    results = [run(mode, args.function, args.payload, args.size,
+                   concurrency=args.concurrency, requests=args.requests,
+                   duration=args.duration, url=args.url, params=params)
+               for mode in args.mode or ['inprocess']]
+    if args.json:
+        _json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+"""
+URLconf used by :mod:`bricks.bench.rpc`: routes the benchmark API path to the
+dispatch view.
+"""
+from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
+
+from bricks.bench.rpc import API_PATH
+from bricks.rpc import BricksRPCDispatchView
+
+urlpatterns = [
+    path(API_PATH.lstrip('/'), csrf_exempt(BricksRPCDispatchView.as_view())),
+]
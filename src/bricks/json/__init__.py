@@ -9,6 +9,16 @@ Functions
 .. autofunction:: bricks.json.dumps
 .. autofunction:: bricks.json.loads
 .. autofunction:: bricks.json.register
+.. autofunction:: bricks.json.materialize
+.. autofunction:: bricks.json.digest
+
+
+Types
+-----
+
+.. autoclass:: Table
+.. autoclass:: LazyMapping
+.. autoclass:: LazySequence
 
 
 Errors
@@ -21,4 +31,6 @@ Errors
 from .exceptions import JSONDecodeError, JSONEncodeError
 from .encoders import encode
 from .decoders import decode
-from .common import register, dumps, loads
+from .common import register, dumps, loads, Table
+from .lazy import LazyMapping, LazySequence, materialize
+from .canonical import digest
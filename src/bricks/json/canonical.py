@@ -0,0 +1,66 @@
+#
+# Canonical JSON: deterministic serialization for cache keys and ETags.
+#
+import hashlib
+import json as _json
+
+from .encoders import encode
+
+#: '@' types whose 'data' field is an unordered collection.
+UNORDERED_TYPES = {'set', 'dict'}
+
+
+def canonical_dumps(obj):
+    """
+    Return a canonical JSON string dump of a Python object.
+
+    Equal objects always produce the same string, regardless of dict
+    insertion order, set iteration order or whether numbers are represented as
+    integers or integral floats. Keys are sorted, no whitespace is emitted,
+    floats such as 1.0 are written as integers and NaN/Infinity are rejected.
+
+    The result can be loaded with :func:`bricks.json.loads`, but it is mainly
+    useful as input for hashing (see :func:`bricks.json.digest`).
+    """
+
+    return _dumps(canonicalize(encode(obj)))
+
+
+def digest(obj, algorithm='sha1'):
+    """
+    Return a hex digest of the canonical JSON representation of obj.
+
+    This is a stable key for caching and ETags: equal objects have equal
+    digests across processes and Python versions.
+    """
+
+    data = canonical_dumps(obj).encode('utf8')
+    return hashlib.new(algorithm, data).hexdigest()
+
+
+def canonicalize(json):
+    """
+    Normalize an encoded JSON structure.
+
+    Return a copy in which numbers are normalized and the contents of
+    unordered '@' types (sets and dictionaries with non-string keys) are
+    sorted by their canonical representation.
+    """
+
+    if isinstance(json, float):
+        if json.is_integer():
+            return int(json)
+        return json
+    elif isinstance(json, list):
+        return [canonicalize(x) for x in json]
+    elif isinstance(json, dict):
+        result = {k: canonicalize(v) for k, v in json.items()}
+        if result.get('@') in UNORDERED_TYPES:
+            result['data'] = sorted(result['data'], key=_dumps)
+        return result
+    return json
+
+
+def _dumps(json):
+    return _json.dumps(json, sort_keys=True, separators=(',', ':'),
+                       ensure_ascii=False, allow_nan=False)
@@ -5,11 +5,14 @@ import json as _json
 from markupsafe import Markup
 
 from .util import normalize_class_name
+from .schema import compile_codec
+from .canonical import canonical_dumps
 from .decoders import decode, register as register_decode
-from .encoders import encode, register as register_encode
+from .encoders import encode, register as register_encode, \
+    _state as _encoder_state
 
 
-def register(cls, name=None, encode=None, decode=None):
+def register(cls, name=None, encode=None, decode=None, fields=None):
     """
     Register encode/decode pair of functions for the given Python type.
     Registration extends Bricks flavored JSON to handle arbitrary python
@@ -29,6 +32,17 @@ def register(cls, name=None, encode=None, decode=None):
             might assume that all elements were already converted to their most
             Pythonic forms (i.e., all dictionaries with an '@' key were already
             decoded to their Python forms).
+        fields:
+            Instead of passing the encode/decode functions, it is possible to
+            describe the type by its fields: either True, to infer them from a
+            dataclass or namedtuple, a list of field names or a mapping from
+            names to types. Specialized encode/decode functions that also
+            validate the field types are generated at registration time.
+
+    Example::
+
+        Point = namedtuple('Point', ['x', 'y'])
+        register(Point, 'point', fields={'x': float, 'y': float})
 
     See also:
         :ref:`json-custom-types`
@@ -40,6 +54,11 @@ def register(cls, name=None, encode=None, decode=None):
                     decode is None and encode is not None):
         raise ValueError('encoder and decoder must be given')
 
+    if fields is not None:
+        if encode is not None:
+            raise ValueError('cannot pass fields and encode/decode functions')
+        encode, decode = compile_codec(cls, name, fields)
+
     if encode is None:
         def decorator(func):
             def decode(dec_func):
@@ -56,22 +75,41 @@ def register(cls, name=None, encode=None, decode=None):
     register_encode(cls, name, encode)
 
 
-def loads(data):
+def loads(data, refs=False, lazy=False):
     """
     Load a string of JSON-encoded data and return the corresponding Python
-    object.
+    object. Data can also be given as bytes or bytearray (UTF-8, UTF-16 or
+    UTF-32), which avoids decoding it into an intermediate string.
+
+    Use refs=True to load data created by ``dumps(obj, refs=True)``. If
+    lazy=True, lists and dictionaries are only decoded when accessed (see
+    :func:`bricks.json.decode`).
     """
 
     raw = _json.loads(data)
-    return decode(raw)
+    return decode(raw, refs=refs, lazy=lazy)
 
 
-def dumps(obj):
+def dumps(obj, refs=False, tables=None, canonical=False):
     """
     Return a JSON string dump of a Python object.
+
+    If refs=True, shared and recursive objects are serialized as references.
+    The tables argument sets the minimum number of rows for using the
+    columnar format for lists of dictionaries (see :func:`bricks.json.encode`).
+
+    If canonical=True, return a deterministic representation that does not
+    depend on dict ordering or set iteration order. This is useful to compute
+    cache keys (see :func:`bricks.json.digest`) and cannot be combined with
+    the other options.
     """
 
-    encoded = encode(obj)
+    if canonical:
+        if refs or tables is not None:
+            raise ValueError('canonical mode does not accept other options')
+        return canonical_dumps(obj)
+
+    encoded = encode(obj, refs=refs, tables=tables)
     return _json.dumps(encoded)
 
 
@@ -97,21 +135,26 @@ def encode_set(data):
 
 @encode_set.register_decoder
 def decode_set(data):
-    return set(data['data'])
+    return set(decode(x) for x in data['data'])
 
 
 @register(tuple)
 def encode_tuple(data):
-    return {'data': list(data)}
+    return {'data': [encode(x) for x in data]}
 
 
 @encode_tuple.register_decoder
 def decode_tuple(data):
-    return tuple(data['data'])
+    return tuple(decode(x) for x in data['data'])
 
 
 @register(list)
 def encode_list(data):
+    threshold = _encoder_state.table_threshold
+    if threshold is not None and len(data) >= threshold and data:
+        table = _encode_table(data)
+        if table is not None:
+            return table
     return [encode(x) for x in data]
 
 
@@ -139,6 +182,64 @@ def decode_dict(data):
         result[decode(k)] = decode(v)
     return result
 
+
+class Table(list):
+    """
+    A list of dictionaries that share the same keys.
+
+    Tables are encoded in a columnar format that does not repeat the keys in
+    each row::
+
+        {
+            '@': 'table',
+            'columns': ['name', 'age'],
+            'rows': [['john', 42], ['paul', 38], ...]
+        }
+
+    and are decoded back as regular lists of dictionaries. Lists of
+    dictionaries can also be encoded as tables automatically using the
+    ``tables`` option of :func:`bricks.json.encode`.
+    """
+
+
+def _encode_table(data):
+    """
+    Encode a list of dictionaries in the columnar format or return None if
+    rows do not share the same string keys.
+    """
+
+    first = data[0]
+    if not isinstance(first, dict) or '@' in first:
+        return None
+    keys = first.keys()
+    if not all(isinstance(k, str) for k in keys):
+        return None
+    for row in data:
+        if not isinstance(row, dict) or row.keys() != keys:
+            return None
+
+    columns = list(keys)
+    rows = [[encode(row[col]) for col in columns] for row in data]
+    return {'@': 'table', 'columns': columns, 'rows': rows}
+
+
+@register(Table, 'table')
+def encode_table(data):
+    if not data:
+        return {'columns': [], 'rows': []}
+    table = _encode_table(data)
+    if table is None:
+        raise TypeError('table rows must be dictionaries with the same keys')
+    return table
+
+
+@encode_table.register_decoder
+def decode_table(data):
+    columns = data['columns']
+    return [dict(zip(columns, [decode(x) for x in row]))
+            for row in data['rows']]
+
+
 #
 # Common Python types (not builtins)
 #
@@ -168,3 +269,34 @@ def encode_markup(x):
 @encode_markup.register_decoder
 def decode_markup(x):
     return Markup(x['data'])
+
+
+# Numpy arrays are registered lazily: numpy is never imported unless an array
+# is encoded or an '@ndarray' node is decoded. Data is transmitted as the raw
+# (base64 encoded) memory buffer of the array. Subclasses such as numpy.matrix
+# are downcast and decoded as plain arrays. Masked arrays are rejected since
+# the mask would be silently lost.
+@register('numpy.ndarray', 'ndarray')
+def encode_ndarray(array):
+    import numpy
+
+    if isinstance(array, numpy.ma.MaskedArray):
+        raise TypeError('cannot encode masked arrays')
+    if array.dtype.fields is not None or array.dtype.hasobject:
+        raise TypeError('cannot encode arrays of dtype %s' % array.dtype)
+    if not array.flags.c_contiguous:
+        array = array.copy(order='C')
+    return {
+        'dtype': array.dtype.str,
+        'shape': list(array.shape),
+        'data': base64.b64encode(array.data).decode('ascii'),
+    }
+
+
+@encode_ndarray.register_decoder
+def decode_ndarray(data):
+    import numpy
+
+    buffer = base64.b64decode(data['data'].encode('ascii'))
+    array = numpy.frombuffer(buffer, dtype=numpy.dtype(data['dtype']))
+    return array.reshape(data['shape'])
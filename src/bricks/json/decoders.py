@@ -2,6 +2,7 @@
 # JSON decode: convert JSON structures to Python objects.
 #
 import datetime
+import threading
 
 from bricks.json.util import normalize_class_name
 from .exceptions import JSONDecodeError
@@ -10,14 +11,36 @@ NoneType = type(None)
 CLASSNAME_TO_DECODER = {}
 
 
+class _DecoderState(threading.local):
+    """
+    Per-thread state shared by nested calls to decode().
+    """
+
+    references = None
+
+
 #
 # Registration and basic APIs
 #
-def decode(data):
+def decode(data, refs=False, lazy=False):
     """
     Decode a JSON-like structure into the corresponding Python data.
+
+    Args:
+        data:
+            A JSON-like structure.
+        refs:
+            If True, resolve the ``{'@': 'ref', ...}`` nodes created by
+            ``encode(obj, refs=True)``.
+        lazy:
+            If True, return read-only proxies for lists and dictionaries that
+            only decode their contents when accessed. Use
+            :func:`bricks.json.materialize` to obtain the fully decoded data.
     """
 
+    if refs or lazy:
+        return _decode_with_options(data, refs, lazy)
+
     if isinstance(data, dict):
         if '@' in data:
             data_type = data['@']
@@ -28,9 +51,81 @@ def decode(data):
                 raise JSONDecodeError(msg)
             return decoder({k: v for (k, v) in data.items() if k != '@'})
         return {k: decode(v) for k, v in data.items()}
+    elif isinstance(data, list):
+        return [decode(x) for x in data]
     return data
 
 
+def _decode_with_options(data, refs, lazy):
+    """
+    Implements decode() with the refs and lazy options.
+    """
+
+    if lazy:
+        if refs:
+            raise ValueError('cannot use refs=True with lazy=True')
+        from .lazy import lazy_decode
+        return lazy_decode(data)
+    return _decode_references(data)
+
+
+def _decode_references(data):
+    """
+    Implements decode(data, refs=True).
+    """
+
+    if _state.references is not None:
+        return decode(data)
+
+    _state.references = {}
+    try:
+        return decode(data)
+    finally:
+        _state.references = None
+
+
+def decode_ref(data):
+    """
+    Decoder for {'@': 'ref'} nodes.
+
+    Definitions of lists and dictionaries are registered before decoding their
+    contents, hence they can contain references to themselves.
+    """
+
+    references = _state.references
+    if references is None:
+        raise JSONDecodeError('references are only accepted by '
+                              'decode(data, refs=True)')
+    ref_id = data['id']
+
+    if 'data' not in data:
+        try:
+            return references[ref_id]
+        except KeyError:
+            raise JSONDecodeError('undefined reference: %r' % ref_id)
+
+    return _define_reference(references, ref_id, data['data'])
+
+
+def _define_reference(references, ref_id, value):
+    """
+    Decode the definition of a reference and register it.
+    """
+
+    if isinstance(value, list):
+        result = references[ref_id] = []
+        result.extend(decode(x) for x in value)
+    elif isinstance(value, dict) and '@' not in value:
+        result = references[ref_id] = {}
+        result.update((k, decode(v)) for k, v in value.items())
+    elif isinstance(value, dict) and value['@'] == 'dict':
+        result = references[ref_id] = {}
+        result.update((decode(k), decode(v)) for k, v in value['data'])
+    else:
+        result = references[ref_id] = decode(value)
+    return result
+
+
 def register(cls, name=None, func=None):
     """
     Decorator that register decoding functions.
@@ -40,4 +135,6 @@ def register(cls, name=None, func=None):
     CLASSNAME_TO_DECODER[name] = func
 
 
+_state = _DecoderState()
+CLASSNAME_TO_DECODER['ref'] = decode_ref
 decode.register = register
@@ -1,9 +1,11 @@
 #
 # JSON encode: convert Python types to JSON structures.
 #
-from functools import singledispatch
+import threading
 
 from bricks.json.util import normalize_class_name
+from bricks.utils import lazy_singledispatch
+from bricks.utils.generic import _possible_qualnames
 from .exceptions import JSONEncodeError
 
 NoneType = type(None)
@@ -12,9 +14,23 @@ CLASS_TO_NAMES = {
 }
 
 
+class _EncoderState(threading.local):
+    """
+    Per-thread state shared by nested calls to encode().
+    """
+
+    references = None
+    table_threshold = None
+
+
 def register(cls, name=None, func=None):
     """
     Register an encoding function for the given class.
+
+    The class might be given as a fully qualified name such as
+    'numpy.ndarray'. In that case, the encoder is only bound to the actual
+    type when the first instance is encoded and the module defining the class
+    is never imported by bricks itself.
     """
 
     name = normalize_class_name(cls, name)
@@ -22,36 +38,218 @@ def register(cls, name=None, func=None):
     _encode_single_dispatch.register(cls)(func)
 
 
-def encode(data):
+def encode(data, refs=False, tables=None):
     """
     Encode some arbitrary Python data into a JSON-compatible structure.
 
-    This naive implementation does not handle recursive structures. This might
-    change in the future.
-
     This function encode subclasses of registered types as if they belong to
     the base class. This is convenient, but is potentially fragile and make
     the operation non-invertible.
+
+    Args:
+        data:
+            Any Python object with a registered encoder.
+        refs:
+            If True, objects that appear more than once in the data structure
+            are serialized only in their first occurrence as
+            ``{'@': 'ref', 'id': <n>, 'data': <json>}`` and all subsequent
+            occurrences are replaced by ``{'@': 'ref', 'id': <n>}``. This
+            preserves shared references and makes it possible to encode
+            recursive structures. The result must be decoded with
+            ``decode(data, refs=True)``.
+        tables:
+            If given, lists with at least this number of dictionaries that
+            share the same string keys are encoded in a columnar format:
+            ``{'@': 'table', 'columns': [...], 'rows': [[...], ...]}``.
+            (see :class:`bricks.json.Table`).
     """
 
+    if refs or tables is not None:
+        return _encode_with_options(data, refs, tables)
+
     cls = data.__class__
     if cls in {int, float, str, bool, NoneType}:
         return data
 
+    references = _state.references
+    if references is not None:
+        return _encode_shared(data, references)
+    return _encode_object(data)
+
+
+def _encode_shared(data, references):
+    """
+    Encode an object and keep track of its occurrences for encode(refs=True).
+    """
+
+    try:
+        return references[id(data)].reference()
+    except KeyError:
+        ref = references[id(data)] = _Reference(data)
+    ref.json = _encode_object(data)
+    return ref.json
+
+
+def _encode_object(data):
+    """
+    Encode a non-atomic object with its registered encoder.
+    """
+
     try:
         json = _encode_single_dispatch(data)
     except TypeError as ex:
         raise JSONEncodeError(str(ex))
-    if (isinstance(json, dict) and '@' not in json and
-            not isinstance(data, dict)):
-        json['@'] = CLASS_TO_NAMES[type(data)]
+    if isinstance(json, dict) and '@' not in json:
+        _add_type_name(json, data)
     return json
 
 
-@singledispatch
+def _add_type_name(json, data):
+    """
+    Add the '@' key to the dictionary returned by an encoder.
+
+    Dictionaries and objects encoded as dictionaries (e.g., lazy mappings)
+    are left untouched.
+    """
+
+    if isinstance(data, dict):
+        return
+    name = _class_name(data.__class__)
+    if name != 'dict':
+        json['@'] = name
+
+
+def _class_name(cls):
+    """
+    Return the '@' name associated with the given class.
+
+    Classes registered by their qualified names and subclasses of registered
+    types are resolved on the first call and cached afterwards.
+    """
+
+    try:
+        return CLASS_TO_NAMES[cls]
+    except KeyError:
+        pass
+
+    for base in cls.__mro__:
+        if base in CLASS_TO_NAMES:
+            name = CLASS_TO_NAMES[base]
+            break
+    else:
+        for qualname in _possible_qualnames(cls):
+            if qualname in CLASS_TO_NAMES:
+                name = CLASS_TO_NAMES[qualname]
+                break
+        else:
+            raise JSONEncodeError('no name registered for %s' % cls.__name__)
+
+    CLASS_TO_NAMES[cls] = name
+    return name
+
+
+class _Reference:
+    """
+    Keeps track of all occurrences of an object when encoding with refs=True.
+    """
+
+    __slots__ = ('obj', 'json', 'id', 'placeholders')
+
+    def __init__(self, obj):
+        self.obj = obj  # keeps obj alive so its id() is not reused
+        self.json = None
+        self.id = None
+        self.placeholders = []
+
+    def reference(self):
+        placeholder = {'@': 'ref', 'id': None}
+        self.placeholders.append(placeholder)
+        return placeholder
+
+
+def _encode_with_options(data, refs, tables):
+    """
+    Implements encode() with the refs and tables options.
+    """
+
+    state = _state
+    if state.references is not None or state.table_threshold is not None:
+        return encode(data)
+
+    references = state.references = {} if refs else None
+    state.table_threshold = tables
+    try:
+        json = encode(data)
+    finally:
+        state.references = state.table_threshold = None
+
+    if references is None:
+        return json
+
+    shared = [ref for ref in references.values() if ref.placeholders]
+    if not shared:
+        return json
+    return _ReferenceResolver(shared).resolve(json)
+
+
+class _ReferenceResolver:
+    """
+    Walks the encoded JSON tree in document order and replaces shared objects
+    by their definitions (in the first occurrence) and references (in all
+    subsequent ones).
+    """
+
+    def __init__(self, shared):
+        self.next_id = 1
+        self.by_json = {}
+        self.by_placeholder = {}
+
+        for ref in shared:
+            if isinstance(ref.json, (dict, list)):
+                self.by_json[id(ref.json)] = ref
+            for placeholder in ref.placeholders:
+                self.by_placeholder[id(placeholder)] = ref
+
+    def resolve(self, json):
+        ref = self.by_json.get(id(json)) or self.by_placeholder.get(id(json))
+        if ref is None:
+            return self.resolve_children(json)
+
+        # Atomic values (e.g., from custom encoders) are simply repeated
+        if not isinstance(ref.json, (dict, list)):
+            return ref.json
+
+        if json is ref.json:
+            node = {'@': 'ref'}
+        else:
+            node = json
+        if ref.id is not None:
+            node['id'] = ref.id
+            return node
+
+        ref.id = self.next_id
+        self.next_id += 1
+        node['id'] = ref.id
+        node['data'] = self.resolve_children(ref.json)
+        return node
+
+    def resolve_children(self, json):
+        if isinstance(json, dict):
+            for k, v in json.items():
+                if isinstance(v, (dict, list)):
+                    json[k] = self.resolve(v)
+        elif isinstance(json, list):
+            for i, v in enumerate(json):
+                if isinstance(v, (dict, list)):
+                    json[i] = self.resolve(v)
+        return json
+
+
+@lazy_singledispatch
 def _encode_single_dispatch(data):
     type_name = type(data).__name__
     raise TypeError('could not encode %s object: %s' % (type(data), type_name))
 
 
+_state = _EncoderState()
 encode.register = register
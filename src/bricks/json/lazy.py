@@ -0,0 +1,142 @@
+#
+# Lazy decode: read-only proxies that convert JSON structures on demand.
+#
+from collections.abc import Mapping, Sequence
+
+from .decoders import decode
+from .encoders import register as register_encode
+
+
+def lazy_decode(data):
+    """
+    Return a lazy version of the decoded data.
+
+    Lists and dictionaries are wrapped into :class:`LazySequence` and
+    :class:`LazyMapping` proxies that only decode their items when they are
+    accessed. Atomic values are returned as is and '@' nodes are decoded
+    eagerly.
+    """
+
+    if isinstance(data, dict):
+        if '@' in data:
+            return decode(data)
+        return LazyMapping(data)
+    elif isinstance(data, list):
+        return LazySequence(data)
+    return data
+
+
+def materialize(data):
+    """
+    Convert lazy proxies created by ``decode(data, lazy=True)`` into regular
+    Python lists and dictionaries.
+
+    Other objects are returned as is.
+    """
+
+    if isinstance(data, (LazyMapping, LazySequence)):
+        return data.materialize()
+    return data
+
+
+class LazyMapping(Mapping):
+    """
+    A read-only mapping that decodes its values when they are accessed.
+    """
+
+    __slots__ = ('_data', '_cache')
+
+    def __init__(self, data):
+        self._data = data
+        self._cache = {}
+
+    def __getitem__(self, key):
+        try:
+            return self._cache[key]
+        except KeyError:
+            value = self._cache[key] = lazy_decode(self._data[key])
+            return value
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self._data)
+
+    def materialize(self):
+        """
+        Return a fully decoded dictionary.
+        """
+
+        cache = self._cache
+        return {k: materialize(cache[k]) if k in cache else decode(v)
+                for k, v in self._data.items()}
+
+
+class LazySequence(Sequence):
+    """
+    A read-only sequence that decodes its items when they are accessed.
+    """
+
+    __slots__ = ('_data', '_cache')
+
+    def __init__(self, data):
+        self._data = data
+        self._cache = {}
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return LazySequence(self._data[idx])
+        if idx < 0:
+            idx += len(self._data)
+            if idx < 0:
+                raise IndexError('list index out of range')
+        try:
+            return self._cache[idx]
+        except KeyError:
+            value = self._cache[idx] = lazy_decode(self._data[idx])
+            return value
+
+    def __len__(self):
+        return len(self._data)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, LazySequence)):
+            return len(self) == len(other) and all(
+                x == y for x, y in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self._data)
+
+    def materialize(self):
+        """
+        Return a fully decoded list.
+        """
+
+        cache = self._cache
+        return [materialize(cache[i]) if i in cache else decode(x)
+                for i, x in enumerate(self._data)]
+
+
+# Proxies are re-encoded from the raw JSON data without decoding their
+# contents. The raw data of a mapping is a JSON object without an '@' key,
+# hence it is emitted as a plain object, just like encode_dict does.
+def _encode_lazy_mapping(data):
+    return dict(data._data)
+
+
+def _encode_lazy_sequence(data):
+    return list(data._data)
+
+
+register_encode(LazyMapping, 'dict', _encode_lazy_mapping)
+register_encode(LazySequence, 'list', _encode_lazy_sequence)
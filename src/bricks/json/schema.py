@@ -0,0 +1,161 @@
+#
+# Schema-based codecs: generate specialized encode/decode functions from a
+# list of fields.
+#
+import keyword
+
+from .decoders import decode as _decode
+from .encoders import encode as _encode
+from .exceptions import JSONDecodeError
+
+#: Types that are transmitted as is and do not need to be encoded/decoded.
+ATOMIC_TYPES = {
+    int: (int,),
+    float: (float, int),
+    str: (str,),
+    bool: (bool,),
+    type(None): (type(None),),
+}
+_NO_DEFAULT = object()
+
+
+def compile_codec(cls, name, fields=True):
+    """
+    Return a pair of (encode, decode) functions for the given class.
+
+    The functions are generated once from the list of fields and are
+    specialized to the given type: atomic fields (int, float, str, bool) are
+    copied directly and type-checked and other fields are converted with
+    :func:`bricks.json.encode` and :func:`bricks.json.decode`. Fields
+    annotated with other classes are checked with isinstance() after decoding.
+
+    Args:
+        cls:
+            The Python type. Its constructor must accept all fields as keyword
+            arguments.
+        name:
+            The name associated with the '@' key.
+        fields:
+            True, to infer fields from a dataclass or a namedtuple; a sequence
+            of field names; or a mapping from field names to types. Fields
+            with a type of None are not checked.
+    """
+
+    fields = _normalize_fields(cls, fields)
+    namespace = {
+        '_cls': cls,
+        '_name': name,
+        '_encode': _encode,
+        '_decode': _decode,
+        'JSONDecodeError': JSONDecodeError,
+    }
+    enc_lines = ['def encode(obj):']
+    dec_lines = [
+        'def decode(data):',
+        '    get = data.get',
+    ]
+    items = []
+    kwargs = []
+    for i, (field, tt, default) in enumerate(fields):
+        var = 'f%s' % i
+        items.append('%r: %s' % (field, var))
+        kwargs.append('%s=%s' % (field, var))
+        enc, dec = _field_lines(i, var, name, field, tt, default, namespace)
+        enc_lines.extend(enc)
+        dec_lines.extend(dec)
+
+    enc_lines.append('    return {"@": _name, %s}' % ', '.join(items))
+    dec_lines.append('    return _cls(%s)' % ', '.join(kwargs))
+    source = '\n'.join(enc_lines + [''] + dec_lines)
+    exec(compile(source, '<bricks.json codec for %s>' % name, 'exec'),
+         namespace)
+    return namespace['encode'], namespace['decode']
+
+
+def _field_lines(i, var, name, field, tt, default, namespace):
+    """
+    Return the source lines that encode and decode the i-th field of a
+    compiled codec. Constants used by the generated code are stored in
+    namespace.
+    """
+
+    types = ATOMIC_TYPES.get(tt)
+    namespace['_types%s' % i] = types or tt
+    namespace['_default%s' % i] = default
+    namespace['_invalid%s' % i] = \
+        'invalid value for %s.%s: %%r' % (name, field)
+    namespace['_missing%s' % i] = 'missing field: %s.%s' % (name, field)
+    if types is not None:
+        check_type = '    if %s.__class__ not in _types%s:' % (var, i)
+    else:
+        check_type = '    if not isinstance(%s, _types%s):' % (var, i)
+    encode_error = '        raise TypeError(_invalid%s %% (%s,))' % (i, var)
+    decode_error = \
+        '        raise JSONDecodeError(_invalid%s %% (%s,))' % (i, var)
+
+    # Encoder
+    enc_lines = ['    %s = obj.%s' % (var, field)]
+    if tt is not None:
+        enc_lines.extend([check_type, encode_error])
+    if types is None:
+        enc_lines.append('    %s = _encode(%s)' % (var, var))
+
+    # Decoder
+    dec_lines = ['    %s = get(%r, _default%s)' % (var, field, i)]
+    if default is _NO_DEFAULT:
+        dec_lines.extend([
+            '    if %s is _default%s:' % (var, i),
+            '        raise JSONDecodeError(_missing%s)' % i,
+        ])
+    if types is None:
+        dec_lines.append('    %s = _decode(%s)' % (var, var))
+    if tt is not None:
+        dec_lines.extend([check_type, decode_error])
+    return enc_lines, dec_lines
+
+
+def _normalize_fields(cls, fields):
+    """
+    Return a list of (name, type, default) triples from the fields argument
+    of compile_codec().
+    """
+
+    defaults = {}
+    if fields is True:
+        fields, defaults = _infer_fields(cls)
+    elif not hasattr(fields, 'items'):
+        fields = {field: None for field in fields}
+
+    result = []
+    for field, tt in fields.items():
+        if not field.isidentifier() or keyword.iskeyword(field):
+            raise ValueError('invalid field name: %r' % field)
+        if tt is not None and not isinstance(tt, type):
+            tt = None  # typing constructs and string annotations
+        default = defaults.get(field, _NO_DEFAULT)
+        result.append((field, tt, default))
+    return result
+
+
+def _infer_fields(cls):
+    """
+    Return a tuple (fields, defaults) of dictionaries for a dataclass or a
+    namedtuple.
+    """
+
+    if hasattr(cls, '__dataclass_fields__'):
+        import dataclasses
+
+        fields = {}
+        defaults = {}
+        for field in dataclasses.fields(cls):
+            fields[field.name] = field.type
+            if field.default is not dataclasses.MISSING:
+                defaults[field.name] = field.default
+        return fields, defaults
+    if issubclass(cls, tuple) and hasattr(cls, '_fields'):
+        annotations = getattr(cls, '__annotations__', {})
+        fields = {f: annotations.get(f) for f in cls._fields}
+        return fields, dict(getattr(cls, '_field_defaults', {}))
+    raise TypeError('cannot infer fields of %s: it is neither a '
+                    'dataclass nor a namedtuple' % cls.__name__)
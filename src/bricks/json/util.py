@@ -1,8 +1,12 @@
 def normalize_class_name(cls, name=None):
     """
     Return the default class name from the given type.
+
+    Types can also be given by their qualified names (e.g., 'numpy.ndarray').
     """
 
     if name:
         return name
+    if isinstance(cls, str):
+        return cls.rpartition('.')[-1].lower()
     return cls.__name__.lower()
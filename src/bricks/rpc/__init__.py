@@ -12,7 +12,13 @@ Generic views
 .. autoclass:: RPCView
    :members:
 
+.. autoclass:: AsyncRPCView
+
+.. autoclass:: BricksRPCDispatchView
+   :members:
+
 """
 
-from .views import RPCView, jsonrpc_endpoint
+from .views import RPCView, AsyncRPCView, jsonrpc_endpoint
+from .dispatch import BricksRPCDispatchView
 from .decorators import route
@@ -0,0 +1,324 @@
+"""
+Validation and coercion of call parameters.
+
+The signature of each RPC function is inspected only once and compiled into a
+:class:`Binder`. Calls with missing, unexpected or duplicated arguments are
+rejected with a JSON-RPC "invalid params" error (-32602) before the function
+is executed.
+
+Parameters annotated with simple types are also checked and, when it is safe,
+coerced::
+
+    @api
+    def resize(client, width: int, height: int, scale: float = 1.0):
+        ...
+
+Integers are accepted for float parameters, integral floats and numeric
+strings for int parameters, lists for tuple and set parameters, and so on.
+Optional[X] annotations also accept None. Other annotations are not checked.
+"""
+import inspect
+import typing
+import weakref
+from collections.abc import Mapping, Sequence
+
+#: JSON-RPC error code for invalid method parameters.
+INVALID_PARAMS = -32602
+
+_EMPTY = inspect.Parameter.empty
+_POSITIONAL = (inspect.Parameter.POSITIONAL_ONLY,
+               inspect.Parameter.POSITIONAL_OR_KEYWORD)
+
+
+class InvalidParams(TypeError):
+    """
+    Raised when call parameters do not match the function signature.
+    """
+
+    code = INVALID_PARAMS
+
+    def __init__(self, message, param=None):
+        super().__init__(message)
+        self.param = param
+
+
+class Binder:
+    """
+    Compiled signature of an RPC function.
+
+    Args:
+        func:
+            The RPC function.
+        request_argument:
+            If True, the first argument of func receives the client object
+            and is not a parameter of the remote call.
+    """
+
+    def __init__(self, func, request_argument=True):
+        try:
+            signature = inspect.signature(func)
+        except (TypeError, ValueError):
+            signature = None
+
+        self.positional = []
+        self.names = set()
+        self.converters = {}
+        self.required = []
+        self.var_positional = True
+        self.var_keyword = True
+        self.positional_only = set()
+        self.signature = None
+        if signature is None:
+            return
+
+        params = list(signature.parameters.values())
+        if request_argument and params and params[0].kind in _POSITIONAL:
+            params = params[1:]
+        self.signature = signature.replace(parameters=params)
+
+        self.var_positional = False
+        self.var_keyword = False
+        for param in params:
+            self._add_parameter(param)
+
+    def _add_parameter(self, param):
+        kind = param.kind
+        if kind == param.VAR_POSITIONAL:
+            self.var_positional = True
+            return
+        elif kind == param.VAR_KEYWORD:
+            self.var_keyword = True
+            return
+        self.names.add(param.name)
+        if kind in _POSITIONAL:
+            self.positional.append(param.name)
+        if kind == param.POSITIONAL_ONLY:
+            self.positional_only.add(param.name)
+        if param.default is _EMPTY:
+            self.required.append(param.name)
+        converter = make_converter(param.annotation, param.default)
+        if converter is not None:
+            self.converters[param.name] = converter
+
+    def bind(self, args, kwargs):
+        """
+        Validate and coerce call parameters.
+
+        Return a tuple (args, kwargs) with the converted values or raise
+        InvalidParams.
+        """
+
+        names = self._check_arguments(args, kwargs)
+        if self.converters:
+            args, kwargs = self._convert(args, kwargs, names)
+        return args, kwargs
+
+    def _check_arguments(self, args, kwargs):
+        """
+        Raise InvalidParams if arguments do not match the signature. Return
+        the names of the positional arguments.
+        """
+
+        positional = self.positional
+        n_args = len(args)
+        if n_args > len(positional) and not self.var_positional:
+            raise InvalidParams(
+                'expected at most %s positional arguments, got %s'
+                % (len(positional), n_args))
+
+        names = positional[:n_args]
+        for name in kwargs:
+            self._check_keyword(name, names)
+
+        for name in self.required:
+            if name not in kwargs and name not in names:
+                raise InvalidParams('missing required argument: %r' % name,
+                                    name)
+        return names
+
+    def _check_keyword(self, name, names):
+        if name in self.positional_only:
+            raise InvalidParams(
+                'argument %r must be passed by position' % name, name)
+        if name in names:
+            raise InvalidParams('multiple values for argument %r' % name,
+                                name)
+        if name not in self.names and not self.var_keyword:
+            raise InvalidParams('unexpected argument: %r' % name, name)
+
+    def _convert(self, args, kwargs, names):
+        converters = self.converters
+        args = list(args)
+        for i, name in enumerate(names):
+            if name in converters:
+                args[i] = converters[name](name, args[i])
+        kwargs = {k: converters[k](k, v) if k in converters else v
+                  for k, v in kwargs.items()}
+        return args, kwargs
+
+    def arguments(self, args, kwargs):
+        """
+        Return a dictionary mapping parameter names to values, with defaults
+        applied, so equivalent calls such as f(1) and f(x=1) produce the same
+        dictionary.
+
+        Return None if the signature is unknown or the call does not match
+        it.
+        """
+
+        if self.signature is None:
+            return None
+        try:
+            bound = self.signature.bind(*args, **kwargs)
+        except TypeError:
+            return None
+        bound.apply_defaults()
+        return dict(bound.arguments)
+
+
+def make_converter(annotation, default=_EMPTY):
+    """
+    Return a function converter(name, value) that checks and coerces values
+    for a parameter with the given annotation, or None if annotation is not
+    checked.
+    """
+
+    if annotation is _EMPTY:
+        return None
+
+    # Optional[X] and other unions
+    if getattr(annotation, '__origin__', None) is typing.Union:
+        return _make_union_converter(annotation)
+
+    if not isinstance(annotation, type):
+        return None
+    coerce = _COERCE.get(annotation, _check_instance)
+    return _type_converter(annotation, coerce, default is None)
+
+
+def _type_converter(annotation, coerce, allow_none):
+    def converter(name, value):
+        if value is None and allow_none:
+            return value
+        try:
+            return coerce(annotation, value)
+        except (TypeError, ValueError):
+            raise InvalidParams('argument %r must be %s, got %s' % (
+                name, annotation.__name__, type(value).__name__), name)
+
+    return converter
+
+
+def _make_union_converter(annotation):
+    options = [x for x in annotation.__args__ if x is not type(None)]
+    allow_none = len(options) < len(annotation.__args__)
+    converters = [make_converter(x) for x in options]
+    if any(c is None for c in converters):
+        return None
+    return _union_converter(annotation, converters, allow_none)
+
+
+def _union_converter(annotation, converters, allow_none):
+    def converter(name, value):
+        if value is None and allow_none:
+            return value
+        for func in converters:
+            try:
+                return func(name, value)
+            except InvalidParams:
+                pass
+        raise InvalidParams('argument %r must be %s, got %s' % (
+            name, _type_name(annotation), type(value).__name__), name)
+
+    return converter
+
+
+def _type_name(annotation):
+    return getattr(annotation, '__name__', None) or str(annotation)
+
+
+def _check_instance(cls, value):
+    if isinstance(value, cls):
+        return value
+    raise TypeError
+
+
+def _coerce_int(cls, value):
+    if isinstance(value, bool):
+        raise TypeError
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return int(value)
+    raise TypeError
+
+
+def _coerce_float(cls, value):
+    if isinstance(value, bool):
+        raise TypeError
+    if isinstance(value, (int, float, str)):
+        return float(value)
+    raise TypeError
+
+
+def _coerce_bool(cls, value):
+    if isinstance(value, bool):
+        return value
+    if value in ('true', '1', 1):
+        return True
+    if value in ('false', '0', 0):
+        return False
+    raise TypeError
+
+
+def _coerce_list(cls, value):
+    if isinstance(value, (list, Sequence)) and not isinstance(value, str):
+        return value
+    raise TypeError
+
+
+def _coerce_collection(cls, value):
+    if isinstance(value, cls):
+        return value
+    if isinstance(value, (list, tuple, set, Sequence)) and \
+            not isinstance(value, str):
+        return cls(value)
+    raise TypeError
+
+
+def _coerce_dict(cls, value):
+    if isinstance(value, Mapping):
+        return value
+    raise TypeError
+
+
+_COERCE = {
+    int: _coerce_int,
+    float: _coerce_float,
+    bool: _coerce_bool,
+    list: _coerce_list,
+    tuple: _coerce_collection,
+    set: _coerce_collection,
+    frozenset: _coerce_collection,
+    dict: _coerce_dict,
+}
+
+_binders = weakref.WeakKeyDictionary()
+
+
+def get_binder(func, request_argument=True):
+    """
+    Return the Binder for func, creating it if necessary.
+    """
+
+    try:
+        return _binders[func][request_argument]
+    except KeyError:
+        binder = Binder(func, request_argument)
+        _binders.setdefault(func, {})[request_argument] = binder
+        return binder
+    except TypeError:
+        # Objects that do not support weak references
+        return Binder(func, request_argument)
@@ -0,0 +1,271 @@
+"""
+Result caching for pure RPC functions.
+
+Results are keyed by the function name and a canonical digest of the call
+parameters (see :func:`bricks.json.digest`). Parameters are normalized with
+the function signature, so f(1) and f(x=1) share the same entry.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from bricks.json import digest
+
+_MISSING = object()
+
+
+class ResultCache:
+    """
+    Base class for RPC result caches.
+
+    Subclasses must implement the get_item(), set_item(), delete_item() and
+    clear() methods.
+
+    Args:
+        name:
+            Name of the cached function.
+        ttl:
+            Time to live (in seconds) of each entry. None means no expiration.
+        vary_on_user:
+            If True, results are cached separately for each user.
+        binder:
+            The :class:`bricks.rpc.binding.Binder` of the cached function.
+            It is used to normalize call parameters into keys.
+    """
+
+    def __init__(self, name, ttl=None, vary_on_user=False, binder=None):
+        self.name = name
+        self.ttl = ttl
+        self.vary_on_user = vary_on_user
+        self.binder = binder
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, args, kwargs, user=None):
+        """
+        Return the cache key for the given call parameters.
+
+        If user is given, the key is specific to that user. Views pass the
+        user whenever results may depend on it, even if vary_on_user is
+        False (e.g., for functions with login_required or perms_required).
+        """
+
+        user_id = getattr(user, 'pk', None)
+        arguments = None
+        if self.binder is not None:
+            arguments = self.binder.arguments(args, kwargs)
+        if arguments is not None:
+            args, kwargs = [], arguments
+        return '%s:%s' % (self.name, digest([args, kwargs, user_id]))
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for key or default, if key is not present.
+        """
+
+        value = self.get_item(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """
+        Store value for the given key.
+        """
+
+        self.set_item(key, value)
+
+    def invalidate(self, *args, **kwargs):
+        """
+        Remove the cached result for a call with the given arguments.
+
+        Arguments are given as they are received by the function, without the
+        client argument.
+        """
+
+        self.delete_item(self.make_key(list(args), kwargs))
+
+    def invalidate_user(self, user, *args, **kwargs):
+        """
+        Like invalidate(), but for results cached for the given user.
+
+        Use it for caches that vary on the user and for functions that
+        require login or permissions.
+        """
+
+        self.delete_item(self.make_key(list(args), kwargs, user))
+
+    def stats(self):
+        """
+        Return a dictionary with hit and miss counts.
+        """
+
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+
+    def get_item(self, key, default):
+        raise NotImplementedError
+
+    def set_item(self, key, value):
+        raise NotImplementedError
+
+    def delete_item(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LRUResultCache(ResultCache):
+    """
+    A bounded in-process LRU cache.
+
+    Args:
+        maxsize:
+            Maximum number of entries. Least recently used entries are
+            discarded first.
+    """
+
+    def __init__(self, name, ttl=None, vary_on_user=False, maxsize=1024,
+                 binder=None):
+        super().__init__(name, ttl, vary_on_user, binder)
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_item(self, key, default):
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                return default
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set_item(self, key, value):
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete_item(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DjangoResultCache(ResultCache):
+    """
+    Stores results in a Django cache backend.
+
+    Cache keys include a generation number, so clear() only invalidates the
+    results of this function. The generation is stored in the backend, but
+    it is kept in memory and only read again every ``refresh_interval``
+    seconds, so gets and sets take a single round trip. Other processes see
+    the effect of clear() after at most ``refresh_interval`` seconds.
+
+    Args:
+        alias:
+            Name of the cache in the CACHES setting.
+        refresh_interval:
+            Number of seconds the generation number is kept in memory.
+    """
+
+    def __init__(self, name, ttl=None, vary_on_user=False, alias='default',
+                 binder=None, refresh_interval=5.0):
+        super().__init__(name, ttl, vary_on_user, binder)
+        self.alias = alias
+        self.refresh_interval = refresh_interval
+        self._generation = None
+        self._refresh_at = 0.0
+
+    @property
+    def backend(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    @property
+    def generation(self):
+        """
+        Current generation number of the cached results.
+        """
+
+        now = time.monotonic()
+        if self._generation is None or now >= self._refresh_at:
+            self._set_generation(
+                self.backend.get_or_set(self._generation_key, 0, None), now)
+        return self._generation
+
+    def _set_generation(self, generation, now=None):
+        now = time.monotonic() if now is None else now
+        self._generation = generation
+        self._refresh_at = now + self.refresh_interval
+
+    def _backend_key(self, key):
+        return 'bricks.rpc:%s:%s' % (self.generation, key)
+
+    @property
+    def _generation_key(self):
+        return 'bricks.rpc-generation:%s' % self.name
+
+    def get_item(self, key, default):
+        return self.backend.get(self._backend_key(key), default)
+
+    def set_item(self, key, value):
+        self.backend.set(self._backend_key(key), value, self.ttl)
+
+    def delete_item(self, key):
+        self.backend.delete(self._backend_key(key))
+
+    def clear(self):
+        backend = self.backend
+        try:
+            generation = backend.incr(self._generation_key)
+        except ValueError:
+            generation = (self._generation or 0) + 1
+            backend.set(self._generation_key, generation, None)
+        self._set_generation(generation)
+
+
+def make_result_cache(name, cache=True, ttl=None, vary_on_user=False,
+                      maxsize=1024, binder=None):
+    """
+    Create a result cache from the options of the @api decorators.
+
+    Args:
+        name:
+            Name of the cached function.
+        cache:
+            True, for an in-process LRU cache; a string with the alias of a
+            Django cache backend; or a :class:`ResultCache` instance, which is
+            returned as is.
+    """
+
+    if isinstance(cache, ResultCache):
+        if cache.binder is None:
+            cache.binder = binder
+        return cache
+    elif cache is True:
+        return LRUResultCache(name, ttl, vary_on_user, maxsize=maxsize,
+                              binder=binder)
+    elif isinstance(cache, str):
+        return DjangoResultCache(name, ttl, vary_on_user, alias=cache,
+                                 binder=binder)
+    raise TypeError('invalid cache: %r' % cache)
@@ -110,11 +110,21 @@ should be available to each user.
 **Under construction.**
 
 """
-from functools import wraps, partial
+import asyncio
+import inspect
+from functools import wraps
 
-from .views import RPCView
+from .cache import make_result_cache
+from .dispatch import default_name, register_handler
+from .binding import get_binder
+from .jobs import job_status
+from .limits import ConcurrencyLimiter
+from .views import RPCView, AsyncRPCView, normalize_perms
 
 __all__ = ['api', 'program', 'js', 'html']
+# Options that restrict who can call a function
+SECURITY_OPTIONS = frozenset(['login_required', 'perms_required',
+                              'perm_required'])
 
 
 def decorator(decorator_func):
@@ -146,15 +156,103 @@ def decorator(decorator_func):
 def make_view(view_cls, func, **kwargs):
     """
     Decorate view function from view class and regular Python function.
+
+    Coroutine and async generator functions are served by
+    :class:`AsyncRPCView` instead of the default RPCView. If register=True,
+    the function is also registered in the
+    :class:`bricks.rpc.dispatch.BricksRPCDispatchView` registry.
+    """
+
+    register = kwargs.pop('register', False)
+    if kwargs.get('background'):
+        register_job_status()
+    coroutine = asyncio.iscoroutinefunction(func)
+    if view_cls is RPCView and (coroutine or inspect.isasyncgenfunction(func)):
+        view_cls = AsyncRPCView
+
+    # Permissions are normalized once instead of on each request
+    if 'perm_required' in kwargs:
+        kwargs['perms_required'] = kwargs.pop('perm_required')
+    if 'perms_required' in kwargs:
+        kwargs['perms_required'] = normalize_perms(kwargs['perms_required'])
+
+    # Signature is compiled once
+    kwargs.setdefault('binder', get_binder(
+        func, kwargs.get('request_argument', True)))
+
+    # Result cache and concurrency limiter are shared by all view instances
+    _make_result_cache(func, kwargs)
+    _make_limiter(func, kwargs)
+
+    func.as_view = _make_as_view(view_cls, func, kwargs, register)
+    if register:
+        bricks_register(view_cls, func, **kwargs)
+    return func
+
+
+def _make_as_view(view_cls, func, kwargs, registered):
+    """
+    Return the as_view() method attached to decorated functions.
     """
 
     def as_view(**initkwargs):
+        if registered:
+            _check_view_options(func, initkwargs)
         initkwargs.update(kwargs)
         view = view_cls.as_view(function=func, **initkwargs)
         return view
 
-    func.as_view = as_view
-    return func
+    return as_view
+
+
+def _check_view_options(func, initkwargs):
+    """
+    Reject security options given to the as_view() method of a registered
+    function, since they would not protect calls made with the dispatcher.
+    """
+
+    options = SECURITY_OPTIONS.intersection(initkwargs)
+    if options:
+        raise TypeError(
+            '%s is registered in the dispatcher: pass %s to the decorator '
+            'instead of as_view()' % (func.__qualname__,
+                                      ', '.join(sorted(options))))
+
+
+def _make_result_cache(func, kwargs):
+    """
+    Create the result cache from the cache options in kwargs.
+    """
+
+    cache = kwargs.pop('cache', None)
+    cache_options = {
+        'ttl': kwargs.pop('ttl', None),
+        'vary_on_user': kwargs.get('vary_on_user', False),
+        'maxsize': kwargs.pop('cache_size', 1024),
+        'binder': kwargs['binder'],
+    }
+    if cache:
+        name = kwargs.get('name') or \
+            '%s.%s' % (func.__module__, func.__qualname__)
+        kwargs['result_cache'] = func.cache = \
+            make_result_cache(name, cache, **cache_options)
+
+
+def _make_limiter(func, kwargs):
+    """
+    Create the concurrency limiter from the limiter options in kwargs.
+    """
+
+    max_concurrency = kwargs.pop('max_concurrency', None)
+    limiter_options = {
+        'max_queue': kwargs.pop('max_queue', 0),
+        'timeout': kwargs.pop('queue_timeout', 10.0),
+        'retry_after': kwargs.pop('retry_after', 1.0),
+    }
+    if max_concurrency is not None:
+        name = kwargs.get('name') or func.__name__
+        kwargs['limiter'] = func.limiter = \
+            ConcurrencyLimiter(max_concurrency, name=name, **limiter_options)
 
 
 @decorator
@@ -203,13 +301,78 @@ def api(func, pattern=None, **kwargs):
             "app-label.func-name" convention, in which the "app-label"
             corresponds to the root level of the module path in which the
             function was defined and "func-name" is the Python function name.
-            In both strings, underscores are replaced by dashes.
+            In both strings, underscores are replaced by dashes. This is the
+            JSON-RPC "method" used to call the function through
+            :class:`bricks.rpc.dispatch.BricksRPCDispatchView`.
+        register:
+            If True, the function is also registered in the dispatcher and
+            can be called by name from
+            :class:`bricks.rpc.dispatch.BricksRPCDispatchView` and
+            :class:`bricks.rpc.websocket.WebSocketRPC`. Registered functions
+            must receive login_required and perms_required in the decorator,
+            since options given to ``func.as_view()`` do not apply to the
+            dispatcher.
         login_required:
             If True (default is False), the API will only work if the user is
             logged-in.
-        perm_required:
+        perms_required (or perm_required):
             A list of required permissions that a logged in user must have in
-            order to access the API.
+            order to access the API. Permission checks are memoized for the
+            duration of each request.
+        cache:
+            Memoize results of pure functions. It can be True, for an
+            in-process LRU cache, the alias of a Django cache backend or a
+            :class:`bricks.rpc.cache.ResultCache` instance. The cache is
+            available as ``func.cache`` and can be used to invalidate results
+            (e.g., ``func.cache.invalidate(*args, **kwargs)``) or to inspect
+            hit/miss statistics with ``func.cache.stats()``.
+        ttl:
+            Time to live of cached results (in seconds).
+        vary_on_user:
+            If True, results are cached separately for each user and calls
+            from different users are never coalesced.
+        cache_size:
+            Maximum number of entries in the in-process LRU cache.
+        coalesce:
+            If True, identical concurrent calls wait for the first one and
+            share its result instead of executing the function again. This
+            protects expensive functions from bursts of identical requests.
+        max_concurrency:
+            Maximum number of simultaneous executions of the function. Calls
+            over capacity fail with a JSON-RPC error (code -32001) with a
+            "retry_after" hint. The limiter is available as
+            ``func.limiter``.
+        max_queue:
+            Number of calls that may wait for a free slot when
+            max_concurrency is reached (default 0).
+        queue_timeout:
+            Maximum time (in seconds) a call waits in the queue.
+        retry_after:
+            Number of seconds clients are advised to wait before retrying.
+        background:
+            If True, the function is executed in a background thread pool
+            and the call immediately returns a job description such as
+            ``{"id": "<job id>", "status": "pending"}``. Clients poll the
+            "bricks.job-status" API for the result (see
+            :mod:`bricks.rpc.jobs`).
+        http_get:
+            If True, the function also accepts GET requests with parameters
+            in the query string, e.g., ``/fib-func/?n=5`` or
+            ``/fib-func/?params=[5]``. Only use it for functions without
+            side effects.
+        max_age:
+            Number of seconds browsers and proxies may cache GET responses.
+        etag:
+            If True, GET responses carry an ETag computed from the result and
+            conditional requests are answered with 304 Not Modified.
+        public:
+            If True, GET responses may be stored by shared caches, e.g.,
+            ``@api(http_get=True, public=True)``. Responses are private by
+            default and responses that depend on the user are always
+            private.
+
+    Functions that return generators (or async generators) stream their items
+    to the client as they are produced (see :mod:`bricks.rpc.streaming`).
     """
 
     return make_view(RPCView, func, **kwargs)
@@ -258,6 +421,10 @@ def route(pattern, *, name=None, method='program', **kwargs):
     """
     Uses Wagtail's RouterPage route decorator and marks the method as a bricks
     API.
+
+    The view is created only once, when the method is decorated. The page
+    instance is attached to each request and passed to the method as its
+    first argument (see :func:`page_method`).
     """
 
     from wagtail.contrib.wagtailroutablepage.models import route
@@ -269,22 +436,24 @@ def route(pattern, *, name=None, method='program', **kwargs):
         'html': html,
         'js': js,
     }[method]
-    bricks_kwargs = kwargs
+    bricks_kwargs = dict(kwargs)
+    request_argument = bricks_kwargs.pop('request_argument', True)
 
     # We create a wrapped method that is decorated with the @route decorator
     # from wagtailroutablepage.
     #
-    # Inside the wrapped method, we choose some specific bricks decorator
-    # and apply the correct bricks decorator, instantiate the view and call
-    # it with the proper request.
+    # The bricks view is built once for the decorated method. Inside the
+    # wrapped method, we just store the page in the request and call the
+    # view.
     def decorator(func):
+        bricks_function = bricks_decorator(register=False, **bricks_kwargs)(
+            page_method(func, request_argument))
+        bricks_view = bricks_function.as_view()
+
         @route(pattern, name=name)
         def wrapped_method(self, request, *args, **kwargs):
-            bind_method = partial(func, self)
-            bricks_function = bricks_decorator(**bricks_kwargs)(bind_method)
-            bricks_view = bricks_function.as_view()
-            response = bricks_view(request, *args, **kwargs)
-            return response
+            request._bricks_page = self
+            return bricks_view(request, *args, **kwargs)
 
         func.__dict__.update(wrapped_method.__dict__)
         return func
@@ -292,45 +461,94 @@ def route(pattern, *, name=None, method='program', **kwargs):
     return decorator
 
 
-def bricks_register(view_cls, *args, name=None, register=True, **kwargs):
+def page_method(func, request_argument=True):
     """
-    Worker function for api and program callbacks.
+    Return a function that receives the client object and calls the method
+    func of the page stored in the request by :func:`route`.
+
+    The returned function has the signature of func without the page
+    argument, so parameters are still validated by the signature binder.
+    If request_argument is False, the client is not passed to func.
     """
 
-    # Decorator form
-    if not args or isinstance(args[0], str):
-        if args:
-            name, *args = args
+    def bind(client, args):
+        page = client.request._bricks_page
+        if request_argument:
+            return (page, client) + args
+        return (page,) + args
 
-        def decorator(func):
-            bricks_register(view_cls, func, *args, name=name)
-            return func
-        return decorator
+    method = wraps(func)(_page_method_wrapper(func, bind))
+    method.__signature__ = _page_method_signature(func, request_argument)
+    return method
+
+
+def _page_method_wrapper(func, bind):
+    # Return a function of the same kind as func (coroutine, generator,
+    # etc.) that calls func with the arguments returned by bind.
+    if inspect.isasyncgenfunction(func):
+        return _page_asyncgen_wrapper(func, bind)
+    elif asyncio.iscoroutinefunction(func):
+        return _page_coroutine_wrapper(func, bind)
+    elif inspect.isgeneratorfunction(func):
+        return _page_generator_wrapper(func, bind)
+
+    def method(client, *args, **kwargs):
+        return func(*bind(client, args), **kwargs)
+    return method
+
+
+def _page_asyncgen_wrapper(func, bind):
+    async def method(client, *args, **kwargs):
+        async for item in func(*bind(client, args), **kwargs):
+            yield item
+    return method
 
-    # Register RPCView
-    if len(args) == 2:
-        if name is None:
-            name, *args = args
-        else:
-            raise TypeError('function expect a single positional argument')
-    if len(args) != 1:
-        raise TypeError('invalid number of positional arguments')
 
-    # Compute the default name, if not given
-    func = args[0]
+def _page_coroutine_wrapper(func, bind):
+    async def method(client, *args, **kwargs):
+        return await func(*bind(client, args), **kwargs)
+    return method
+
+
+def _page_generator_wrapper(func, bind):
+    def method(client, *args, **kwargs):
+        return (yield from func(*bind(client, args), **kwargs))
+    return method
+
+
+def _page_method_signature(func, request_argument):
+    # Signature of func without the page argument. The client argument is
+    # always the first one, even if it is not passed to func.
+    signature = inspect.signature(func)
+    params = list(signature.parameters.values())[1:]
+    if not request_argument:
+        client = inspect.Parameter('__client',
+                                   inspect.Parameter.POSITIONAL_ONLY)
+        params.insert(0, client)
+    return signature.replace(parameters=params)
+
+
+def bricks_register(view_cls, func, name=None, **kwargs):
+    """
+    Create the RPCView instance that handles calls to func and register it
+    in the dispatcher registry.
+
+    Handlers are instantiated once and shared by all requests. Raises a
+    ValueError if another function is registered with the same name.
+    """
 
     if name is None:
-        func_name = func.__qualname__
-        mod_name = func.__module__
-        name = ('%s.%s' % (func_name, mod_name)).replace('_', '-')
+        name = default_name(func)
+    handler = view_cls(function=func, name=name, **kwargs)
+    return register_handler(name, handler)
 
-    # Create view and register
-    view = view_cls.as_view(func, name=name, **kwargs)
 
-    if register:
-        if name in __bricks_registry__:
-            raise ValueError('api %r already exists' % name)
-        __bricks_registry__[name] = view
-    return view
+def register_job_status():
+    """
+    Register the "bricks.job-status" API used to poll background jobs.
+
+    This is done the first time a function is declared with background=True.
+    """
 
-__bricks_registry__ = {}
+    if not hasattr(job_status, 'as_view'):
+        api(job_status, name='bricks.job-status', register=True)
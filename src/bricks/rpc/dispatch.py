@@ -0,0 +1,121 @@
+"""
+A single JSON-RPC end point that serves all registered functions.
+
+Functions decorated with ``register=True`` (e.g.,
+``@api(register=True)``) are registered by name in a global registry.
+:class:`BricksRPCDispatchView` routes each call to its handler with a
+dictionary lookup on the "method" field, so a whole site can expose its API
+from a single URL::
+
+    urlpatterns = [
+        url(r'^api/$', BricksRPCDispatchView.as_view()),
+    ]
+"""
+from logging import getLogger
+
+from .views import RPCView, AsyncRPCView, METHOD_NOT_FOUND
+
+log = getLogger('bricks.rpc')
+
+#: Mapping from method names to pre-instantiated RPCView handlers.
+__bricks_registry__ = {}
+
+
+def default_name(func):
+    """
+    Return the default method name for a function.
+
+    Names follow the "app-label.func-name" convention, in which "app-label" is
+    the root of the module path and underscores are replaced by dashes.
+    """
+
+    app_label = func.__module__.partition('.')[0]
+    return ('%s.%s' % (app_label, func.__name__)).replace('_', '-')
+
+
+def register_handler(name, handler, registry=None):
+    """
+    Register an RPCView instance under the given method name.
+
+    Registering a different function under a name that is already taken
+    raises a ValueError. Functions with the same module and qualified name
+    simply replace the old handler (this happens when modules are reloaded).
+    """
+
+    registry = __bricks_registry__ if registry is None else registry
+    try:
+        old = registry[name]
+    except KeyError:
+        pass
+    else:
+        if _qualname(old.function) != _qualname(handler.function):
+            raise ValueError('api %r already exists' % name)
+    registry[name] = handler
+    return handler
+
+
+def _qualname(func):
+    return (getattr(func, '__module__', None),
+            getattr(func, '__qualname__', None))
+
+
+class BricksRPCDispatchView(RPCView):
+    """
+    Serve all registered functions from a single end point.
+
+    Calls are routed by their "method" field to handlers that are created
+    once, when functions are registered. Each call is checked against the
+    credentials of its own handler and a batch request may freely mix calls
+    to different functions.
+
+    Options that control how the request is parsed and how the response is
+    encoded (e.g., lazy_decode, table_threshold, max_batch_size,
+    concurrent_batch) are taken from the dispatcher and not from the
+    handlers.
+
+    Args:
+        registry:
+            A mapping from method names to RPCView instances. Defaults to
+            the global registry of decorated functions.
+    """
+
+    registry = None
+
+    def __init__(self, registry=None, **kwds):
+        super().__init__(function=None, **kwds)
+        if registry is not None:
+            self.registry = registry
+
+    def get_handler(self, method):
+        """
+        Return the handler for the given method name or None.
+        """
+
+        registry = self.registry
+        if registry is None:
+            registry = __bricks_registry__
+        if not isinstance(method, str):
+            return None
+        return registry.get(method)
+
+    def check_credentials(self, request):
+        # Credentials are checked for each call by its handler
+        pass
+
+    def execute(self, request, data):
+        method = data.get('method')
+        handler = self.get_handler(method)
+        if handler is None:
+            log.info('method not found at %s: %r' % (request.path, method))
+            return self.error_response(data.get('id'), METHOD_NOT_FOUND,
+                                       'method not found: %s' % method)
+
+        metrics = getattr(request, '_bricks_metrics', None)
+        if metrics is not None and not metrics.batch:
+            metrics.name = handler.get_metrics_name()
+
+        handler.check_credentials(request)
+        if isinstance(handler, AsyncRPCView):
+            from asgiref.sync import async_to_sync
+            return async_to_sync(handler.execute)(request, data)
+        return handler.execute(request, data)
@@ -0,0 +1,134 @@
+"""
+Shared thread pools used to run RPC functions outside the request thread.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_PENDING_NOTIFICATIONS = 1000
+_executors = {}
+_notification_submitter = None
+_lock = threading.Lock()
+
+
+def get_executor(name='default', max_workers=None):
+    """
+    Return the shared thread pool executor with the given name, creating it
+    if necessary.
+
+    The number of workers is taken from the BRICKS_RPC_MAX_WORKERS setting if
+    not given explicitly. It is only used when the executor is created.
+    """
+
+    try:
+        return _executors[name]
+    except KeyError:
+        pass
+
+    with _lock:
+        if name not in _executors:
+            if max_workers is None:
+                from django.conf import settings
+                max_workers = getattr(settings, 'BRICKS_RPC_MAX_WORKERS',
+                                      DEFAULT_MAX_WORKERS)
+            prefix = 'bricks-%s' % name
+            _executors[name] = ThreadPoolExecutor(max_workers,
+                                                  thread_name_prefix=prefix)
+        return _executors[name]
+
+
+def shutdown_executors(wait=True):
+    """
+    Shutdown all shared executors.
+    """
+
+    global _notification_submitter
+
+    with _lock:
+        executors = list(_executors.values())
+        _executors.clear()
+        _notification_submitter = None
+    for executor in executors:
+        executor.shutdown(wait=wait)
+
+
+def closing_connections(func):
+    """
+    Decorate function that runs in a worker thread to release database
+    connections after each call, as Django does at the end of each request.
+    """
+
+    @wraps(func)
+    def decorated(*args, **kwargs):
+        from django.db import close_old_connections
+
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return decorated
+
+
+class BoundedSubmitter:
+    """
+    Submit tasks to an executor keeping at most max_pending tasks queued or
+    running.
+
+    Args:
+        executor:
+            A concurrent.futures executor.
+        max_pending:
+            Maximum number of unfinished tasks.
+    """
+
+    def __init__(self, executor, max_pending):
+        self.executor = executor
+        self.max_pending = max_pending
+        self._semaphore = threading.BoundedSemaphore(max_pending)
+
+    def try_submit(self, func, *args):
+        """
+        Submit func(*args) and return a future or return None, without
+        blocking, if there are already max_pending unfinished tasks.
+        """
+
+        if not self._semaphore.acquire(blocking=False):
+            return None
+        try:
+            future = self.executor.submit(func, *args)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        self._semaphore.release()
+
+
+def get_notification_submitter():
+    """
+    Return the submitter used to execute JSON-RPC notifications in the
+    background.
+
+    The maximum number of pending notifications is taken from the
+    BRICKS_RPC_MAX_PENDING_NOTIFICATIONS setting.
+    """
+
+    global _notification_submitter
+
+    submitter = _notification_submitter
+    if submitter is None:
+        from django.conf import settings
+
+        max_pending = getattr(settings, 'BRICKS_RPC_MAX_PENDING_NOTIFICATIONS',
+                              DEFAULT_MAX_PENDING_NOTIFICATIONS)
+        executor = get_executor('notifications')
+        with _lock:
+            if _notification_submitter is None:
+                _notification_submitter = \
+                    BoundedSubmitter(executor, max_pending)
+            submitter = _notification_submitter
+    return submitter
@@ -0,0 +1,259 @@
+"""
+Background execution of long running RPC calls.
+
+Functions decorated with ``@api(background=True)`` do not block the web
+worker: each call is submitted to a shared thread pool and the client
+immediately receives a job description::
+
+    {"id": "<job id>", "status": "pending"}
+
+The client then polls the "bricks.job-status" API (see :func:`job_status`)
+until the job is done. Jobs are kept in a job store, which can be configured
+with the BRICKS_RPC_JOB_STORE setting (the dotted path of a :class:`JobStore`
+subclass). The default store keeps jobs in memory, hence clients must poll
+the same process that executed the job. Use :class:`CacheJobStore` for
+deployments with several processes.
+
+Other settings:
+
+BRICKS_RPC_JOB_WORKERS:
+    Number of threads in the job pool (defaults to BRICKS_RPC_MAX_WORKERS).
+BRICKS_RPC_JOB_TTL:
+    Number of seconds finished jobs are kept in the store (default 3600).
+"""
+import threading
+import time
+import uuid
+
+from .executors import get_executor
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+ERROR = 'error'
+
+#: Maximum time (in seconds) a status request may wait for a job.
+MAX_WAIT = 30
+
+
+class JobNotFound(LookupError):
+    """
+    Raised when a job does not exist or belongs to another user.
+    """
+
+
+class Job:
+    """
+    Status and result of a background call.
+    """
+
+    def __init__(self, name=None, user=None, id=None):
+        self.id = id or uuid.uuid4().hex
+        self.name = name
+        self.user_id = getattr(user, 'pk', None)
+        self.status = PENDING
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+
+    def __repr__(self):
+        return '<Job %s: %s>' % (self.id, self.status)
+
+    @property
+    def is_finished(self):
+        return self.status in (DONE, ERROR)
+
+    def start(self):
+        self.status = RUNNING
+
+    def finish(self, result):
+        self.result = result
+        self.finished = time.time()
+        self.status = DONE
+
+    def fail(self, error):
+        self.error = error
+        self.finished = time.time()
+        self.status = ERROR
+
+    def as_dict(self):
+        """
+        Return the job description sent to the client.
+        """
+
+        data = {'id': self.id, 'status': self.status}
+        if self.status == DONE:
+            data['result'] = self.result
+        elif self.status == ERROR:
+            data['error'] = self.error
+        return data
+
+
+class JobStore:
+    """
+    Base class for job stores.
+
+    Subclasses must implement save() and get().
+
+    Args:
+        ttl:
+            Number of seconds finished jobs are kept.
+    """
+
+    #: Polling interval used by the default implementation of wait().
+    poll_interval = 0.1
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+
+    def save(self, job):
+        """
+        Insert or update job.
+        """
+
+        raise NotImplementedError
+
+    def get(self, id):
+        """
+        Return the job with the given id or None.
+        """
+
+        raise NotImplementedError
+
+    def wait(self, id, timeout):
+        """
+        Wait up to timeout seconds for the job to finish and return it.
+
+        Return None if job does not exist.
+        """
+
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(id)
+            if job is None or job.is_finished or time.monotonic() >= deadline:
+                return job
+            time.sleep(self.poll_interval)
+
+
+class MemoryJobStore(JobStore):
+    """
+    Keeps jobs in a dictionary in the current process.
+    """
+
+    def __init__(self, ttl=3600):
+        super().__init__(ttl)
+        self._jobs = {}
+        self._cond = threading.Condition()
+
+    def save(self, job):
+        with self._cond:
+            self._purge()
+            self._jobs[job.id] = job
+            self._cond.notify_all()
+
+    def get(self, id):
+        with self._cond:
+            return self._jobs.get(id)
+
+    def wait(self, id, timeout):
+        def is_finished():
+            job = self._jobs.get(id)
+            return job is None or job.is_finished
+
+        with self._cond:
+            self._cond.wait_for(is_finished, timeout)
+            return self._jobs.get(id)
+
+    def _purge(self):
+        if self.ttl is None:
+            return
+        deadline = time.time() - self.ttl
+        expired = [job.id for job in self._jobs.values()
+                   if job.finished is not None and job.finished < deadline]
+        for id in expired:
+            del self._jobs[id]
+
+    def __len__(self):
+        return len(self._jobs)
+
+
+class CacheJobStore(JobStore):
+    """
+    Keeps jobs in a Django cache backend, so they can be shared between
+    processes.
+
+    Args:
+        alias:
+            Name of the cache in the CACHES setting.
+    """
+
+    def __init__(self, ttl=3600, alias='default'):
+        super().__init__(ttl)
+        self.alias = alias
+
+    @property
+    def backend(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def save(self, job):
+        timeout = self.ttl if job.is_finished else None
+        self.backend.set('bricks.rpc-job:%s' % job.id, job, timeout)
+
+    def get(self, id):
+        return self.backend.get('bricks.rpc-job:%s' % id)
+
+
+_store = None
+_lock = threading.Lock()
+
+
+def get_job_store():
+    """
+    Return the job store defined in the BRICKS_RPC_JOB_STORE setting.
+    """
+
+    global _store
+
+    if _store is None:
+        from django.conf import settings
+        from django.utils.module_loading import import_string
+
+        with _lock:
+            if _store is None:
+                path = getattr(settings, 'BRICKS_RPC_JOB_STORE',
+                               'bricks.rpc.jobs.MemoryJobStore')
+                ttl = getattr(settings, 'BRICKS_RPC_JOB_TTL', 3600)
+                _store = import_string(path)(ttl=ttl)
+    return _store
+
+
+def get_job_executor():
+    """
+    Return the thread pool that executes background jobs.
+    """
+
+    from django.conf import settings
+
+    max_workers = getattr(settings, 'BRICKS_RPC_JOB_WORKERS', None)
+    return get_executor('jobs', max_workers)
+
+
+def job_status(client, id, wait=0):
+    """
+    Return the description of a background job.
+
+    Finished jobs include their "result" or "error". If wait is given, the
+    call blocks up to wait seconds (at most MAX_WAIT) for the job to finish
+    (long polling).
+
+    Users can only query their own jobs.
+    """
+
+    store = get_job_store()
+    wait = min(max(wait, 0), MAX_WAIT)
+    job = store.wait(id, wait) if wait else store.get(id)
+    if job is None or job.user_id != getattr(client.user, 'pk', None):
+        raise JobNotFound('job not found: %s' % id)
+    return job.as_dict()
@@ -0,0 +1,283 @@
+"""
+Concurrency limits and load shedding for RPC functions.
+
+Each limiter accepts up to ``max_concurrency`` simultaneous executions and
+keeps at most ``max_queue`` calls waiting for a free slot. Calls that find the
+queue full, or that wait longer than the timeout, fail immediately with an
+:class:`OverloadedError`, which is sent to the client as a JSON-RPC error with
+a "retry_after" hint.
+
+A global limiter shared by all functions can be configured with the
+BRICKS_RPC_MAX_CONCURRENCY, BRICKS_RPC_MAX_QUEUE and BRICKS_RPC_QUEUE_TIMEOUT
+settings.
+"""
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+
+#: JSON-RPC error code for calls rejected by a limiter.
+SERVER_OVERLOADED = -32001
+
+_DEFAULT = object()
+
+
+class OverloadedError(Exception):
+    """
+    Raised when a call is rejected by a concurrency limiter.
+    """
+
+    code = SERVER_OVERLOADED
+
+    def __init__(self, message='server is overloaded', retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """
+    A semaphore with a bounded wait queue.
+
+    Args:
+        max_concurrency:
+            Maximum number of simultaneous executions.
+        max_queue:
+            Maximum number of calls waiting for a free slot. Zero means that
+            calls are rejected as soon as all slots are taken.
+        timeout:
+            Maximum time (in seconds) a call waits in the queue. None waits
+            indefinitely.
+        retry_after:
+            Number of seconds clients are advised to wait before retrying a
+            rejected call.
+        name:
+            Name used in error messages.
+    """
+
+    #: Maximum interval (in seconds) between polls in acquire_async().
+    poll_interval = 0.05
+
+    def __init__(self, max_concurrency, max_queue=0, timeout=10.0,
+                 retry_after=1.0, name=None):
+        if max_concurrency < 1:
+            raise ValueError('max_concurrency must be positive')
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.name = name
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._cond = threading.Condition()
+
+    def try_acquire(self):
+        """
+        Take a slot if one is free. Never blocks.
+        """
+
+        with self._cond:
+            if self.active < self.max_concurrency:
+                self.active += 1
+                return True
+            return False
+
+    def acquire(self, timeout=_DEFAULT):
+        """
+        Take a slot, waiting in the queue if necessary.
+
+        Return False if the queue is full or if the timeout expires.
+        """
+
+        timeout = self.timeout if timeout is _DEFAULT else timeout
+        with self._cond:
+            if self.active < self.max_concurrency:
+                self.active += 1
+                return True
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                return False
+
+            self.waiting += 1
+            try:
+                if not self._cond.wait_for(self._has_free_slot, timeout):
+                    self.rejected += 1
+                    return False
+                self.active += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    async def acquire_async(self, timeout=_DEFAULT):
+        """
+        Asynchronous version of :meth:`acquire`.
+
+        Coroutines never block the event loop: they poll for a free slot
+        while waiting in the queue.
+        """
+
+        if self.try_acquire():
+            return True
+
+        timeout = self.timeout if timeout is _DEFAULT else timeout
+        with self._cond:
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                return False
+            self.waiting += 1
+
+        try:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            delay = 0.001
+            while True:
+                await asyncio.sleep(delay)
+                if self.try_acquire():
+                    return True
+                if deadline is not None and time.monotonic() >= deadline:
+                    with self._cond:
+                        self.rejected += 1
+                    return False
+                delay = min(delay * 2, self.poll_interval)
+        finally:
+            with self._cond:
+                self.waiting -= 1
+
+    def release(self):
+        """
+        Release a slot taken by acquire().
+        """
+
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def overloaded(self):
+        """
+        Return the OverloadedError raised for rejected calls.
+        """
+
+        if self.name:
+            message = 'too many concurrent calls to %s' % self.name
+        else:
+            message = 'server is overloaded'
+        return OverloadedError(message, retry_after=self.retry_after)
+
+    def stats(self):
+        """
+        Return a dictionary with the number of active, waiting and rejected
+        calls.
+        """
+
+        with self._cond:
+            return {
+                'active': self.active,
+                'waiting': self.waiting,
+                'rejected': self.rejected,
+            }
+
+    def _has_free_slot(self):
+        return self.active < self.max_concurrency
+
+
+@contextmanager
+def limited(limiters):
+    """
+    Context manager that holds a slot in each limiter or raises
+    OverloadedError.
+    """
+
+    acquired = acquire_all(limiters)
+    try:
+        yield
+    finally:
+        release_all(acquired)
+
+
+def acquire_all(limiters):
+    """
+    Take a slot in each limiter and return the list of acquired limiters.
+
+    Raises OverloadedError if a limiter rejects the call. Callers must pass
+    the result to :func:`release_all` when the call finishes.
+    """
+
+    acquired = []
+    try:
+        for limiter in limiters:
+            if not limiter.acquire():
+                raise limiter.overloaded()
+            acquired.append(limiter)
+    except BaseException:
+        release_all(acquired)
+        raise
+    return acquired
+
+
+async def acquire_all_async(limiters):
+    """
+    Take a slot in each limiter and return the list of acquired limiters.
+
+    This is the asynchronous counterpart of :func:`acquire_all`. Callers
+    must pass the result to :func:`release_all` when the call finishes.
+    """
+
+    acquired = []
+    try:
+        for limiter in limiters:
+            if not await limiter.acquire_async():
+                raise limiter.overloaded()
+            acquired.append(limiter)
+    except BaseException:
+        release_all(acquired)
+        raise
+    return acquired
+
+
+def release_all(limiters):
+    """
+    Release slots taken by acquire_all() or acquire_all_async().
+    """
+
+    for limiter in reversed(limiters):
+        limiter.release()
+
+
+_global_limiter = _MISSING = object()
+_lock = threading.Lock()
+
+
+def get_global_limiter():
+    """
+    Return the limiter shared by all RPC functions or None if the
+    BRICKS_RPC_MAX_CONCURRENCY setting is not defined.
+    """
+
+    global _global_limiter
+
+    if _global_limiter is _MISSING:
+        from django.conf import settings
+
+        with _lock:
+            if _global_limiter is _MISSING:
+                _global_limiter = _make_global_limiter(settings)
+    return _global_limiter
+
+
+def _make_global_limiter(settings):
+    max_concurrency = getattr(settings, 'BRICKS_RPC_MAX_CONCURRENCY', None)
+    if max_concurrency is None:
+        return None
+    return ConcurrencyLimiter(
+        max_concurrency,
+        max_queue=getattr(settings, 'BRICKS_RPC_MAX_QUEUE', 0),
+        timeout=getattr(settings, 'BRICKS_RPC_QUEUE_TIMEOUT', 10.0),
+    )
+
+
+def reset_global_limiter():
+    """
+    Discard the global limiter so it is recreated from settings.
+    """
+
+    global _global_limiter
+    _global_limiter = _MISSING
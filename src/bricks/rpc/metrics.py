@@ -0,0 +1,299 @@
+"""
+Metrics for RPC views.
+
+Each request handled by an RPC view is measured by a :class:`RequestMetrics`
+object with the time spent in each phase of the request:
+
+decode:
+    Reading and decoding the JSON payload.
+credentials:
+    Checking user credentials.
+execute:
+    Calling the function (excluding js_compile).
+js_compile:
+    Compiling the client program sent back to the browser.
+encode:
+    Encoding the response to JSON.
+
+It also keeps the request and response sizes (in bytes) and the exception
+classes of all errors. When the request finishes, metrics are sent to the
+sink defined in the BRICKS_RPC_METRICS_SINK setting (a dotted path to a
+:class:`MetricsSink` subclass, or None to disable metrics). The default sink,
+:class:`PrometheusSink`, aggregates metrics in memory and renders them in the
+Prometheus text format with :func:`prometheus_view`::
+
+    urlpatterns = [
+        url(r'^metrics/$', prometheus_view),
+    ]
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+_MISSING = object()
+
+
+class RequestMetrics:
+    """
+    Metrics collected during a single request.
+    """
+
+    __slots__ = ('name', 'batch', 'timings', 'request_size', 'response_size',
+                 'errors')
+
+    def __init__(self, name, request_size=0):
+        self.name = name
+        self.batch = False
+        self.timings = {}
+        self.request_size = request_size
+        self.response_size = 0
+        self.errors = []
+
+    @contextmanager
+    def phase(self, phase):
+        """
+        Context manager that measures the time spent in the given phase.
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+
+    def add_time(self, phase, seconds):
+        self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+    def error(self, ex):
+        """
+        Register an exception raised during the request.
+        """
+
+        cls = type(ex)
+        self.errors.append('%s.%s' % (cls.__module__, cls.__name__))
+
+    def finish(self):
+        """
+        Prepare metrics for recording: the time spent in js_compile is
+        removed from the execute phase.
+        """
+
+        timings = self.timings
+        if 'js_compile' in timings and 'execute' in timings:
+            timings['execute'] = max(
+                timings['execute'] - timings['js_compile'], 0.0)
+
+
+class MetricsSink:
+    """
+    Base class for objects that receive metrics from RPC views.
+    """
+
+    def record(self, metrics):
+        """
+        Record the :class:`RequestMetrics` of a finished request.
+        """
+
+        raise NotImplementedError
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class PrometheusSink(MetricsSink):
+    """
+    Aggregates metrics in memory as Prometheus histograms and counters.
+    """
+
+    #: Buckets (in seconds) for phase timings.
+    time_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                    0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    #: Buckets (in bytes) for request and response sizes.
+    size_buckets = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576,
+                    4194304)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """
+        Discard all collected metrics.
+        """
+
+        with self._lock:
+            self._phases = {}
+            self._request_sizes = {}
+            self._response_sizes = {}
+            self._requests = defaultdict(int)
+            self._errors = defaultdict(int)
+
+    def record(self, metrics):
+        name = metrics.name
+        with self._lock:
+            self._requests[name] += 1
+            for phase, seconds in metrics.timings.items():
+                self._histogram(self._phases, (name, phase),
+                                self.time_buckets).observe(seconds)
+            self._histogram(self._request_sizes, (name,),
+                            self.size_buckets).observe(metrics.request_size)
+            self._histogram(self._response_sizes, (name,),
+                            self.size_buckets).observe(metrics.response_size)
+            for error in metrics.errors:
+                self._errors[name, error] += 1
+
+    def requests(self, name):
+        """
+        Return the number of requests recorded for the given function.
+        """
+
+        return self._requests.get(name, 0)
+
+    def errors(self, name):
+        """
+        Return a dictionary mapping exception names to error counts for the
+        given function.
+        """
+
+        with self._lock:
+            return {error: n for (func, error), n in self._errors.items()
+                    if func == name}
+
+    def render(self):
+        """
+        Return metrics in the Prometheus text exposition format.
+        """
+
+        lines = []
+        with self._lock:
+            _render_counter(
+                lines, 'bricks_rpc_requests_total',
+                'Number of RPC requests.',
+                {(name,): n for name, n in self._requests.items()},
+                ('function',))
+            _render_counter(
+                lines, 'bricks_rpc_errors_total',
+                'Number of errors by exception class.',
+                self._errors, ('function', 'exception'))
+            _render_histograms(
+                lines, 'bricks_rpc_phase_seconds',
+                'Time spent in each phase of RPC requests.',
+                self._phases, ('function', 'phase'))
+            _render_histograms(
+                lines, 'bricks_rpc_request_bytes',
+                'Size of RPC request bodies.',
+                self._request_sizes, ('function',))
+            _render_histograms(
+                lines, 'bricks_rpc_response_bytes',
+                'Size of RPC response bodies.',
+                self._response_sizes, ('function',))
+        return '\n'.join(lines) + '\n'
+
+    def _histogram(self, histograms, key, buckets):
+        try:
+            return histograms[key]
+        except KeyError:
+            histograms[key] = histogram = _Histogram(buckets)
+            return histogram
+
+
+def _labels(names, values, extra=''):
+    items = ['%s="%s"' % (k, _escape(v)) for k, v in zip(names, values)]
+    if extra:
+        items.append(extra)
+    return '{%s}' % ','.join(items)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"') \
+        .replace('\n', r'\n')
+
+
+def _render_counter(lines, metric, help, counts, label_names):
+    lines.append('# HELP %s %s' % (metric, help))
+    lines.append('# TYPE %s counter' % metric)
+    for key, n in sorted(counts.items()):
+        lines.append('%s%s %s' % (metric, _labels(label_names, key), n))
+
+
+def _render_histograms(lines, metric, help, histograms, label_names):
+    lines.append('# HELP %s %s' % (metric, help))
+    lines.append('# TYPE %s histogram' % metric)
+    for key, hist in sorted(histograms.items()):
+        cumulative = 0
+        for bound, n in zip(hist.buckets, hist.counts):
+            cumulative += n
+            le = 'le="%s"' % bound
+            lines.append('%s_bucket%s %s' % (
+                metric, _labels(label_names, key, le), cumulative))
+        lines.append('%s_bucket%s %s' % (
+            metric, _labels(label_names, key, 'le="+Inf"'), hist.count))
+        lines.append('%s_sum%s %r' % (
+            metric, _labels(label_names, key), hist.sum))
+        lines.append('%s_count%s %s' % (
+            metric, _labels(label_names, key), hist.count))
+
+
+_sink = _MISSING
+_lock = threading.Lock()
+
+
+def get_metrics_sink():
+    """
+    Return the sink defined in the BRICKS_RPC_METRICS_SINK setting or None if
+    metrics are disabled.
+    """
+
+    global _sink
+
+    if _sink is _MISSING:
+        from django.conf import settings
+        from django.utils.module_loading import import_string
+
+        with _lock:
+            if _sink is _MISSING:
+                path = getattr(settings, 'BRICKS_RPC_METRICS_SINK',
+                               'bricks.rpc.metrics.PrometheusSink')
+                _sink = None if path is None else import_string(path)()
+    return _sink
+
+
+def reset_metrics_sink():
+    """
+    Discard the current sink so it is recreated from settings.
+    """
+
+    global _sink
+    _sink = _MISSING
+
+
+def prometheus_view(request):
+    """
+    Django view that renders the metrics collected by the default sink in the
+    Prometheus text format.
+    """
+
+    from django import http
+
+    sink = get_metrics_sink()
+    if not isinstance(sink, PrometheusSink):
+        raise http.Http404('Prometheus metrics are not enabled')
+    return http.HttpResponse(sink.render(),
+                             content_type='text/plain; version=0.0.4')
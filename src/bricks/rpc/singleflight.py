@@ -0,0 +1,132 @@
+"""
+Coalescing of identical concurrent calls.
+
+While a call with a given key is in flight, other calls with the same key wait
+for it to finish and share its result (or exception) instead of executing the
+function again.
+"""
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+    def get(self):
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """
+    A group of in-flight calls indexed by key.
+
+    Works both with threads (:meth:`call`) and with asyncio (:meth:`acall`).
+    Calls made from threads and from coroutines are coalesced separately.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._futures = {}
+
+    def call(self, key, func, *args, share=None):
+        """
+        Return func(*args), unless another thread is already executing a call
+        with the same key. In that case, wait for it and return its result.
+
+        If given, share(result) tells if the result of the call can be
+        returned to the waiting calls. Waiting calls that cannot share the
+        result execute func(*args) themselves.
+        """
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+        if not leader:
+            call.event.wait()
+            result = call.get()
+            if share is not None and not share(result):
+                return func(*args)
+            return result
+
+        try:
+            call.result = func(*args)
+        except BaseException as ex:
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    async def acall(self, key, func, *args, share=None):
+        """
+        Asynchronous version of :meth:`call`. The coroutine function func is
+        awaited only once for all concurrent calls with the same key in the
+        current event loop.
+
+        If the executing call is cancelled (e.g., its client disconnected),
+        one of the waiting calls takes its place and awaits func instead.
+        """
+
+        loop = asyncio.get_event_loop()
+        full_key = (loop, key)
+        while True:
+            future = self._futures.get(full_key)
+            if future is None:
+                return await self._alead(full_key, func, args)
+            try:
+                result = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    continue  # The leader was cancelled, elect a new one
+                raise
+            if share is not None and not share(result):
+                return await func(*args)
+            return result
+
+    async def _alead(self, full_key, func, args):
+        # Execute the call for all waiters of the key
+        future = self._futures[full_key] = full_key[0].create_future()
+        try:
+            result = await func(*args)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as ex:
+            future.set_exception(ex)
+            future.exception()  # avoid "exception never retrieved" warnings
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._futures[full_key]
+
+    def in_flight(self, key):
+        """
+        Return the number of calls currently waiting for the given key,
+        including the one that is executing. Calls made from coroutines are
+        not counted.
+        """
+
+        with self._lock:
+            call = self._calls.get(key)
+            return 0 if call is None else call.waiters + 1
+
+
+#: Group shared by all RPC views.
+default_group = SingleFlight()
@@ -0,0 +1,234 @@
+"""
+Streaming of generator results.
+
+Functions that return generators or async generators are not sent as a single
+JSON-RPC response. Instead, the response is a stream of newline delimited
+JSON objects (NDJSON). Each item produced by the generator is sent as soon as
+it is available as a partial result::
+
+    {"jsonrpc": "2.0", "id": 1, "partial": <item>}
+
+The last line is a regular JSON-RPC response. Its "result" is the value
+returned by the generator (or null) and it carries any program generated by
+the client object during iteration. Errors raised while iterating are sent in
+the "error" field of the last line, since the HTTP status was already sent.
+
+In bricks.js, these functions are consumed with ``bricks.stream()``, which
+returns an async iterator over the partial results.
+
+Resources held by the call (e.g., slots of concurrency limiters) are released
+when the stream is exhausted or closed, not when the function returns the
+generator.
+"""
+import asyncio
+import inspect
+import weakref
+
+from bricks.json import dumps
+
+#: Content type of streamed responses.
+CONTENT_TYPE = 'application/x-ndjson'
+
+
+def is_stream(obj):
+    """
+    Return True if obj is a result that must be streamed.
+    """
+
+    return inspect.isgenerator(obj) or inspect.isasyncgen(obj)
+
+
+def is_stream_function(func):
+    """
+    Return True if func is a generator or async generator function.
+    """
+
+    return inspect.isgeneratorfunction(func) or \
+        inspect.isasyncgenfunction(func)
+
+
+class Stream:
+    """
+    Wraps a generator returned by an RPC function.
+
+    Args:
+        view:
+            The RPCView instance that executed the call.
+        client:
+            The Client object passed to the function.
+        iterator:
+            A generator or async generator.
+    """
+
+    def __init__(self, view, client, iterator):
+        self.view = view
+        self.client = client
+        self.iterator = iterator
+        self._finalizers = []
+
+    @property
+    def is_async(self):
+        return inspect.isasyncgen(self.iterator)
+
+    def add_finalizer(self, func, *args):
+        """
+        Call func(*args) when the stream is closed.
+
+        Streams are closed when the generator is exhausted, fails or is
+        closed by the consumer. Streams that are discarded without being
+        consumed are closed when they are garbage collected.
+        """
+
+        self._finalizers.append(weakref.finalize(self, func, *args))
+
+    def close(self):
+        """
+        Run the finalizers of the stream. Calling close() more than once has
+        no effect.
+        """
+
+        finalizers, self._finalizers = self._finalizers, []
+        for finalizer in finalizers:
+            finalizer()
+
+    def lines(self, id=None):
+        """
+        Iterate over the NDJSON lines of the response. Async generators are
+        consumed in the current thread with a private event loop.
+        """
+
+        if self.is_async:
+            yield from _sync_iter(self.alines(id))
+            return
+
+        try:
+            yield from self._lines(id)
+        finally:
+            self.iterator.close()
+            self.close()
+
+    def _lines(self, id):
+        result = None
+        try:
+            while True:
+                try:
+                    item = next(self.iterator)
+                except StopIteration as ex:
+                    result = ex.value
+                    break
+                yield self.encode_line({'partial': item}, id)
+        except Exception as ex:
+            yield self.error_line(ex, id)
+        else:
+            yield self.result_line(result, id)
+
+    async def alines(self, id=None):
+        """
+        Asynchronous version of :meth:`lines`. Regular generators are
+        advanced in the shared thread pool, so a slow generator does not
+        block the event loop.
+        """
+
+        if not self.is_async:
+            async for line in _async_iter(self.lines(id)):
+                yield line
+            return
+
+        try:
+            async for item in self.iterator:
+                yield self.encode_line({'partial': item}, id)
+        except Exception as ex:
+            yield self.error_line(ex, id)
+        else:
+            yield self.result_line(None, id)
+        finally:
+            await self.iterator.aclose()
+            self.close()
+
+    def materialize(self):
+        """
+        Consume the generator and return a list with all items.
+
+        This is used when streaming is not possible, e.g., in batch requests.
+        """
+
+        if self.is_async:
+            from asgiref.sync import async_to_sync
+            return async_to_sync(self.amaterialize)()
+        try:
+            items = list(self.iterator)
+        finally:
+            self.close()
+        return self.view.wrap_result(self.client, items)
+
+    async def amaterialize(self):
+        """
+        Asynchronous version of :meth:`materialize`.
+        """
+
+        if not self.is_async:
+            return await self.view.run_in_executor(self.materialize)
+        try:
+            items = [item async for item in self.iterator]
+        finally:
+            self.close()
+        return self.view.wrap_result(self.client, items)
+
+    def encode_line(self, data, id):
+        response = {'jsonrpc': '2.0'}
+        if id is not None:
+            response['id'] = id
+        response.update(data)
+        return dumps(response, tables=self.view.table_threshold) + '\n'
+
+    def result_line(self, result, id):
+        result = self.view.wrap_result(self.client, result)
+        return self.encode_line({'result': result}, id)
+
+    def error_line(self, ex, id):
+        error = self.view.wrap_error(ex, ex.__traceback__,
+                                     wrap_permission_errors=True)
+        return self.encode_line({'error': error}, id)
+
+
+def _sync_iter(async_iterator):
+    # A private event loop is used for the whole iteration: async generators
+    # are finalized when the loop that first iterated them is closed.
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(async_iterator.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+async def _async_iter(iterator):
+    # Regular generators run in a dedicated thread, so database connections
+    # (and server-side cursors) are kept for the whole iteration and closed
+    # when it finishes, as Django does at the end of a request.
+    from concurrent.futures import ThreadPoolExecutor
+    from django.db import close_old_connections
+
+    def finish():
+        try:
+            iterator.close()
+        finally:
+            close_old_connections()
+
+    sentinel = object()
+    loop = asyncio.get_event_loop()
+    executor = ThreadPoolExecutor(1)
+    try:
+        while True:
+            item = await loop.run_in_executor(executor, next, iterator,
+                                              sentinel)
+            if item is sentinel:
+                break
+            yield item
+    finally:
+        await loop.run_in_executor(executor, finish)
+        executor.shutdown(wait=False)
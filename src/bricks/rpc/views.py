@@ -1,18 +1,48 @@
+import asyncio
+import inspect
 import io
+import time
 import traceback
 from logging import getLogger
 
 import sys
 from django import http
+from django.utils.cache import (patch_cache_control, patch_vary_headers,
+                                add_never_cache_headers)
 from django.utils.html import escape
+from django.utils.http import parse_etags
 from django.views.generic import View
 from lazyutils import lazy
 
 from bricks.js.client import Client, js_compile
-from bricks.json import loads, dumps, register
+from bricks.json import loads, dumps, register, digest, LazySequence
+from .binding import InvalidParams, get_binder
+from .executors import (get_executor, get_notification_submitter,
+                        closing_connections)
+from .jobs import Job, get_job_store, get_job_executor
+from .metrics import RequestMetrics, get_metrics_sink
+from .limits import (OverloadedError, get_global_limiter, acquire_all,
+                     acquire_all_async, release_all)
+from .singleflight import default_group
+from .streaming import Stream, is_stream, is_stream_function
+from . import streaming
 
 log = getLogger('bricks.rpc')
 
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+SERVER_ERROR = -32000
+
+#: Default value of the BRICKS_RPC_MAX_BODY_SIZE setting (in bytes).
+DEFAULT_MAX_BODY_SIZE = 2621440
+
+_MISSING = object()
+_pending_notifications = set()
+
 
 class BadResponseError(Exception):
     """
@@ -21,7 +51,7 @@ class BadResponseError(Exception):
     """
 
     def __init__(self, *args, **kwds):
-        super().__init__(args)
+        super().__init__(*args)
         for (k, v) in kwds.items():
             setattr(self, k, v)
 
@@ -53,6 +83,91 @@ class RPCView(View):
         perms_required:
             The list of permissions a user can use in order gain access to the
             API. A non-empty list implies login_required.
+        table_threshold:
+            If given, results that are lists with at least this number of
+            dictionaries with the same keys are sent in the columnar "table"
+            format (see :class:`bricks.json.Table`).
+        lazy_decode:
+            If True, arguments that are lists or dictionaries are passed to
+            the function as read-only proxies that are only decoded when
+            accessed (see :func:`bricks.json.decode`).
+        concurrent_batch:
+            If True, calls in a batch request are executed concurrently in a
+            shared thread pool (see the BRICKS_RPC_MAX_WORKERS setting).
+            Functions must be thread-safe.
+        max_batch_size:
+            Maximum number of calls accepted in a single batch request.
+        result_cache:
+            A :class:`bricks.rpc.cache.ResultCache` instance used to memoize
+            the results of the function. Only successful results are cached;
+            generators and results that send instructions to the client are
+            never cached.
+        coalesce:
+            If True, identical calls (same function and parameters) that
+            arrive while a previous call is still executing wait for it and
+            share its result or error instead of calling the function again.
+            Generator functions are never coalesced and calls that send
+            instructions to the client do not share their results. Calls
+            from different users are not coalesced if the function requires
+            login or permissions.
+        vary_on_user:
+            If True, calls from different users are never coalesced.
+        limiter:
+            A :class:`bricks.rpc.limits.ConcurrencyLimiter` that caps the
+            number of concurrent executions of the function. Calls are also
+            subject to the global limiter defined by the
+            BRICKS_RPC_MAX_CONCURRENCY setting.
+        background:
+            If True, calls are executed in a background thread pool and the
+            client immediately receives a job description with the job id
+            (see :mod:`bricks.rpc.jobs`).
+        job_store:
+            The :class:`bricks.rpc.jobs.JobStore` used for background jobs.
+            Defaults to the store defined in the BRICKS_RPC_JOB_STORE
+            setting.
+        validate_params:
+            If True (default), parameters are checked against the function
+            signature (and coerced according to its annotations) before the
+            call. Invalid calls receive a JSON-RPC -32602 error (see
+            :mod:`bricks.rpc.binding`).
+        binder:
+            A precompiled :class:`bricks.rpc.binding.Binder` for the
+            function. It is created on demand if not given.
+        max_body_size:
+            Maximum size (in bytes) of request bodies. Larger requests are
+            rejected with a 413 response before the body is read. Defaults
+            to the BRICKS_RPC_MAX_BODY_SIZE setting (2.5MB).
+        body_chunk_size:
+            Bodies larger than this are read in chunks of this size, checking
+            the size limit as data arrives (a bounded chunked read). The body
+            is still fully buffered before it is decoded.
+        defer_notifications:
+            Notifications (calls without an id) never produce a response: a
+            single notification is answered with 204 No Content and they are
+            omitted from batch responses. By default they are executed
+            before the response is sent. If True, they are executed in a
+            background thread pool after the request is answered instead.
+            At most BRICKS_RPC_MAX_PENDING_NOTIFICATIONS notifications are
+            queued: when the queue is full, notifications are executed
+            inline. Functions must not depend on the request after it is
+            answered.
+        http_get:
+            If True, the function can also be called with GET requests,
+            which can be cached by browsers and proxies. Parameters are
+            taken from the query string: either a JSON-encoded "params"
+            field or one field per argument (values are strings and are
+            coerced according to the function annotations).
+        max_age:
+            Number of seconds GET responses can be cached (sets the max-age
+            directive of the Cache-Control header).
+        etag:
+            If True, GET responses carry an ETag computed from the canonical
+            digest of the result, and requests with a matching
+            If-None-Match header receive a 304 response.
+        public:
+            If True, GET responses are marked as public and can be stored by
+            shared caches (proxies and CDNs). Responses are private by
+            default and are always private if they depend on the user.
     """
 
     # Class constants and attributes
@@ -68,6 +183,25 @@ class RPCView(View):
     perms_required = None
     request_argument = True
     name = None
+    table_threshold = None
+    lazy_decode = False
+    concurrent_batch = False
+    max_batch_size = 100
+    result_cache = None
+    coalesce = False
+    vary_on_user = False
+    limiter = None
+    background = False
+    job_store = None
+    validate_params = True
+    binder = None
+    max_body_size = None
+    body_chunk_size = 65536
+    defer_notifications = False
+    http_get = False
+    max_age = None
+    etag = False
+    public = False
 
     @lazy
     def DEBUG(self):
@@ -80,7 +214,7 @@ class RPCView(View):
         self.function = function
         self.action = action
         self.login_required = login_required
-        self.perms_required = perms_required
+        self.perms_required = normalize_perms(perms_required)
         self.request_argument = request_argument
         super().__init__(**kwds)
 
@@ -94,56 +228,447 @@ class RPCView(View):
         if mimetype not in self.valid_request_mimetypes:
             raise BadRequestError('invalid content/type: %r' % mimetype)
 
-        # Decode data
+        # Read and decode data. JSON is parsed directly from bytes.
+        data_bytes = self.read_body(request)
         try:
-            data_bytes = request.body
-            payload = loads(data_bytes.decode('utf8'))
+            payload = loads(data_bytes, lazy=self.lazy_decode)
         except Exception as ex:
-            log.info('invalid JSON request at %s: %s' % (request.url, ex))
+            log.info('invalid JSON request at %s: %s' % (request.path, ex))
             raise BadRequestError('invalid JSON')
 
+        # Batch requests are validated call by call
+        if isinstance(payload, (list, LazySequence)):
+            return self.get_batch(payload)
+
         # Check for JSON-RPC 2.0 header
-        if payload.get('jsonrpc', None) != '2.0':
+        if not self.is_valid_call(payload):
             raise BadRequestError('not a JSON-RPC 2.0 request')
 
         return payload
 
+    def get_batch(self, payload):
+        """
+        Return the list of calls of a batch request.
+        """
+
+        if not payload:
+            raise BadRequestError('empty batch request')
+        if len(payload) > self.max_batch_size:
+            raise BadRequestError('batch request is too large')
+        return list(payload)
+
+    def read_body(self, request):
+        """
+        Return the request body as a bytes-like object.
+
+        Raises BadResponseError with a 413 response if the body is larger
+        than max_body_size. The limit is checked against the Content-Length
+        header before reading and, for large bodies, with a bounded chunked
+        read that stops as soon as the limit is exceeded. The whole body is
+        still buffered, so peak memory is about twice its size while JSON is
+        parsed.
+        """
+
+        limit = self.get_max_body_size()
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            raise BadRequestError('invalid Content-Length header')
+        if limit is not None and length > limit:
+            raise self.body_too_large(limit)
+
+        # Small bodies (or bodies that were already read) use Django's
+        # cached request.body
+        if hasattr(request, '_body') or 0 < length <= self.body_chunk_size:
+            return request.body
+        return self.read_chunks(request, limit)
+
+    def read_chunks(self, request, limit):
+        """
+        Read the request body in chunks of body_chunk_size bytes, failing as
+        soon as it exceeds limit.
+        """
+
+        buffer = bytearray()
+        while True:
+            chunk = request.read(self.body_chunk_size)
+            if not chunk:
+                return buffer
+            buffer += chunk
+            if limit is not None and len(buffer) > limit:
+                raise self.body_too_large(limit)
+
+    def get_max_body_size(self):
+        """
+        Return the maximum accepted body size in bytes or None for no limit.
+        """
+
+        if self.max_body_size is not None:
+            return self.max_body_size
+        from django.conf import settings
+        return getattr(settings, 'BRICKS_RPC_MAX_BODY_SIZE',
+                       DEFAULT_MAX_BODY_SIZE)
+
+    def body_too_large(self, limit):
+        msg = 'request body is larger than %s bytes' % limit
+        return BadResponseError(http.HttpResponse(msg, status=413))
+
+    def is_valid_call(self, data):
+        """
+        Return True if data is a valid JSON-RPC 2.0 call object.
+        """
+
+        try:
+            return data.get('jsonrpc', None) == '2.0'
+        except AttributeError:
+            return False
+
+    def is_notification(self, data):
+        """
+        Return True if the call data is a notification, i.e., the client does
+        not expect a response. Calls with a null id are not notifications.
+        """
+
+        return 'id' not in data
+
+    def process_notification(self, request, data):
+        """
+        Execute a notification inline or, if defer_notifications is set, in
+        the background. Notifications never produce a response.
+        """
+
+        if self.defer_notifications:
+            self.submit_notification(request, data)
+        else:
+            self.run_notification(request, data)
+
+    def submit_notification(self, request, data):
+        """
+        Execute a notification in the background.
+
+        If too many notifications are pending, it is executed immediately in
+        the current thread.
+        """
+
+        submitter = get_notification_submitter()
+        func = closing_connections(self.run_notification)
+        if submitter.try_submit(func, request, data) is None:
+            self.run_notification(request, data)
+
+    def run_notification(self, request, data):
+        """
+        Execute a notification and discard its result. Errors are logged.
+        """
+
+        try:
+            response = self.execute(request, data)
+            result = response.get('result')
+            if isinstance(result, Stream):
+                result.materialize()
+        except Exception:
+            log.exception('error in notification %r at %s' %
+                          (data.get('method'), request.path))
+        else:
+            self.log_notification_error(request, data, response)
+
+    def log_notification_error(self, request, data, response):
+        if 'error' in response:
+            message = response['error']['message']
+            log.warning('notification %r at %s failed: %s' %
+                        (data.get('method'), request.path, message))
+
     def execute(self, request, data):
         """
         Execute the API function and return a dictionary with the results.
         """
 
+        id, client, args, kwargs = self.prepare_call(request, data)
+        response = {'jsonrpc': '2.0'}
+        if id is not None:
+            response['id'] = id
+
+        # Execute function and prepare for any errors
+        try:
+            response['result'] = self.call_function(client, args, kwargs)
+        except Exception as ex:
+            self.record_error(request, ex)
+            response['error'] = self.wrap_error(ex, ex.__traceback__)
+
+        return response
+
+    def prepare_call(self, request, data):
+        """
+        Return a tuple of (id, client, args, kwargs) from the call data.
+        """
+
         id = data.get('id', None)
         params = data.get('params', {})
 
         # Choose how params are interpreted
-        if isinstance(params, (list, tuple)):
-            args = params
+        if isinstance(params, (list, tuple, LazySequence)):
+            args = list(params)
             kwargs = {}
         else:
-            args = params.pop('*args', [])
-            kwargs = params
+            kwargs = dict(params)
+            args = list(kwargs.pop('*args', []))
 
-        # Add request first argument
-        client = Client(request)
-        if self.request_argument:
-            args.insert(0, client)
+        return id, Client(request), args, kwargs
 
-        # Prepare response object
-        response = {'jsonrpc': '2.0'}
-        if id is not None:
-            response['id'] = id
+    def call_function(self, client, args, kwargs):
+        """
+        Call the API function and return the content of the "result" field of
+        the response.
 
-        # Execute function and prepare for any errors
+        If the function sends instructions to the client, the result is
+        wrapped into a JsAction object together with the compiled program.
+        Results are taken from the result cache, if enabled.
+        """
+
+        if self.validate_params:
+            args, kwargs = self.bind_params(args, kwargs)
+        if self.background:
+            return self.submit_job(client, args, kwargs)
+
+        cache = self.result_cache
+        if cache is None:
+            return self.run_function(client, args, kwargs)
+
+        key = self.get_cache_key(client, args, kwargs)
+        result = cache.get(key, _MISSING)
+        if result is _MISSING:
+            result = self.run_function(client, args, kwargs)
+            if not isinstance(result, (Stream, JsAction)):
+                cache.set(key, result)
+        return result
+
+    def run_function(self, client, args, kwargs):
+        """
+        Invoke the function, coalescing identical concurrent calls if
+        enabled.
+        """
+
+        if not self.coalesce or is_stream_function(self.function):
+            return self.invoke_limited(client, args, kwargs)
+        key = self.get_coalesce_key(client, args, kwargs)
+        return default_group.call(key, self.invoke_limited,
+                                  client, args, kwargs, share=is_shareable)
+
+    def invoke_limited(self, client, args, kwargs):
+        """
+        Invoke the function holding a slot of each concurrency limiter.
+
+        Slots are held until the function returns or, for generators, until
+        the stream is closed. Raises OverloadedError if the call is rejected
+        by a limiter.
+        """
+
+        limiters = self.get_limiters()
+        if not limiters:
+            return self.invoke_function(client, args, kwargs)
+        acquired = acquire_all(limiters)
+        try:
+            result = self.invoke_function(client, args, kwargs)
+        except BaseException:
+            release_all(acquired)
+            raise
+        return self.release_after(result, acquired)
+
+    def release_after(self, result, limiters):
+        """
+        Release the limiter slots taken for a call that returned result.
+        """
+
+        if isinstance(result, Stream):
+            result.add_finalizer(release_all, limiters)
+        else:
+            release_all(limiters)
+        return result
+
+    def get_limiters(self):
+        """
+        Return the list of concurrency limiters that apply to the function.
+        """
+
+        limiters = []
+        if self.limiter is not None:
+            limiters.append(self.limiter)
+        global_limiter = get_global_limiter()
+        if global_limiter is not None:
+            limiters.append(global_limiter)
+        return limiters
+
+    def bind_params(self, args, kwargs):
+        """
+        Validate and coerce call parameters using the function signature.
+
+        Raises InvalidParams for malformed calls.
+        """
+
+        binder = self.binder
+        if binder is None:
+            binder = get_binder(self.function, self.request_argument)
+        return binder.bind(args, kwargs)
+
+    def submit_job(self, client, args, kwargs):
+        """
+        Submit the call to the background job pool and return the job
+        description.
+        """
+
+        store = self.job_store or get_job_store()
+        job = Job(name=self.name, user=client.user)
+        store.save(job)
+        executor = get_job_executor()
+        executor.submit(closing_connections(self.run_job),
+                        store, job, client, args, kwargs)
+        return job.as_dict()
+
+    def run_job(self, store, job, client, args, kwargs):
+        """
+        Execute a background job and save its result in the store.
+        """
+
+        job.start()
+        store.save(job)
         try:
+            result = self.execute_job(client, args, kwargs)
+        except Exception as ex:
+            job.fail(self.wrap_error(ex, ex.__traceback__,
+                                     wrap_permission_errors=True))
+        else:
+            job.finish(result)
+        store.save(job)
+
+    def execute_job(self, client, args, kwargs):
+        """
+        Run the function of a background job and return its result.
+        """
+
+        result = self.run_function(client, args, kwargs)
+        if isinstance(result, Stream):
+            result = result.materialize()
+        return result
+
+    def get_cache_key(self, client, args, kwargs):
+        """
+        Return the result cache key for the given call.
+
+        Results are cached separately for each user if they may depend on
+        the user (see is_user_dependent()).
+        """
+
+        user = client.user if self.is_user_dependent() else None
+        return self.result_cache.make_key(args, kwargs, user)
+
+    def get_coalesce_key(self, client, args, kwargs):
+        """
+        Return the key that identifies identical calls for coalescing.
+
+        Calls from different users are never coalesced if the result may
+        depend on the user.
+        """
+
+        user = None
+        if self.is_user_dependent():
+            user = getattr(client.user, 'pk', None)
+        return self.function, digest([args, kwargs, user])
+
+    def invoke_function(self, client, args, kwargs):
+        """
+        Execute the function and wrap its result (see call_function()).
+
+        Generators are wrapped into :class:`bricks.rpc.streaming.Stream`
+        objects.
+        """
+
+        if self.request_argument:
+            result = self.function(client, *args, **kwargs)
+        else:
             result = self.function(*args, **kwargs)
+        if is_stream(result):
+            return Stream(self, client, result)
+        return self.wrap_result(client, result)
+
+    def wrap_result(self, client, result):
+        """
+        Wrap result with the Javascript program generated by client, if any.
+        """
+
+        metrics = getattr(client.request, '_bricks_metrics', None)
+        if metrics is None:
             js_data = js_compile(client)
-            response['result'] = \
-                JsAction(js=js_data, result=result) if js_data else result
+        else:
+            with metrics.phase('js_compile'):
+                js_data = js_compile(client)
+        return JsAction(js=js_data, result=result) if js_data else result
+
+    def execute_batch(self, request, batch):
+        """
+        Execute a list of calls and return the list of responses.
+
+        Notifications (calls without an id) do not produce responses.
+        """
+
+        if self.concurrent_batch and len(batch) > 1:
+            executor = get_executor('batch')
+            execute = closing_connections(self.execute_batch_item)
+            futures = [executor.submit(execute, request, data)
+                       for data in batch]
+            responses = [future.result() for future in futures]
+        else:
+            responses = [self.execute_batch_item(request, data)
+                         for data in batch]
+        return [r for r in responses if r is not None]
+
+    def execute_batch_item(self, request, data):
+        """
+        Execute a single call of a batch request.
+
+        Invalid calls and errors that would abort the whole request for a
+        single call are converted into JSON-RPC error objects. Return None for
+        notifications.
+        """
+
+        if not self.is_valid_call(data):
+            return self.error_response(None, INVALID_REQUEST,
+                                       'invalid request')
+        if self.is_notification(data):
+            self.process_notification(request, data)
+            return None
+        try:
+            response = self.execute(request, data)
+            result = response.get('result')
+            if isinstance(result, Stream):
+                self.materialize_stream(response, result.materialize)
+        except BadResponseError as ex:
+            message = ex.response.content.decode('utf8', 'replace')
+            response = self.error_response(data.get('id'), SERVER_ERROR,
+                                           message or 'request failed')
+        return response
+
+    def materialize_stream(self, response, materialize):
+        """
+        Replace a streamed result in response by the list of its items.
+
+        Batch responses cannot be streamed, so generators are consumed before
+        the response is sent.
+        """
+
+        try:
+            response['result'] = materialize()
         except Exception as ex:
+            del response['result']
             response['error'] = self.wrap_error(ex, ex.__traceback__)
 
-        return response
+    def error_response(self, id, code, message, data=None):
+        """
+        Return a JSON-RPC error response object.
+        """
+
+        error = {'code': code, 'message': message}
+        if data is not None:
+            error['data'] = data
+        return {'jsonrpc': '2.0', 'id': id, 'error': error}
 
     def wrap_error(self, ex, tb=None, wrap_permission_errors=False):
         """
@@ -164,6 +689,13 @@ class RPCView(View):
                 'exception': ex_fqualname,
             }
         }
+        if isinstance(ex, OverloadedError):
+            error['data']['retry_after'] = ex.retry_after
+            return error
+        if isinstance(ex, InvalidParams):
+            if ex.param is not None:
+                error['data']['param'] = ex.param
+            return error
 
         # Print traceback if running in debug mode
         if self.DEBUG:
@@ -188,13 +720,36 @@ class RPCView(View):
             raise BadResponseError(response)
 
         if self.perms_required:
-            user = request.user
-            for perm in self.perms_required:
-                if not user.has_perm(perm):
-                    msg = 'user does not have permission: %s' % perm
-                    response = http.HttpResponseForbidden(msg)
-                    raise BadResponseError(response)
-                    # TODO: check csrf token
+            missing = self.get_missing_perm(request, self.perms_required)
+            if missing is not None:
+                msg = 'user does not have permission: %s' % missing
+                response = http.HttpResponseForbidden(msg)
+                raise BadResponseError(response)
+
+        # TODO: check csrf token
+
+    def get_missing_perm(self, request, perms):
+        """
+        Return the first permission in perms the user does not have or None.
+
+        Results are memoized in the request, so all calls handled in the same
+        request (e.g., in a batch) query the permission backends only once
+        per permission.
+        """
+
+        cache = get_perm_cache(request)
+        try:
+            return cache[perms]
+        except KeyError:
+            pass
+
+        missing = None
+        for perm in sorted(perms):
+            if not has_perm(request.user, perm, cache):
+                missing = perm
+                break
+        cache[perms] = missing
+        return missing
 
     def get_raw_response(self, request, data):
         """
@@ -204,11 +759,52 @@ class RPCView(View):
         """
 
         try:
-            return dumps(data)
+            return dumps(data, tables=self.table_threshold)
         except Exception as ex:
             response = http.HttpResponseServerError(ex)
             raise BadResponseError(response)
 
+    def get_stream_response(self, request, response):
+        """
+        Return a streaming HTTP response for a call that returned a
+        generator.
+        """
+
+        stream = response['result']
+        self.stream_metrics(request, stream)
+        return self.make_stream_response(stream.lines(response.get('id')))
+
+    def stream_metrics(self, request, stream):
+        """
+        Record the metrics of the request when the stream is closed. The time
+        spent sending the stream counts as execution time.
+        """
+
+        metrics = getattr(request, '_bricks_metrics', None)
+        if metrics is not None:
+            stream.add_finalizer(self.record_stream_metrics, metrics,
+                                 time.perf_counter())
+
+    def record_stream_metrics(self, metrics, start):
+        metrics.add_time('execute', time.perf_counter() - start)
+        self.record_metrics(metrics, None)
+
+    def is_streaming(self, http_response):
+        """
+        Return True if http_response streams a generator result, whose
+        metrics are recorded when the stream is closed.
+        """
+
+        return http_response is not None and http_response.streaming and \
+            http_response.get('Content-Type') == streaming.CONTENT_TYPE
+
+    def make_stream_response(self, lines):
+        response = http.StreamingHttpResponse(
+            lines, content_type=streaming.CONTENT_TYPE)
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
     def get_content_type(self):
         """
         Content type of the resulting message.
@@ -223,23 +819,522 @@ class RPCView(View):
         Process the given request, call handler and return result.
         """
 
+        metrics = self.start_metrics(request)
+        http_response = None
         try:
-            self.check_credentials(request)
-            data = self.get_data(request)
-            response = self.execute(request, data)
-            raw_response = self.get_raw_response(request, response)
-            content_type = self.get_content_type()
+            http_response = self.process_request(request, metrics)
+            return http_response
+        finally:
+            if not self.is_streaming(http_response):
+                self.record_metrics(metrics, http_response)
+
+    def process_request(self, request, metrics):
+        """
+        Worker method for post(): return the HTTP response for the request,
+        measuring each phase.
+        """
+
+        try:
+            with metrics.phase('credentials'):
+                self.check_credentials(request)
+            with metrics.phase('decode'):
+                data = self.get_data(request)
+            with metrics.phase('execute'):
+                response = self.execute_request(request, data, metrics)
+            return self.get_http_response(request, response, metrics)
+        except BadRequestError as ex:
+            metrics.error(ex)
+            return http.HttpResponseBadRequest(str(ex))
         except BadResponseError as ex:
+            metrics.error(ex)
             if hasattr(ex, 'response'):
                 return ex.response
             raise
 
-        return http.HttpResponse(raw_response, content_type=content_type)
+    def execute_request(self, request, data, metrics):
+        """
+        Execute a single call or a batch request and return the response
+        object or None if no response should be sent.
+        """
+
+        if isinstance(data, list):
+            metrics.batch = True
+            return self.execute_batch(request, data)
+        if self.is_notification(data):
+            self.process_notification(request, data)
+            return None
+        return self.execute(request, data)
+
+    def get_http_response(self, request, response, metrics):
+        """
+        Return the HTTP response for the result of execute_request().
+        """
+
+        if not response:
+            return http.HttpResponse(status=204)
+        if isinstance(response, dict) and \
+                isinstance(response.get('result'), Stream):
+            return self.get_stream_response(request, response)
+        with metrics.phase('encode'):
+            raw_response = self.get_raw_response(request, response)
+        return http.HttpResponse(raw_response,
+                                 content_type=self.get_content_type())
+
+    def start_metrics(self, request):
+        """
+        Create the :class:`bricks.rpc.metrics.RequestMetrics` object for the
+        request.
+
+        Metrics are attached to the request (if enabled), so errors and the
+        time spent in js_compile are also recorded.
+        """
+
+        try:
+            size = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            size = 0
+        metrics = RequestMetrics(self.get_metrics_name(), size)
+        if get_metrics_sink() is not None:
+            request._bricks_metrics = metrics
+        return metrics
+
+    def record_metrics(self, metrics, http_response):
+        """
+        Send metrics of a finished request to the metrics sink.
+        """
+
+        sink = get_metrics_sink()
+        if sink is None:
+            return
+        if http_response is not None and not http_response.streaming:
+            metrics.response_size = len(http_response.content)
+        metrics.finish()
+        sink.record(metrics)
+
+    def record_error(self, request, ex):
+        """
+        Count an exception raised by the function in the request metrics.
+        """
+
+        metrics = getattr(request, '_bricks_metrics', None)
+        if metrics is not None:
+            metrics.error(ex)
+
+    def get_metrics_name(self):
+        """
+        Name of the function in metrics.
+        """
+
+        if self.name:
+            return self.name
+        func = self.function
+        if func is None:
+            return type(self).__name__
+        return '%s.%s' % (getattr(func, '__module__', None),
+                          getattr(func, '__qualname__', type(func).__name__))
 
     def get(self, request, *args, **kwargs):
-        return http.HttpResponseForbidden(
-            'this api-point does not allow AJAX GET requests.'
-        )
+        if not self.http_get:
+            return http.HttpResponseForbidden(
+                'this api-point does not allow AJAX GET requests.'
+            )
+
+        metrics = self.start_metrics(request)
+        http_response = None
+        try:
+            http_response = self.process_get_request(request, metrics)
+            return http_response
+        finally:
+            self.record_metrics(metrics, http_response)
+
+    def process_get_request(self, request, metrics):
+        """
+        Worker method for get(): execute the call encoded in the query string
+        and return a cacheable HTTP response.
+        """
+
+        try:
+            with metrics.phase('credentials'):
+                self.check_credentials(request)
+            with metrics.phase('decode'):
+                data = self.get_query_data(request)
+            with metrics.phase('execute'):
+                response = self.execute(request, data)
+                result = response.get('result')
+                if isinstance(result, Stream):
+                    self.materialize_stream(response, result.materialize)
+            return self.get_cacheable_response(request, response, metrics)
+        except BadRequestError as ex:
+            metrics.error(ex)
+            return http.HttpResponseBadRequest(str(ex))
+        except BadResponseError as ex:
+            metrics.error(ex)
+            if hasattr(ex, 'response'):
+                return ex.response
+            raise
+
+    def get_query_data(self, request):
+        """
+        Return the call data encoded in the query string of a GET request.
+        """
+
+        query = request.GET
+        if 'params' in query:
+            try:
+                params = loads(query['params'], lazy=self.lazy_decode)
+            except Exception:
+                raise BadRequestError('invalid JSON in params')
+            if not isinstance(params, (list, dict, LazySequence)) and \
+                    not hasattr(params, 'keys'):
+                raise BadRequestError('params must be a list or an object')
+        else:
+            params = {k: v[0] if len(v) == 1 else v
+                      for k, v in query.lists()}
+        return {'jsonrpc': '2.0', 'method': self.name, 'params': params}
+
+    def get_cacheable_response(self, request, response, metrics):
+        """
+        Return the HTTP response for a GET request with the ETag and
+        Cache-Control headers. Errors are never cached.
+        """
+
+        if 'error' in response:
+            with metrics.phase('encode'):
+                raw_response = self.get_raw_response(request, response)
+            http_response = http.HttpResponse(
+                raw_response, content_type=self.get_content_type())
+            add_never_cache_headers(http_response)
+            return http_response
+
+        etag = None
+        if self.etag:
+            etag = '"%s"' % digest(response['result'])
+            if self.etag_matches(request, etag):
+                http_response = http.HttpResponseNotModified()
+                http_response['ETag'] = etag
+                self.set_cache_headers(http_response)
+                return http_response
+
+        with metrics.phase('encode'):
+            raw_response = self.get_raw_response(request, response)
+        http_response = http.HttpResponse(
+            raw_response, content_type=self.get_content_type())
+        if etag is not None:
+            http_response['ETag'] = etag
+        self.set_cache_headers(http_response)
+        return http_response
+
+    def etag_matches(self, request, etag):
+        """
+        Return True if the If-None-Match header of request matches etag.
+        """
+
+        header = request.META.get('HTTP_IF_NONE_MATCH')
+        if not header:
+            return False
+        etags = parse_etags(header)
+        if '*' in etags:
+            return True
+        return any(tag[2:] == etag if tag.startswith('W/') else tag == etag
+                   for tag in etags)
+
+    def set_cache_headers(self, http_response):
+        """
+        Set the Cache-Control and Vary headers of a successful GET response.
+
+        Responses are private unless the view is public and the results do
+        not depend on the user.
+        """
+
+        options = {}
+        if self.max_age is not None:
+            options['max_age'] = self.max_age
+        else:
+            options['no_cache'] = True
+        user_dependent = self.is_user_dependent()
+        if self.public and not user_dependent:
+            options['public'] = True
+        else:
+            options['private'] = True
+        if user_dependent:
+            patch_vary_headers(http_response, ['Cookie'])
+        patch_cache_control(http_response, **options)
+
+    def is_user_dependent(self):
+        """
+        Return True if results may depend on the user making the request.
+        """
+
+        if self.login_required or self.perms_required or self.vary_on_user:
+            return True
+        cache = self.result_cache
+        return cache is not None and cache.vary_on_user
+
+
+class AsyncRPCView(RPCView):
+    """
+    Asynchronous version of :class:`RPCView` for ASGI deployments.
+
+    Coroutine functions are awaited in the event loop and regular functions
+    are executed in a shared thread pool, so a single worker can handle many
+    concurrent calls that wait on I/O. Functions decorated with
+    :func:`bricks.rpc.api` and friends use this view automatically if they are
+    defined with ``async def``.
+
+    This view requires Django 3.1+. Streaming async generators requires
+    Django 4.2+.
+    """
+
+    async def execute(self, request, data):
+        id, client, args, kwargs = self.prepare_call(request, data)
+        response = {'jsonrpc': '2.0'}
+        if id is not None:
+            response['id'] = id
+
+        try:
+            response['result'] = \
+                await self.call_function_async(client, args, kwargs)
+        except Exception as ex:
+            self.record_error(request, ex)
+            response['error'] = self.wrap_error(ex, ex.__traceback__)
+
+        return response
+
+    async def execute_batch(self, request, batch):
+        if self.concurrent_batch:
+            responses = await asyncio.gather(
+                *[self.execute_batch_item(request, x) for x in batch])
+        else:
+            responses = [await self.execute_batch_item(request, x)
+                         for x in batch]
+        return [r for r in responses if r is not None]
+
+    async def execute_batch_item(self, request, data):
+        if not self.is_valid_call(data):
+            return self.error_response(None, INVALID_REQUEST,
+                                       'invalid request')
+        if self.is_notification(data):
+            await self.process_notification(request, data)
+            return None
+        try:
+            response = await self.execute(request, data)
+            result = response.get('result')
+            if isinstance(result, Stream):
+                await self.materialize_stream_async(response,
+                                                    result.amaterialize)
+        except BadResponseError as ex:
+            message = ex.response.content.decode('utf8', 'replace')
+            response = self.error_response(data.get('id'), SERVER_ERROR,
+                                           message or 'request failed')
+        return response
+
+    async def process_notification(self, request, data):
+        if self.defer_notifications:
+            await self.submit_notification(request, data)
+        else:
+            await self.run_notification(request, data)
+
+    async def submit_notification(self, request, data):
+        """
+        Schedule a notification as a task in the event loop.
+
+        If too many notifications are pending, it is awaited immediately.
+        """
+
+        max_pending = get_notification_submitter().max_pending
+        if len(_pending_notifications) >= max_pending:
+            await self.run_notification(request, data)
+            return
+        task = asyncio.ensure_future(self.run_notification(request, data))
+        _pending_notifications.add(task)
+        task.add_done_callback(_pending_notifications.discard)
+
+    async def run_notification(self, request, data):
+        try:
+            response = await self.execute(request, data)
+            result = response.get('result')
+            if isinstance(result, Stream):
+                await result.amaterialize()
+        except Exception:
+            log.exception('error in notification %r at %s' %
+                          (data.get('method'), request.path))
+        else:
+            self.log_notification_error(request, data, response)
+
+    async def materialize_stream_async(self, response, materialize):
+        """
+        Asynchronous version of :meth:`RPCView.materialize_stream`.
+        """
+
+        try:
+            response['result'] = await materialize()
+        except Exception as ex:
+            del response['result']
+            response['error'] = self.wrap_error(ex, ex.__traceback__)
+
+    async def call_function_async(self, client, args, kwargs):
+        """
+        Asynchronous version of :meth:`RPCView.call_function`.
+        """
+
+        if self.validate_params:
+            args, kwargs = self.bind_params(args, kwargs)
+        if self.background:
+            return self.submit_job(client, args, kwargs)
+
+        cache = self.result_cache
+        if cache is None:
+            return await self.run_function_async(client, args, kwargs)
+
+        key = self.get_cache_key(client, args, kwargs)
+        result = cache.get(key, _MISSING)
+        if result is _MISSING:
+            result = await self.run_function_async(client, args, kwargs)
+            if not isinstance(result, (Stream, JsAction)):
+                cache.set(key, result)
+        return result
+
+    def execute_job(self, client, args, kwargs):
+        from asgiref.sync import async_to_sync
+
+        async def execute():
+            result = await self.run_function_async(client, args, kwargs)
+            if isinstance(result, Stream):
+                result = await result.amaterialize()
+            return result
+
+        return async_to_sync(execute)()
+
+    async def run_function_async(self, client, args, kwargs):
+        """
+        Asynchronous version of :meth:`RPCView.run_function`.
+        """
+
+        if not self.coalesce or is_stream_function(self.function):
+            return await self.invoke_limited_async(client, args, kwargs)
+        key = self.get_coalesce_key(client, args, kwargs)
+        return await default_group.acall(key, self.invoke_limited_async,
+                                         client, args, kwargs,
+                                         share=is_shareable)
+
+    async def invoke_limited_async(self, client, args, kwargs):
+        """
+        Asynchronous version of :meth:`RPCView.invoke_limited`.
+        """
+
+        limiters = self.get_limiters()
+        if not limiters:
+            return await self.invoke_function_async(client, args, kwargs)
+        acquired = await acquire_all_async(limiters)
+        try:
+            result = await self.invoke_function_async(client, args, kwargs)
+        except BaseException:
+            release_all(acquired)
+            raise
+        return self.release_after(result, acquired)
+
+    async def invoke_function_async(self, client, args, kwargs):
+        """
+        Asynchronous version of :meth:`RPCView.invoke_function`.
+        """
+
+        if inspect.isasyncgenfunction(self.function):
+            return self.invoke_function(client, args, kwargs)
+        if not asyncio.iscoroutinefunction(self.function):
+            return await self.run_in_executor(self.invoke_function,
+                                              client, args, kwargs)
+
+        if self.request_argument:
+            result = await self.function(client, *args, **kwargs)
+        else:
+            result = await self.function(*args, **kwargs)
+        return self.wrap_result(client, result)
+
+    async def run_in_executor(self, func, *args):
+        """
+        Run a blocking function in the shared thread pool.
+        """
+
+        loop = asyncio.get_event_loop()
+        executor = get_executor()
+        return await loop.run_in_executor(
+            executor, closing_connections(func), *args)
+
+    async def post(self, request, *args, **kwargs):
+        metrics = self.start_metrics(request)
+        http_response = None
+        try:
+            http_response = await self.process_request(request, metrics)
+            return http_response
+        finally:
+            if not self.is_streaming(http_response):
+                self.record_metrics(metrics, http_response)
+
+    async def process_request(self, request, metrics):
+        try:
+            with metrics.phase('credentials'):
+                await self.run_in_executor(self.check_credentials, request)
+            with metrics.phase('decode'):
+                data = self.get_data(request)
+            with metrics.phase('execute'):
+                response = await self.execute_request(request, data, metrics)
+            return self.get_http_response(request, response, metrics)
+        except BadRequestError as ex:
+            metrics.error(ex)
+            return http.HttpResponseBadRequest(str(ex))
+        except BadResponseError as ex:
+            metrics.error(ex)
+            if hasattr(ex, 'response'):
+                return ex.response
+            raise
+
+    async def execute_request(self, request, data, metrics):
+        if isinstance(data, list):
+            metrics.batch = True
+            return await self.execute_batch(request, data)
+        if self.is_notification(data):
+            await self.process_notification(request, data)
+            return None
+        return await self.execute(request, data)
+
+    def get_stream_response(self, request, response):
+        stream = response['result']
+        self.stream_metrics(request, stream)
+        return self.make_stream_response(stream.alines(response.get('id')))
+
+    async def get(self, request, *args, **kwargs):
+        if not self.http_get:
+            return super().get(request, *args, **kwargs)
+
+        metrics = self.start_metrics(request)
+        http_response = None
+        try:
+            http_response = await self.process_get_request(request, metrics)
+            return http_response
+        finally:
+            self.record_metrics(metrics, http_response)
+
+    async def process_get_request(self, request, metrics):
+        try:
+            with metrics.phase('credentials'):
+                await self.run_in_executor(self.check_credentials, request)
+            with metrics.phase('decode'):
+                data = self.get_query_data(request)
+            with metrics.phase('execute'):
+                response = await self.execute(request, data)
+                result = response.get('result')
+                if isinstance(result, Stream):
+                    await self.materialize_stream_async(response,
+                                                        result.amaterialize)
+            return self.get_cacheable_response(request, response, metrics)
+        except BadRequestError as ex:
+            metrics.error(ex)
+            return http.HttpResponseBadRequest(str(ex))
+        except BadResponseError as ex:
+            metrics.error(ex)
+            if hasattr(ex, 'response'):
+                return ex.response
+            raise
 
 
 def jsonrpc_endpoint(login_required=False, perms_required=None):
@@ -264,12 +1359,60 @@ def jsonrpc_endpoint(login_required=False, perms_required=None):
     return decorator
 
 
+def normalize_perms(perms):
+    """
+    Return the required permissions as a frozenset or None.
+    """
+
+    if not perms:
+        return None
+    if isinstance(perms, str):
+        return frozenset([perms])
+    return frozenset(perms)
+
+
+def get_perm_cache(request):
+    """
+    Return the dictionary that memoizes permission checks in the request.
+    """
+
+    try:
+        return request._bricks_perm_cache
+    except AttributeError:
+        cache = request._bricks_perm_cache = {}
+        return cache
+
+
+def has_perm(user, perm, cache):
+    """
+    Return True if user has the given permission, using the results memoized
+    in cache.
+    """
+
+    try:
+        return cache[perm]
+    except KeyError:
+        allowed = cache[perm] = user.has_perm(perm)
+        return allowed
+
+
 class JsAction:
     def __init__(self, js, result):
         self.js = js
         self.result = result
 
 
+def is_shareable(result):
+    """
+    Return True if a result can be shared by coalesced calls.
+
+    Programs sent to the client (JsAction) belong to the call that created
+    them.
+    """
+
+    return not isinstance(result, JsAction)
+
+
 @register(JsAction, 'js-action')
 def encode_js_action(x):
     return {'@': 'js-action', 'js': x.js, 'result': x.result}
@@ -0,0 +1,514 @@
+"""
+JSON-RPC over WebSockets.
+
+:class:`WebSocketRPC` is an ASGI application that serves the functions
+registered with ``@api(register=True)`` and friends (see
+:mod:`bricks.rpc.dispatch`) over a persistent WebSocket connection. Each text
+frame carries a JSON-RPC call or batch, exactly as in the HTTP transport.
+Calls are executed concurrently and responses are sent as soon as they are
+ready, so clients match them to requests by their "id". Generator results are
+sent as a sequence of "partial" frames followed by the final response.
+
+Mount it next to the Django application in your asgi.py::
+
+    from django.core.asgi import get_asgi_application
+    from bricks.rpc.websocket import WebSocketRPC, asgi_router
+
+    application = asgi_router(get_asgi_application(),
+                              {'/ws/rpc/': WebSocketRPC()})
+
+No message broker is required. Users are authenticated from the session
+cookie sent in the handshake (or taken from scope['user'], if an
+authentication middleware already set it). Handshakes from other origins are
+rejected.
+
+In bricks.js, use ``bricks.socket('/ws/rpc/')`` to open a connection and call
+functions by their registered names.
+"""
+import asyncio
+import copy
+from logging import getLogger
+
+from django import http
+
+from bricks.json import loads, LazySequence
+from .dispatch import BricksRPCDispatchView
+from .executors import get_executor, closing_connections
+from .streaming import Stream
+from .views import (AsyncRPCView, BadResponseError, PARSE_ERROR,
+                    INVALID_REQUEST, METHOD_NOT_FOUND, INTERNAL_ERROR,
+                    SERVER_ERROR)
+
+log = getLogger('bricks.rpc')
+
+#: Close code sent when a message is larger than the size limit.
+CLOSE_MESSAGE_TOO_BIG = 1009
+
+#: Close code sent when the handshake comes from a forbidden origin.
+CLOSE_FORBIDDEN = 4003
+
+
+class WebSocketRPC:
+    """
+    ASGI application that executes JSON-RPC calls received in WebSocket
+    messages.
+
+    Args:
+        registry:
+            A mapping from method names to RPCView handlers. Defaults to the
+            global registry of decorated functions.
+        max_calls:
+            Maximum number of calls executed concurrently for each
+            connection. Further messages are not read until a call finishes.
+        max_message_size:
+            Maximum size of incoming messages. Defaults to the
+            BRICKS_RPC_MAX_BODY_SIZE setting.
+        allowed_origins:
+            List of origins (e.g., "https://example.com") allowed to connect.
+            By default, only connections from the same host are accepted.
+    """
+
+    def __init__(self, registry=None, max_calls=100, max_message_size=None,
+                 allowed_origins=None):
+        self.dispatcher = BricksRPCDispatchView(
+            registry=registry, max_body_size=max_message_size)
+        self.max_calls = max_calls
+        self.allowed_origins = allowed_origins
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'websocket':
+            raise ValueError('unsupported scope type: %r' % scope['type'])
+
+        message = await receive()
+        if message['type'] != 'websocket.connect':
+            return
+        if not self.is_origin_allowed(scope):
+            await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+            return
+
+        request = await self.get_request(scope)
+        await send({'type': 'websocket.accept'})
+        connection = Connection(self, request, send)
+        try:
+            await connection.run(receive)
+        finally:
+            await connection.close()
+
+    def is_origin_allowed(self, scope):
+        """
+        Return True if the handshake origin may open a connection.
+        """
+
+        headers = _headers(scope)
+        origin = headers.get('origin')
+        if origin is None:
+            return True
+        if self.allowed_origins is not None:
+            return origin in self.allowed_origins
+        host = origin.partition('://')[2]
+        return host == headers.get('host')
+
+    async def get_request(self, scope):
+        """
+        Return an HttpRequest that represents the connection.
+
+        The same request object is passed to all calls in the connection.
+        """
+
+        request = make_request(scope)
+        if 'user' in scope:
+            request.user = scope['user']
+        else:
+            request.user = await run_sync(get_session_user, request)
+        return request
+
+
+class Connection:
+    """
+    State of a single WebSocket connection.
+    """
+
+    def __init__(self, app, request, send):
+        self.app = app
+        self.dispatcher = app.dispatcher
+        self.request = request
+        self._send = send
+        self._send_lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(app.max_calls)
+        self._tasks = set()
+
+    async def run(self, receive):
+        """
+        Read messages until the client disconnects.
+        """
+
+        limit = self.dispatcher.get_max_body_size()
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            if message['type'] != 'websocket.receive':
+                continue
+
+            data = message.get('text')
+            if data is None:
+                data = message.get('bytes') or b''
+            if limit is not None and len(data) > limit:
+                await self._send({'type': 'websocket.close',
+                                  'code': CLOSE_MESSAGE_TOO_BIG})
+                return
+
+            await self._slots.acquire()
+            task = asyncio.ensure_future(self.process_message(data))
+            self._tasks.add(task)
+            task.add_done_callback(self._task_done)
+
+    def _task_done(self, task):
+        self._tasks.discard(task)
+        self._slots.release()
+
+    async def close(self):
+        """
+        Cancel all pending calls.
+        """
+
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def process_message(self, data):
+        """
+        Execute the call or batch of calls in a message and send the
+        responses.
+
+        Calls are executed with a shallow copy of the connection request, so
+        state memoized in the request (e.g., permission checks) only lives
+        for a single message.
+        """
+
+        dispatcher = self.dispatcher
+        try:
+            payload = loads(data, lazy=dispatcher.lazy_decode)
+        except Exception:
+            await self.send(dispatcher.error_response(
+                None, PARSE_ERROR, 'invalid JSON'))
+            return
+
+        request = copy.copy(self.request)
+        if isinstance(payload, (list, LazySequence)):
+            await self.process_batch(list(payload), request)
+        else:
+            await self.process_call(payload, request)
+
+    async def process_batch(self, batch, request):
+        """
+        Execute a batch of calls and send the list of responses.
+        """
+
+        dispatcher = self.dispatcher
+        if not batch or len(batch) > dispatcher.max_batch_size:
+            await self.send(dispatcher.error_response(
+                None, INVALID_REQUEST, 'invalid batch request'))
+            return
+        responses = await asyncio.gather(
+            *[self.execute(x, request, stream=False) for x in batch])
+        responses = [r for r in responses if r is not None]
+        if responses:
+            await self.send(responses)
+
+    async def process_call(self, data, request):
+        """
+        Execute a single call and send its response. Generator results are
+        sent as a sequence of partial frames.
+        """
+
+        response = await self.execute(data, request, stream=True)
+        if response is None:
+            return
+        result = response.get('result')
+        if isinstance(result, Stream):
+            async for line in result.alines(response.get('id')):
+                await self.send_raw(line.rstrip('\n'))
+        else:
+            await self.send(response)
+
+    async def execute(self, data, request, stream=False):
+        """
+        Execute a single call and return its response or None for
+        notifications.
+
+        Generator results are consumed unless stream is True.
+        """
+
+        dispatcher = self.dispatcher
+        if not dispatcher.is_valid_call(data):
+            return dispatcher.error_response(None, INVALID_REQUEST,
+                                             'invalid request')
+        method = data.get('method')
+        handler = dispatcher.get_handler(method)
+        if handler is None:
+            response = dispatcher.error_response(
+                data.get('id'), METHOD_NOT_FOUND,
+                'method not found: %s' % method)
+        else:
+            response = await self.call_handler(handler, data, request,
+                                               stream)
+        return None if dispatcher.is_notification(data) else response
+
+    async def call_handler(self, handler, data, request, stream):
+        """
+        Check credentials and execute a call with its handler. Errors are
+        converted into JSON-RPC error responses.
+        """
+
+        stream = stream and not handler.is_notification(data)
+        try:
+            await run_sync(handler.check_credentials, request)
+            if isinstance(handler, AsyncRPCView):
+                response = await handler.execute(request, data)
+            else:
+                response = await run_sync(handler.execute, request, data)
+            result = response.get('result')
+            if isinstance(result, Stream) and not stream:
+                await materialize_stream(handler, response, result)
+        except BadResponseError as ex:
+            message = ex.response.content.decode('utf8', 'replace')
+            response = self.dispatcher.error_response(
+                data.get('id'), SERVER_ERROR, message or 'request failed')
+        except Exception as ex:
+            log.exception('error in websocket call %r' % data.get('method'))
+            response = self.dispatcher.error_response(
+                data.get('id'), INTERNAL_ERROR, str(ex))
+        return response
+
+    async def send(self, data):
+        """
+        Encode data and send it in a text frame.
+        """
+
+        try:
+            raw = self.dispatcher.get_raw_response(self.request, data)
+        except BadResponseError:
+            id = data.get('id') if isinstance(data, dict) else None
+            raw = self.dispatcher.get_raw_response(
+                self.request, self.dispatcher.error_response(
+                    id, INTERNAL_ERROR, 'could not encode response'))
+        await self.send_raw(raw)
+
+    async def send_raw(self, text):
+        async with self._send_lock:
+            await self._send({'type': 'websocket.send', 'text': text})
+
+
+async def materialize_stream(handler, response, stream):
+    """
+    Replace a streamed result in response by the list of its items.
+    """
+
+    try:
+        response['result'] = await stream.amaterialize()
+    except Exception as ex:
+        del response['result']
+        response['error'] = handler.wrap_error(ex, ex.__traceback__,
+                                               wrap_permission_errors=True)
+
+
+async def run_sync(func, *args):
+    """
+    Run a blocking function in the shared thread pool.
+    """
+
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(get_executor(),
+                                      closing_connections(func), *args)
+
+
+def _headers(scope):
+    return {k.decode('latin1').lower(): v.decode('latin1')
+            for k, v in scope.get('headers', ())}
+
+
+def make_request(scope):
+    """
+    Create an HttpRequest from the scope of a WebSocket connection.
+    """
+
+    request = http.HttpRequest()
+    request.method = 'GET'
+    request.path = request.path_info = scope.get('path', '/')
+    meta = request.META
+    meta['QUERY_STRING'] = scope.get('query_string', b'').decode('latin1')
+    client = scope.get('client')
+    if client:
+        meta['REMOTE_ADDR'] = client[0]
+    server = scope.get('server')
+    if server:
+        meta['SERVER_NAME'], meta['SERVER_PORT'] = server[0], str(server[1])
+    for name, value in _headers(scope).items():
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        if key in meta:
+            value = meta[key] + ',' + value
+        meta[key] = value
+    request.COOKIES = http.parse_cookie(meta.get('HTTP_COOKIE', ''))
+    return request
+
+
+def get_session_user(request):
+    """
+    Return the user authenticated in the session of the request.
+    """
+
+    from importlib import import_module
+    from django.conf import settings
+    from django.contrib.auth import get_user
+
+    engine = import_module(settings.SESSION_ENGINE)
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    request.session = engine.SessionStore(session_key)
+    return get_user(request)
+
+
+def asgi_router(http_app, websocket_apps):
+    """
+    Return an ASGI application that routes WebSocket connections by path to
+    the given applications and everything else to http_app.
+
+    Args:
+        http_app:
+            The main ASGI application (usually Django's).
+        websocket_apps:
+            A mapping from paths to WebSocket applications.
+    """
+
+    async def application(scope, receive, send):
+        if scope['type'] == 'websocket':
+            app = websocket_apps.get(scope.get('path'))
+            if app is None:
+                await receive()
+                await send({'type': 'websocket.close'})
+                return
+            return await app(scope, receive, send)
+        return await http_app(scope, receive, send)
+
+    return application
+
+
+class WebSocketTestClient:
+    """
+    In-process client for testing WebSocket applications without a server.
+
+    Usage::
+
+        async with WebSocketTestClient(WebSocketRPC()) as client:
+            assert await client.call('myapp.add', 1, 2) == 3
+
+    Args:
+        app:
+            The ASGI application.
+        path:
+            Path of the connection.
+        headers:
+            List of (name, value) header pairs sent in the handshake.
+        user:
+            If given, it is passed in scope['user'].
+    """
+
+    def __init__(self, app, path='/', headers=(), user=None):
+        self.app = app
+        self.scope = {
+            'type': 'websocket',
+            'path': path,
+            'query_string': b'',
+            'headers': [(k.encode('latin1'), v.encode('latin1'))
+                        for k, v in headers],
+        }
+        if user is not None:
+            self.scope['user'] = user
+        self.accepted = False
+        self.close_code = None
+        self._incoming = asyncio.Queue()
+        self._outgoing = asyncio.Queue()
+        self._task = None
+        self._next_id = 0
+
+    async def __aenter__(self):
+        if not await self.connect():
+            raise ConnectionError('connection rejected: %s' % self.close_code)
+        return self
+
+    async def __aexit__(self, *args):
+        await self.disconnect()
+
+    async def connect(self):
+        """
+        Perform the handshake and return True if the connection was
+        accepted.
+        """
+
+        self._task = asyncio.ensure_future(
+            self.app(self.scope, self._incoming.get, self._outgoing.put))
+        await self._incoming.put({'type': 'websocket.connect'})
+        message = await self._next_message()
+        if message['type'] == 'websocket.accept':
+            self.accepted = True
+        else:
+            self.close_code = message.get('code', 1000)
+        return self.accepted
+
+    async def disconnect(self, code=1000):
+        await self._incoming.put({'type': 'websocket.disconnect',
+                                  'code': code})
+        if self._task is not None:
+            await asyncio.wait_for(self._task, 5)
+
+    async def send(self, payload):
+        """
+        Send a JSON-encoded payload.
+        """
+
+        from bricks.json import dumps
+        text = payload if isinstance(payload, str) else dumps(payload)
+        await self._incoming.put({'type': 'websocket.receive', 'text': text})
+
+    async def receive(self, timeout=5):
+        """
+        Return the next decoded message sent by the application.
+        """
+
+        message = await self._next_message(timeout)
+        if message['type'] == 'websocket.close':
+            self.close_code = message.get('code', 1000)
+            raise ConnectionError('connection closed: %s' % self.close_code)
+        return loads(message['text'])
+
+    async def call(self, method, *args, **kwargs):
+        """
+        Call a remote function and return its result.
+
+        Raises RuntimeError if the call fails.
+        """
+
+        self._next_id += 1
+        params = dict(kwargs)
+        if args:
+            params['*args'] = list(args)
+        await self.send({'jsonrpc': '2.0', 'method': method,
+                         'params': params, 'id': self._next_id})
+        response = await self.receive()
+        if 'error' in response:
+            raise RuntimeError(response['error']['message'])
+        return response['result']
+
+    async def _next_message(self, timeout=5):
+        get = asyncio.ensure_future(self._outgoing.get())
+        done, _ = await asyncio.wait([get, self._task], timeout=timeout,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        if get in done:
+            return get.result()
+        get.cancel()
+        if self._task in done:
+            self._task.result()
+            raise ConnectionError('application finished without a response')
+        raise asyncio.TimeoutError
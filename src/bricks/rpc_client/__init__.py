@@ -0,0 +1,26 @@
+"""
+Python clients for Bricks RPC end points.
+
+:class:`RPCClient` and :class:`AsyncRPCClient` call functions exposed with
+:func:`bricks.rpc.api` from other Python processes. Payloads are encoded with
+:mod:`bricks.json`, so '@' types (dates, sets, tuples, etc.) round trip
+transparently. HTTP connections are kept alive and reused between calls, and
+several calls can be sent in a single batch request::
+
+    client = RPCClient('http://localhost:8000/api/')
+    client.call('myapp.add', 1, 2)
+
+    with client.batch() as batch:
+        x = batch.call('myapp.add', 1, 2)
+        y = batch.call('myapp.mul', 2, 3)
+    x.result(), y.result()
+
+.. autoclass:: RPCClient
+   :members:
+
+.. autoclass:: AsyncRPCClient
+   :members:
+"""
+
+from .client import RPCClient, RPCError, TransportError, Batch, BatchResult
+from .aio import AsyncRPCClient, AsyncBatch
@@ -0,0 +1,374 @@
+"""
+Asyncio client for Bricks RPC end points.
+
+HTTP/1.1 is implemented directly on top of asyncio streams, so no third
+party HTTP library is required.
+"""
+import asyncio
+
+from bricks.json import dumps, loads
+from .client import (BaseRPCClient, Batch, RPCError, IDEMPOTENT_METHODS,
+                     NotSentError, check_response, group_by_url, set_results,
+                     stream_items)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def is_closed(connection):
+    """
+    Return True if a (reader, writer) connection was closed by either side.
+    """
+
+    reader, writer = connection
+    return reader.at_eof() or writer.transport.is_closing()
+
+
+class AsyncResponse:
+    """
+    Status and headers of an HTTP response. The body is read with
+    :meth:`AsyncConnectionPool.read` or iterated with :meth:`chunks`.
+    """
+
+    def __init__(self, connection, status, reason, headers, will_close,
+                 timeout=None):
+        self.connection = connection
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.will_close = will_close
+        self.timeout = timeout
+        self.finished = status in (204, 304)
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    async def chunks(self):
+        """
+        Iterate over the pieces of the response body as they arrive.
+
+        Each read fails with asyncio.TimeoutError if no data arrives within
+        the timeout of the pool.
+        """
+
+        if self.finished:
+            return
+        if 'chunked' in self.getheader('transfer-encoding', ''):
+            body = self._read_chunked()
+        elif 'content-length' in self.headers:
+            body = self._read_length(int(self.headers['content-length']))
+        else:
+            body = self._read_until_eof()
+        async for data in body:
+            yield data
+        self.finished = True
+
+    async def _read_chunked(self):
+        read = self._read
+        reader = self.connection[0]
+        while True:
+            size = int((await read(reader.readline())).split(b';')[0], 16)
+            if size == 0:
+                break
+            data = await read(reader.readexactly(size))
+            await read(reader.readline())
+            yield data
+
+        # Trailers
+        while (await read(reader.readline())).strip():
+            pass
+
+    async def _read_length(self, remaining):
+        reader = self.connection[0]
+        while remaining > 0:
+            data = await self._read(reader.read(min(remaining, 65536)))
+            if not data:
+                raise ConnectionError('incomplete response body')
+            remaining -= len(data)
+            yield data
+
+    async def _read_until_eof(self):
+        reader = self.connection[0]
+        while True:
+            data = await self._read(reader.read(65536))
+            if not data:
+                break
+            yield data
+
+    def _read(self, coro):
+        return asyncio.wait_for(coro, self.timeout)
+
+    async def lines(self):
+        """
+        Iterate over the lines of the response body.
+        """
+
+        buffer = b''
+        async for data in self.chunks():
+            buffer += data
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                yield line
+        if buffer:
+            yield buffer
+
+
+class AsyncConnectionPool:
+    """
+    A pool of persistent HTTP connections to a single host.
+
+    Connections are (reader, writer) pairs of asyncio streams. See
+    :class:`bricks.rpc_client.client.ConnectionPool` for arguments.
+    """
+
+    def __init__(self, scheme, host, port=None, maxsize=4, timeout=30):
+        if scheme not in DEFAULT_PORTS:
+            raise ValueError('unsupported scheme: %r' % scheme)
+        self.scheme = scheme
+        self.host = host
+        self.port = port or DEFAULT_PORTS[scheme]
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._idle = []
+
+    async def get(self):
+        """
+        Return a tuple (connection, reused) with an idle connection or a new
+        one.
+        """
+
+        while self._idle:
+            connection = self._idle.pop()
+            if not is_closed(connection):
+                return connection, True
+            connection[1].close()
+        connection = await asyncio.wait_for(asyncio.open_connection(
+            self.host, self.port, ssl=self.scheme == 'https'), self.timeout)
+        return connection, False
+
+    def put(self, connection):
+        if len(self._idle) < self.maxsize:
+            self._idle.append(connection)
+        else:
+            connection[1].close()
+
+    def close(self):
+        """
+        Close all idle connections.
+        """
+
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            writer.close()
+
+    async def request(self, method, path, body=b'', headers=None):
+        """
+        Send a request and return an :class:`AsyncResponse`.
+        """
+
+        if isinstance(body, str):
+            body = body.encode('utf8')
+        lines = ['%s %s HTTP/1.1' % (method, path),
+                 'Host: %s' % self.host_header(),
+                 'Content-Length: %s' % len(body)]
+        lines.extend('%s: %s' % item for item in (headers or {}).items())
+        head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin1')
+
+        retry = method in IDEMPOTENT_METHODS
+        while True:
+            connection, reused = await self.get()
+            try:
+                return await asyncio.wait_for(
+                    self._send(connection, head + body), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError) as ex:
+                connection[1].close()
+                if reused and (retry or isinstance(ex, NotSentError)):
+                    continue
+                raise
+            except BaseException:
+                connection[1].close()
+                raise
+
+    def host_header(self):
+        if self.port == DEFAULT_PORTS[self.scheme]:
+            return self.host
+        return '%s:%s' % (self.host, self.port)
+
+    async def _send(self, connection, data):
+        reader, writer = connection
+        if is_closed(connection):
+            raise NotSentError('connection closed by server')
+        writer.write(data)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('connection closed by server')
+        parts = status_line.decode('latin1').rstrip('\r\n').split(' ', 2)
+        version, status, reason = (parts + [''])[:3]
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if not line.strip():
+                break
+            name, _, value = line.decode('latin1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        connection_header = headers.get('connection', '').lower()
+        if version == 'HTTP/1.0':
+            keep_alive = connection_header == 'keep-alive'
+        else:
+            keep_alive = connection_header != 'close'
+        framed = 'content-length' in headers or \
+            'chunked' in headers.get('transfer-encoding', '')
+        return AsyncResponse(connection, int(status), reason, headers,
+                             not (keep_alive and framed), self.timeout)
+
+    async def read(self, response):
+        """
+        Read the whole response body and release its connection.
+        """
+
+        try:
+            data = b''.join([chunk async for chunk in response.chunks()])
+        except BaseException:
+            response.connection[1].close()
+            raise
+        self.release(response)
+        return data
+
+    def release(self, response):
+        if response.will_close or not response.finished:
+            response.connection[1].close()
+        else:
+            self.put(response.connection)
+
+
+class AsyncRPCClient(BaseRPCClient):
+    """
+    Asyncio version of :class:`bricks.rpc_client.RPCClient`.
+
+    Usage::
+
+        async with AsyncRPCClient('http://localhost:8000/api/') as client:
+            result = await client.call('myapp.add', 1, 2)
+
+    The client must be used from a single event loop.
+    """
+
+    pool_class = AsyncConnectionPool
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Close all idle connections.
+        """
+
+        for pool in self.take_pools():
+            pool.close()
+
+    async def call(self, method, *args, **kwargs):
+        """
+        Call a remote function and return its result.
+        """
+
+        url, payload = self.make_call(method, args, kwargs)
+        response = await self.post(url, payload)
+        if isinstance(response, list):
+            return stream_items(response)
+        return check_response(response)
+
+    async def notify(self, method, *args, **kwargs):
+        """
+        Call a remote function without waiting for its result.
+        """
+
+        url, payload = self.make_call(method, args, kwargs, notify=True)
+        await self.post(url, payload)
+
+    async def stream(self, method, *args, **kwargs):
+        """
+        Call a generator function and iterate over its items as they arrive.
+        """
+
+        url, payload = self.make_call(method, args, kwargs)
+        pool, path = self.get_pool(url)
+        response = await pool.request('POST', path, dumps(payload),
+                                      self.get_headers())
+        if response.status != 200 or not self.is_stream(response):
+            data = self.decode_response(response, await pool.read(response))
+            result = check_response(data)
+            for item in (result if isinstance(result, list) else [result]):
+                yield item
+            return
+
+        try:
+            async for line in response.lines():
+                if not line.strip():
+                    continue
+                data = loads(line)
+                if 'partial' in data:
+                    yield data['partial']
+                else:
+                    check_response(data)
+        finally:
+            pool.release(response)
+
+    def batch(self):
+        """
+        Return an :class:`AsyncBatch` that sends several calls in a single
+        request.
+        """
+
+        return AsyncBatch(self)
+
+    async def post(self, url, payload):
+        """
+        Send a JSON-RPC payload and return the decoded response.
+        """
+
+        pool, path = self.get_pool(url)
+        response = await pool.request('POST', path, dumps(payload),
+                                      self.get_headers())
+        return self.decode_response(response, await pool.read(response))
+
+
+class AsyncBatch(Batch):
+    """
+    Asyncio version of :class:`bricks.rpc_client.client.Batch`::
+
+        async with client.batch() as batch:
+            x = batch.call('myapp.add', 1, 2)
+        print(x.result())
+    """
+
+    def __enter__(self):
+        raise TypeError('use "async with client.batch()" to send an '
+                        'asynchronous batch')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, *args):
+        if exc_type is None:
+            await self.send()
+
+    async def send(self):
+        calls, self.calls = self.calls, []
+        groups = list(group_by_url(calls).items())
+        replies = await asyncio.gather(
+            *[self.client.post(url, [payload for payload, _ in group])
+              for url, group in groups], return_exceptions=True)
+        for (url, group), responses in zip(groups, replies):
+            if isinstance(responses, RPCError):
+                for _, result in group:
+                    if result is not None:
+                        result.set_error(responses)
+            elif isinstance(responses, BaseException):
+                raise responses
+            else:
+                set_results(group, responses or [])
@@ -0,0 +1,576 @@
+"""
+Synchronous client for Bricks RPC end points.
+"""
+import http.client
+import itertools
+import select
+import threading
+from urllib.parse import urljoin, urlsplit
+
+from bricks.json import dumps, loads
+from bricks.rpc.views import JsAction
+
+STREAM_CONTENT_TYPE = 'application/x-ndjson'
+
+# Errors raised when an idle keep-alive connection was closed by the server.
+# Idempotent requests that fail with these errors on a reused connection are
+# retried with a fresh connection. Other requests (e.g., JSON-RPC POSTs) might
+# have been executed by the server, so they are only retried if nothing was
+# sent (see NotSentError).
+RETRY_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                ConnectionResetError, BrokenPipeError)
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS',
+                                'TRACE'])
+
+
+class NotSentError(ConnectionResetError):
+    """
+    Raised when a connection is found closed before the request is sent.
+    """
+
+
+class RPCError(Exception):
+    """
+    Error returned by a remote function.
+
+    Attributes:
+        code:
+            JSON-RPC error code.
+        message:
+            Error message.
+        data:
+            Extra data sent by the server (e.g., the name of the exception).
+    """
+
+    def __init__(self, code, message, data=None):
+        super().__init__(code, message, data)
+        self.code = code
+        self.message = message
+        self.data = data
+
+    def __str__(self):
+        return '[%s] %s' % (self.code, self.message)
+
+    @classmethod
+    def from_response(cls, error):
+        return cls(error.get('code', 0), error.get('message', ''),
+                   error.get('data'))
+
+
+class TransportError(RPCError):
+    """
+    Raised when the server does not answer with a JSON-RPC response, e.g.,
+    for HTTP errors.
+
+    Attributes:
+        status:
+            HTTP status code.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(None, message)
+        self.status = status
+
+    def __str__(self):
+        return 'HTTP %s: %s' % (self.status, self.message)
+
+
+def make_params(args, kwargs):
+    """
+    Return the "params" field for a call with the given arguments.
+    """
+
+    if not kwargs:
+        return list(args)
+    params = dict(kwargs)
+    if args:
+        params['*args'] = list(args)
+    return params
+
+
+def unwrap_result(result):
+    """
+    Return the result of a call, discarding client programs.
+    """
+
+    if isinstance(result, JsAction):
+        return result.result
+    return result
+
+
+def check_response(response):
+    """
+    Return the result from a decoded response object or raise RPCError.
+    """
+
+    if 'error' in response:
+        raise RPCError.from_response(response['error'])
+    return unwrap_result(response.get('result'))
+
+
+class ConnectionPool:
+    """
+    A pool of persistent HTTP connections to a single host.
+
+    Args:
+        scheme:
+            Either "http" or "https".
+        host, port:
+            Address of the server.
+        maxsize:
+            Maximum number of idle connections kept in the pool.
+        timeout:
+            Socket timeout in seconds.
+    """
+
+    def __init__(self, scheme, host, port=None, maxsize=4, timeout=30):
+        if scheme == 'https':
+            self.connection_class = http.client.HTTPSConnection
+        elif scheme == 'http':
+            self.connection_class = http.client.HTTPConnection
+        else:
+            raise ValueError('unsupported scheme: %r' % scheme)
+        self.host = host
+        self.port = port
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Return a tuple (connection, reused) with an idle connection or a new
+        one.
+        """
+
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection = self._idle.pop()
+            if not is_dropped(connection):
+                return connection, True
+            connection.close()
+        return self.connection_class(self.host, self.port,
+                                     timeout=self.timeout), False
+
+    def put(self, connection):
+        """
+        Return a connection to the pool.
+        """
+
+        with self._lock:
+            if len(self._idle) < self.maxsize:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        """
+        Close all idle connections.
+        """
+
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def request(self, method, path, body=None, headers=None):
+        """
+        Send a request and return the http.client.HTTPResponse object.
+
+        The connection is returned to the pool after the response is read
+        with :meth:`read` or released with :meth:`release`.
+        """
+
+        retry = method in IDEMPOTENT_METHODS
+        while True:
+            connection, reused = self.get()
+            try:
+                connection.request(method, path, body, headers or {})
+                response = connection.getresponse()
+            except RETRY_ERRORS:
+                connection.close()
+                if reused and retry:
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            response.connection = connection
+            return response
+
+    def read(self, response):
+        """
+        Read the whole response body and release its connection.
+        """
+
+        try:
+            data = response.read()
+        except Exception:
+            response.connection.close()
+            raise
+        self.release(response)
+        return data
+
+    def release(self, response):
+        connection = response.connection
+        if response.will_close or not response.isclosed():
+            connection.close()
+        else:
+            self.put(connection)
+
+
+def is_dropped(connection):
+    """
+    Return True if an idle connection was closed by the server.
+
+    Idle keep-alive connections never have data to read, so a readable
+    socket means that the server closed it (or sent garbage).
+    """
+
+    sock = connection.sock
+    if sock is None:
+        return False
+    try:
+        return bool(select.select([sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+
+class BaseRPCClient:
+    """
+    Common functionality of :class:`RPCClient` and
+    :class:`bricks.rpc_client.aio.AsyncRPCClient`.
+    """
+
+    pool_class = None
+
+    def __init__(self, url, headers=None, timeout=30, pool_size=4):
+        self.url = url
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def make_call(self, method, args, kwargs, notify=False):
+        """
+        Return a tuple (url, payload) for a call.
+        """
+
+        url = urljoin(self.url, method) if method.startswith('/') \
+            else self.url
+        payload = {'jsonrpc': '2.0', 'method': method,
+                   'params': make_params(args, kwargs)}
+        if not notify:
+            payload['id'] = next(self._ids)
+        return url, payload
+
+    def get_pool(self, url):
+        """
+        Return a tuple (pool, path) for the given URL.
+        """
+
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        with self._lock:
+            try:
+                pool = self._pools[key]
+            except KeyError:
+                pool = self._pools[key] = self.pool_class(
+                    parts.scheme, parts.hostname, parts.port,
+                    maxsize=self.pool_size, timeout=self.timeout)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        return pool, path
+
+    def take_pools(self):
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        return pools
+
+    def get_headers(self):
+        headers = {'Content-Type': 'application/json',
+                   'Accept': 'application/json, %s' % STREAM_CONTENT_TYPE}
+        headers.update(self.headers)
+        return headers
+
+    def is_stream(self, response):
+        content_type = response.getheader('Content-Type', '')
+        return content_type.startswith(STREAM_CONTENT_TYPE)
+
+    def decode_response(self, response, data):
+        """
+        Decode the body of a response.
+
+        Streamed responses are returned as a list of line objects. Return
+        None for requests without responses (notifications).
+        """
+
+        status = response.status
+        if status == 204:
+            return None
+        if status != 200:
+            message = data.decode('utf8', 'replace') or response.reason
+            raise TransportError(status, message)
+        if self.is_stream(response):
+            return [loads(line) for line in data.splitlines() if line.strip()]
+        return loads(data)
+
+
+class RPCClient(BaseRPCClient):
+    """
+    Client for Bricks RPC end points.
+
+    Connections are kept alive and reused between calls. The client is
+    thread safe.
+
+    Usage::
+
+        client = RPCClient('http://localhost:8000/api/')
+        client.call('myapp.add', 1, 2)          # dispatcher end point
+        client.call('/api/add/', 1, y=2)        # per-function end point
+
+    Methods that start with a slash are paths of per-function end points
+    (relative to the base URL). Other methods are sent to the base URL.
+
+    Args:
+        url:
+            Base URL of the RPC end point.
+        headers:
+            Extra HTTP headers sent with each request (e.g., Authorization,
+            Cookie or X-CSRFToken).
+        timeout:
+            Socket timeout in seconds.
+        pool_size:
+            Maximum number of idle connections kept for each host.
+    """
+
+    pool_class = ConnectionPool
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Close all idle connections.
+        """
+
+        for pool in self.take_pools():
+            pool.close()
+
+    def call(self, method, *args, **kwargs):
+        """
+        Call a remote function and return its result.
+
+        Results of generator functions are returned as lists. Errors are
+        raised as :class:`RPCError`.
+        """
+
+        url, payload = self.make_call(method, args, kwargs)
+        response = self.post(url, payload)
+        if isinstance(response, list):
+            return stream_items(response)
+        return check_response(response)
+
+    def notify(self, method, *args, **kwargs):
+        """
+        Call a remote function without waiting for its result.
+        """
+
+        url, payload = self.make_call(method, args, kwargs, notify=True)
+        self.post(url, payload)
+
+    def stream(self, method, *args, **kwargs):
+        """
+        Call a generator function and iterate over its items as they arrive.
+        """
+
+        url, payload = self.make_call(method, args, kwargs)
+        pool, path = self.get_pool(url)
+        response = pool.request('POST', path, dumps(payload),
+                                self.get_headers())
+        if response.status != 200 or not self.is_stream(response):
+            data = self.decode_response(response, pool.read(response))
+            result = check_response(data)
+            yield from (result if isinstance(result, list) else [result])
+            return
+
+        try:
+            for line in response:
+                if not line.strip():
+                    continue
+                data = loads(line)
+                if 'partial' in data:
+                    yield data['partial']
+                else:
+                    check_response(data)
+        finally:
+            if response.isclosed():
+                pool.release(response)
+            else:
+                response.connection.close()
+
+    def batch(self):
+        """
+        Return a :class:`Batch` that sends several calls in a single request.
+        """
+
+        return Batch(self)
+
+    def post(self, url, payload):
+        """
+        Send a JSON-RPC payload and return the decoded response.
+        """
+
+        pool, path = self.get_pool(url)
+        response = pool.request('POST', path, dumps(payload),
+                                self.get_headers())
+        return self.decode_response(response, pool.read(response))
+
+
+def stream_items(lines):
+    """
+    Return the list of items from the decoded lines of a streamed response.
+    """
+
+    items = []
+    for line in lines:
+        if 'partial' in line:
+            items.append(line['partial'])
+        else:
+            check_response(line)
+    return items
+
+
+class Batch:
+    """
+    Collects calls and sends them in a single request for each end point.
+
+    Usage::
+
+        with client.batch() as batch:
+            x = batch.call('myapp.add', 1, 2)
+            y = batch.call('myapp.mul', 2, 3)
+        print(x.result(), y.result())
+
+    Calls are sent when the block exits or when :meth:`send` is called.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.send()
+
+    def call(self, method, *args, **kwargs):
+        """
+        Add a call to the batch and return a :class:`BatchResult`.
+        """
+
+        url, payload = self.client.make_call(method, args, kwargs)
+        result = BatchResult(payload['id'])
+        self.calls.append((url, payload, result))
+        return result
+
+    def notify(self, method, *args, **kwargs):
+        """
+        Add a notification to the batch.
+        """
+
+        url, payload = self.client.make_call(method, args, kwargs,
+                                             notify=True)
+        self.calls.append((url, payload, None))
+
+    def send(self):
+        """
+        Send all pending calls.
+        """
+
+        calls, self.calls = self.calls, []
+        for url, group in group_by_url(calls).items():
+            payload = [payload for payload, _ in group]
+            try:
+                responses = self.client.post(url, payload) or []
+            except RPCError as ex:
+                for _, result in group:
+                    if result is not None:
+                        result.set_error(ex)
+                continue
+            set_results(group, responses)
+
+
+class BatchResult:
+    """
+    Result of a call in a batch.
+    """
+
+    def __init__(self, id):
+        self.id = id
+        self.done = False
+        self._value = None
+        self._error = None
+
+    def __repr__(self):
+        if not self.done:
+            return '<BatchResult: pending>'
+        return '<BatchResult: %r>' % (self._error or self._value,)
+
+    def set_result(self, value):
+        self._value = value
+        self.done = True
+
+    def set_error(self, error):
+        self._error = error
+        self.done = True
+
+    def result(self):
+        """
+        Return the result of the call or raise its error.
+        """
+
+        if not self.done:
+            raise RuntimeError('batch was not sent')
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+def group_by_url(calls):
+    groups = {}
+    for url, payload, result in calls:
+        groups.setdefault(url, []).append((payload, result))
+    return groups
+
+
+def set_results(group, responses):
+    """
+    Match the responses of a batch request to the results of a group of
+    calls.
+    """
+
+    by_id = {}
+    for response in responses:
+        by_id[response.get('id')] = response
+    for payload, result in group:
+        if result is None:
+            continue
+        response = by_id.get(payload['id'])
+        if response is None:
+            result.set_error(RPCError(None, 'missing response'))
+        elif 'error' in response:
+            result.set_error(RPCError.from_response(response['error']))
+        else:
+            result.set_result(unwrap_result(response.get('result')))
@@ -0,0 +1,44 @@
+import pytest
+
+from bricks.bench import percentile
+from bricks.bench import json as bench_json
+from bricks.bench import rpc as bench_rpc
+
+
+def test_percentile():
+    assert percentile([1, 2, 3, 4, 5], 50) == 3
+    assert percentile([1, 2, 3, 4, 5], 100) == 5
+    assert percentile([1, 2], 50) == 1.5
+
+
+def test_json_benchmark_smoke(capsys):
+    results = bench_json.run(['flat', 'dict-keys'], size=5, min_time=0.001)
+    assert len(results) == 8
+    assert all(r['ops'] > 0 for r in results)
+
+    bench_json.report(results)
+    assert 'bricks.dumps' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('mode', ['inprocess', 'client', 'wsgi'])
+def test_rpc_benchmark_smoke(mode, capsys, settings):
+    settings.MIDDLEWARE = [
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+    ]
+    bench_rpc.register_functions()
+    result = bench_rpc.run(mode, 'bench.echo', 'flat', size=3,
+                           concurrency=2, requests=20, warmup=1)
+    assert result['requests'] == 20
+    assert result['errors'] == 0
+    assert 0 < result['p50'] <= result['p95'] <= result['p99']
+
+    bench_rpc.report([result])
+    assert mode in capsys.readouterr().out
+
+
+def test_rpc_benchmark_counts_errors():
+    bench_rpc.register_functions()
+    result = bench_rpc.run('inprocess', 'bench.echo', params=[1, 2, 3],
+                           concurrency=1, requests=5, warmup=0)
+    assert result['errors'] == 5
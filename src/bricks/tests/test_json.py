@@ -1,7 +1,9 @@
 import datetime
+from collections import namedtuple
+
 from markupsafe import Markup
 
-from bricks.json import register, loads, dumps, encode, decode, JSONDecodeError, JSONEncodeError
+from bricks.json import register, loads, dumps, encode, decode, Table, JSONDecodeError, JSONEncodeError, LazyMapping, LazySequence, materialize, digest
 import bricks.json.encoders
 import pytest
 
@@ -51,6 +53,32 @@ def test_register_new_type():
     assert decode({'@': 'mod.Foo', 'data': {}}) == foo
 
 
+def test_register_schema():
+    Point = namedtuple('Point', ['x', 'y'])
+    register(Point, 'test.Point', fields={'x': float, 'y': float})
+
+    assert encode(Point(1, 2.0)) == {'@': 'test.Point', 'x': 1, 'y': 2.0}
+    assert loads(dumps([Point(1.0, 2.0)])) == [Point(1.0, 2.0)]
+
+    with pytest.raises(JSONEncodeError):
+        encode(Point('1', 2))
+    with pytest.raises(JSONDecodeError):
+        decode({'@': 'test.Point', 'x': 1})
+    with pytest.raises(JSONDecodeError):
+        decode({'@': 'test.Point', 'x': 1, 'y': '2'})
+
+
+def test_register_schema_with_nested_types():
+    Event = namedtuple('Event', ['name', 'date', 'tags'])
+    register(Event, 'test.Event',
+             fields={'name': str, 'date': datetime.date, 'tags': None})
+    event = Event('foo', datetime.date(1970, 1, 1), {'bar'})
+
+    assert loads(dumps(event)) == event
+    with pytest.raises(JSONEncodeError):
+        encode(Event('foo', '1970-01-01', set()))
+
+
 #
 # Test types
 #
@@ -79,6 +107,191 @@ def test_dict_encode():
 
 def test_round_trip(elem):
     assert decode(encode(elem)) == elem
+
+
+def test_register_lazy_type():
+    class Lazy:
+        pass
+
+    qualname = '%s.%s' % (Lazy.__module__, Lazy.__qualname__)
+    encode.register(qualname, 'lazy', lambda x: {'data': 42})
+    assert encode(Lazy()) == {'@': 'lazy', 'data': 42}
+
+
+def test_numpy_round_trip():
+    np = pytest.importorskip('numpy')
+    array = np.arange(12, dtype='int16').reshape(3, 4)
+    data = encode(array)
+
+    assert data['@'] == 'ndarray'
+    assert data['dtype'] == array.dtype.str
+    assert data['shape'] == [3, 4]
+    assert (loads(dumps(array)) == array).all()
+    assert (loads(dumps(array.T)) == array.T).all()
+
+
+def test_numpy_subclass_before_plain_array():
+    np = pytest.importorskip('numpy')
+    class Sub(np.ndarray):
+        pass
+
+    sub = np.arange(4).view(Sub)
+    assert type(loads(dumps(sub))) is np.ndarray
+    assert (loads(dumps(sub)) == sub).all()
+    array = np.arange(3)
+    assert (loads(dumps(array)) == array).all()
+
+    with pytest.raises(Exception):
+        dumps(np.ma.masked_array([1, 2], mask=[0, 1]))
+
+
+def test_lazy_dispatch_registers_matching_base_class():
+    from bricks.utils.generic import lazy_singledispatch
+
+    class Base:
+        pass
+
+    class Sub(Base):
+        pass
+
+    @lazy_singledispatch
+    def func(x):
+        return 'default'
+
+    func.register('%s.%s' % (Base.__module__, Base.__qualname__),
+                  lambda x: 'lazy')
+    assert func(Sub()) == 'lazy'
+    assert func(Base()) == 'lazy'
+    assert Base in func.registry and Sub not in func.registry
+
+
+def test_nested_containers_round_trip():
+    data = [{1, 2}, (1, {'x': (2, 3)}), [{'@': 'x'}]]
+    assert loads(dumps(data)) == data
+
+
+#
+# References
+#
+def test_encode_shared_references():
+    shared = {'name': 'foo'}
+    data = encode([shared, shared], refs=True)
+
+    assert data == [{'@': 'ref', 'id': 1, 'data': {'name': 'foo'}},
+                    {'@': 'ref', 'id': 1}]
+    assert encode([1, [2]], refs=True) == [1, [2]]
+
+
+def test_shared_references_round_trip():
+    shared = (1, 2)
+    rows = [{'row': i, 'shared': shared} for i in range(3)]
+    decoded = loads(dumps(rows, refs=True), refs=True)
+
+    assert decoded == rows
+    assert decoded[0]['shared'] is decoded[2]['shared']
+
+
+def test_recursive_structures_round_trip():
+    lst = [1]
+    lst.append(lst)
+    dic = {1: lst}
+    dic['self'] = dic
+
+    lst_ = loads(dumps(lst, refs=True), refs=True)
+    dic_ = loads(dumps(dic, refs=True), refs=True)
+    assert lst_[1] is lst_
+    assert dic_['self'] is dic_
+    assert dic_[1][1] is dic_[1]
+
+
+def test_refs_require_decode_option():
+    data = encode([[1], [1]] * 2, refs=True)
+
+    with pytest.raises(JSONDecodeError):
+        decode(data)
+
+
+#
+# Tables
+#
+def test_encode_table():
+    rows = [{'name': 'john', 'age': 42}, {'name': 'paul', 'age': 38}]
+
+    assert encode(Table(rows)) == {
+        '@': 'table',
+        'columns': ['name', 'age'],
+        'rows': [['john', 42], ['paul', 38]],
+    }
+    assert encode(rows, tables=2) == encode(Table(rows))
+    assert encode(rows, tables=3) == rows
+    assert encode(rows + [{'name': 'george'}], tables=2)[0] == rows[0]
+
+
+def test_table_round_trip():
+    rows = [{'id': i, 'tags': {'a', 'b'}} for i in range(5)]
+    assert loads(dumps(Table(rows))) == rows
+    assert loads(dumps(rows, tables=1)) == rows
+    assert loads(dumps(Table())) == []
+
+
+def test_invalid_table():
+    with pytest.raises(JSONEncodeError):
+        encode(Table([{'a': 1}, {'b': 2}]))
+
+
+#
+# Lazy decoding
+#
+def test_lazy_decode():
+    data = {'x': [1, {'@': 'set', 'data': [1, 2]}], 'y': {'z': 1}}
+    lazy = decode(data, lazy=True)
+
+    assert isinstance(lazy, LazyMapping)
+    assert isinstance(lazy['x'], LazySequence)
+    assert isinstance(lazy['y'], LazyMapping)
+    assert lazy['x'][1] == {1, 2}
+    assert lazy['x'][-1] is lazy['x'][1]
+    assert lazy == decode(data)
+    assert materialize(lazy) == decode(data)
+    assert type(materialize(lazy)['y']) is dict
+
+
+def test_lazy_sequence_index_out_of_range():
+    lazy = decode([1, 2], lazy=True)
+    assert lazy[-2] == 1
+    with pytest.raises(IndexError):
+        lazy[-3]
+    with pytest.raises(IndexError):
+        lazy[2]
+
+
+def test_lazy_proxies_are_encoded_as_raw_data():
+    data = {'x': [1, {'@': 'set', 'data': [1, 2]}], 'y': {'z': 1}}
+    lazy = loads(dumps(data), lazy=True)
+    assert loads(dumps(lazy)) == data
+    assert loads(dumps(lazy['x'])) == data['x']
+    assert encode(lazy['y']) == {'z': 1}
+    assert encode(lazy) == encode(data)
+
+
+#
+# Canonical encoding
+#
+def test_canonical_dumps():
+    assert dumps({'b': 1.0, 'a': [-0.0, 0.5]}, canonical=True) == \
+        '{"a":[0,0.5],"b":1}'
+    assert dumps({'b', 'a', 'c'}, canonical=True) == \
+        '{"@":"set","data":["a","b","c"]}'
+    assert loads(dumps({3: 'x', 1: 'y'}, canonical=True)) == {3: 'x', 1: 'y'}
+
+
+def test_digest():
+    assert digest({'a': 1, 'b': {2, 1}}) == digest({'b': {1, 2}, 'a': 1.0})
+    assert digest({1: 'a', 2: 'b'}) == digest({2: 'b', 1: 'a'})
+    assert digest([1, 2]) != digest([2, 1])
+    assert len(digest(None)) == 40
+
+
 #
 # Test errors
 #
@@ -106,3 +319,6 @@ def test_register_error():
 
     with pytest.raises(ValueError):
         register(Foo, 'foo-foo', decode=lambda x: None)
+
+    with pytest.raises(TypeError):
+        register(Foo, 'foo-foo', fields=True)
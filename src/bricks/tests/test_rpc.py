@@ -0,0 +1,1154 @@
+import asyncio
+import gc
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory
+
+from bricks.json import dumps, loads, LazyMapping
+from bricks.rpc import RPCView, AsyncRPCView, BricksRPCDispatchView
+from bricks.rpc.cache import DjangoResultCache, LRUResultCache
+from bricks.rpc.binding import Binder, InvalidParams
+from bricks.rpc.decorators import api, page_method
+from bricks.rpc.dispatch import __bricks_registry__
+from bricks.rpc.executors import BoundedSubmitter
+from bricks.rpc.jobs import Job, MemoryJobStore, get_job_store, job_status
+from bricks.rpc.limits import ConcurrencyLimiter
+from bricks.rpc.metrics import (PrometheusSink, RequestMetrics,
+                                get_metrics_sink, prometheus_view)
+from bricks.rpc.singleflight import SingleFlight
+from bricks.rpc.streaming import is_stream_function
+from bricks.rpc.websocket import WebSocketRPC, WebSocketTestClient
+
+
+def run_async(coro):
+    # asyncio.run() requires Python 3.7
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def rpc_request(payload, **extra):
+    request = RequestFactory().post('/api/', dumps(payload),
+                                    content_type='application/json', **extra)
+    request.user = AnonymousUser()
+    return request
+
+
+def rpc_call(view, params=None, id=1, **kwargs):
+    payload = {'jsonrpc': '2.0', 'method': 'func', 'id': id}
+    if params is not None:
+        payload['params'] = params
+    response = view(rpc_request(payload), **kwargs)
+    return loads(response.content.decode('utf8'))
+
+
+def add(client, x, y=0):
+    return x + y
+
+
+def test_call_function_with_named_arguments():
+    view = RPCView.as_view(function=add)
+    assert rpc_call(view, {'x': 1, 'y': 2}) == \
+        {'jsonrpc': '2.0', 'id': 1, 'result': 3}
+
+
+def test_call_function_with_positional_arguments():
+    view = RPCView.as_view(function=add)
+    assert rpc_call(view, [1, 2])['result'] == 3
+    assert rpc_call(view, {'*args': [1], 'y': 2})['result'] == 3
+
+
+def test_function_error():
+    view = RPCView.as_view(function=add)
+    error = rpc_call(view, {'x': 1, 'y': 'two'})['error']
+    assert error['data']['exception'] == 'builtins.TypeError'
+
+
+def test_lazy_decode():
+    def func(client, data):
+        assert isinstance(data, LazyMapping)
+        return data['selected']
+
+    view = RPCView.as_view(function=func, lazy_decode=True)
+    params = {'data': {'selected': {1, 2}, 'other': list(range(10))}}
+    assert rpc_call(view, params)['result'] == {1, 2}
+
+
+#
+# Batch requests
+#
+def rpc_batch(view, calls):
+    response = view(rpc_request(calls))
+    if response.status_code != 200:
+        return response
+    return loads(response.content.decode('utf8'))
+
+
+@pytest.fixture(params=[False, True], ids=['sequential', 'concurrent'])
+def batch_view(request):
+    return RPCView.as_view(function=add, concurrent_batch=request.param)
+
+
+def test_batch_request(batch_view):
+    calls = [{'jsonrpc': '2.0', 'method': 'add', 'params': [i, 1], 'id': i}
+             for i in range(5)]
+    responses = rpc_batch(batch_view, calls)
+    assert [r['result'] for r in responses] == [1, 2, 3, 4, 5]
+    assert [r['id'] for r in responses] == [0, 1, 2, 3, 4]
+
+
+def test_batch_with_invalid_calls_and_notifications(batch_view):
+    calls = [
+        {'jsonrpc': '2.0', 'method': 'add', 'params': [1, 1], 'id': 1},
+        {'jsonrpc': '2.0', 'method': 'add', 'params': [1, 1]},
+        {'foo': 'bar'},
+        42,
+    ]
+    responses = rpc_batch(batch_view, calls)
+    assert responses[0] == {'jsonrpc': '2.0', 'id': 1, 'result': 2}
+    assert len(responses) == 3
+    assert responses[1]['error']['code'] == -32600
+    assert responses[2]['error']['code'] == -32600
+
+
+def test_batch_answers_calls_with_null_id(batch_view):
+    calls = [{'jsonrpc': '2.0', 'method': 'add', 'params': [1, 1],
+              'id': None},
+             {'jsonrpc': '2.0', 'method': 'add', 'params': [2, 1], 'id': 1}]
+    responses = rpc_batch(batch_view, calls)
+    assert [r['result'] for r in responses] == [2, 3]
+
+
+def test_batch_of_notifications(batch_view):
+    calls = [{'jsonrpc': '2.0', 'method': 'add', 'params': [1, 1]}] * 2
+    assert rpc_batch(batch_view, calls).status_code == 204
+
+
+def test_invalid_requests():
+    view = RPCView.as_view(function=add)
+    assert rpc_batch(view, []).status_code == 400
+    assert rpc_batch(view, {'method': 'add'}).status_code == 400
+
+
+#
+# Async views
+#
+async def async_add(client, x, y=0):
+    await asyncio.sleep(0)
+    return x + y
+
+
+def async_call(view, payload):
+    response = run_async(view(rpc_request(payload)))
+    return loads(response.content.decode('utf8'))
+
+
+def test_async_function():
+    view = api(async_add).as_view()
+    payload = {'jsonrpc': '2.0', 'method': 'add', 'params': [1, 2], 'id': 1}
+    assert async_call(view, payload)['result'] == 3
+
+
+def test_async_view_with_sync_function():
+    view = AsyncRPCView.as_view(function=add)
+    payload = {'jsonrpc': '2.0', 'method': 'add', 'params': [1, 2], 'id': 1}
+    assert async_call(view, payload)['result'] == 3
+
+
+def test_async_batch():
+    view = AsyncRPCView.as_view(function=async_add, concurrent_batch=True)
+    calls = [{'jsonrpc': '2.0', 'method': 'add', 'params': [i, 1], 'id': i}
+             for i in range(3)]
+    assert [r['result'] for r in async_call(view, calls)] == [1, 2, 3]
+
+
+def test_async_batch_answers_calls_with_null_id():
+    view = AsyncRPCView.as_view(function=async_add)
+    calls = [{'jsonrpc': '2.0', 'method': 'add', 'params': [1, 1],
+              'id': None},
+             {'jsonrpc': '2.0', 'method': 'add', 'params': [2, 1]}]
+    assert [r['result'] for r in async_call(view, calls)] == [2]
+
+
+#
+# Result cache
+#
+def test_result_cache():
+    calls = []
+
+    def square(client, x):
+        calls.append(x)
+        return x * x
+
+    view = api(square, cache=True, ttl=60).as_view()
+    assert rpc_call(view, [2])['result'] == 4
+    assert rpc_call(view, {'x': 3})['result'] == 9
+    assert rpc_call(view, [2])['result'] == 4
+    assert calls == [2, 3]
+    assert square.cache.stats()['hits'] == 1
+
+    square.cache.invalidate(2)
+    assert rpc_call(view, [2])['result'] == 4
+    assert calls == [2, 3, 2]
+
+    square.cache.clear()
+    assert rpc_call(view, {'x': 3})['result'] == 9
+    assert calls == [2, 3, 2, 3]
+
+
+def test_django_result_cache_keeps_generation_in_memory():
+    from django.core.cache import caches
+
+    calls = []
+
+    class CountingCache(DjangoResultCache):
+        @property
+        def backend(self):
+            calls.append(1)
+            return caches['default']
+
+    cache = CountingCache('test.django-cache', ttl=60)
+    key = cache.make_key([1], {})
+    cache.set(key, 'value')
+    del calls[:]
+    assert cache.get(key) == 'value'
+    assert len(calls) == 1
+
+    cache.clear()
+    assert cache.get(key) is None
+    other = DjangoResultCache('test.django-cache', refresh_interval=0)
+    assert other.generation == cache.generation
+
+
+class NamedUser(AnonymousUser):
+    def __init__(self, pk, username):
+        self.pk = pk
+        self.username = username
+
+
+def test_result_cache_is_per_user_for_protected_functions():
+    def whoami(client):
+        return client.user.username
+
+    view = api(whoami, cache=True, login_required=True).as_view()
+    for user in [NamedUser(1, 'user1'), NamedUser(2, 'user2')]:
+        request = rpc_request({'jsonrpc': '2.0', 'method': 'whoami',
+                               'id': 1})
+        request.user = user
+        response = loads(view(request).content.decode('utf8'))
+        assert response['result'] == user.username
+    assert whoami.cache.stats()['misses'] == 2
+
+
+def test_result_cache_normalizes_arguments():
+    calls = []
+
+    def power(client, x, n=2):
+        calls.append(x)
+        return x ** n
+
+    view = api(power, cache=True).as_view()
+    assert rpc_call(view, [2])['result'] == 4
+    assert rpc_call(view, {'x': 2})['result'] == 4
+    assert rpc_call(view, [2, 2])['result'] == 4
+    assert calls == [2]
+
+    power.cache.invalidate(x=2)
+    assert rpc_call(view, [2])['result'] == 4
+    assert calls == [2, 2]
+
+
+def test_result_cache_do_not_store_js_actions():
+    calls = []
+
+    def greet(client):
+        calls.append(1)
+        client.js('alert("hello")')
+        return 'hello'
+
+    view = api(greet, cache=True).as_view()
+    assert rpc_call(view, [])['result'].result == 'hello'
+    assert rpc_call(view, [])['result'].result == 'hello'
+    assert len(calls) == 2
+
+
+def test_result_cache_do_not_store_errors():
+    calls = []
+
+    def fail(client):
+        calls.append(1)
+        raise ValueError
+
+    view = api(fail, cache=True).as_view()
+    assert 'error' in rpc_call(view, [])
+    assert 'error' in rpc_call(view, [])
+    assert len(calls) == 2
+
+
+def test_lru_result_cache():
+    cache = LRUResultCache('func', maxsize=2)
+    for key in 'abc':
+        cache.set(key, key.upper())
+    assert cache.get('a') is None
+    assert cache.get('c') == 'C'
+    assert len(cache) == 2
+
+
+#
+# Dispatcher
+#
+def dispatch_call(view, method, params, id=1):
+    payload = {'jsonrpc': '2.0', 'method': method, 'params': params, 'id': id}
+    return loads(view(rpc_request(payload)).content.decode('utf8'))
+
+
+@pytest.fixture
+def dispatch_view():
+    def mul(client, x, y):
+        return x * y
+
+    def secret(client):
+        return 42
+
+    api(mul, name='test.mul', register=True)
+    api(async_add, name='test.async-add', register=True)
+    api(secret, name='test.secret', perms_required=['auth.add_user'],
+        register=True)
+    return BricksRPCDispatchView.as_view()
+
+
+def test_dispatch_routes_by_method(dispatch_view):
+    assert dispatch_call(dispatch_view, 'test.mul', [2, 3])['result'] == 6
+    response = dispatch_call(dispatch_view, 'test.async-add', [2, 3])
+    assert response['result'] == 5
+
+
+def test_dispatch_unknown_method(dispatch_view):
+    error = dispatch_call(dispatch_view, 'test.missing', [])['error']
+    assert error['code'] == -32601
+
+
+def test_dispatch_checks_credentials_per_call(dispatch_view):
+    payload = {'jsonrpc': '2.0', 'method': 'test.secret', 'id': 1}
+    assert dispatch_view(rpc_request(payload)).status_code == 403
+
+    calls = [{'jsonrpc': '2.0', 'method': 'test.secret', 'id': 1},
+             {'jsonrpc': '2.0', 'method': 'test.mul', 'params': [2, 2],
+              'id': 2}]
+    responses = rpc_batch(dispatch_view, calls)
+    assert responses[0]['error']['code'] == -32000
+    assert responses[1]['result'] == 4
+
+
+class PermUser(AnonymousUser):
+    def __init__(self, perms):
+        self.perms = perms
+        self.checks = []
+
+    def has_perm(self, perm, obj=None):
+        self.checks.append(perm)
+        return perm in self.perms
+
+
+def test_permission_checks_are_memoized_per_request():
+    def secret(client, x):
+        return x
+
+    registry = {'test.secret': RPCView(
+        function=secret, perms_required=['auth.view_user', 'auth.add_user'])}
+    view = BricksRPCDispatchView.as_view(registry=registry)
+    calls = [{'jsonrpc': '2.0', 'method': 'test.secret', 'params': [i],
+              'id': i} for i in range(5)]
+    request = rpc_request(calls)
+    request.user = user = PermUser({'auth.view_user', 'auth.add_user'})
+    responses = loads(view(request).content.decode('utf8'))
+    assert [r['result'] for r in responses] == list(range(5))
+    assert sorted(user.checks) == ['auth.add_user', 'auth.view_user']
+
+    request = rpc_request(calls)
+    request.user = PermUser({'auth.view_user'})
+    responses = loads(view(request).content.decode('utf8'))
+    message = 'user does not have permission: auth.add_user'
+    assert all(r['error']['message'] == message for r in responses)
+    assert request.user.checks == ['auth.add_user']
+
+
+def test_perms_required_is_frozenset():
+    def func(client):
+        return 1
+
+    api(func, perm_required=['auth.add_user'], register=False)
+    initkwargs = func.as_view().view_initkwargs
+    assert initkwargs['perms_required'] == frozenset(['auth.add_user'])
+
+    view = RPCView(function=func, perms_required='auth.add_user')
+    assert view.perms_required == frozenset(['auth.add_user'])
+
+
+def test_dispatch_registry_conflicts():
+    def func(client):
+        pass
+
+    api(func, name='test.conflict', register=True)
+    with pytest.raises(ValueError):
+        api(lambda client: None, name='test.conflict', register=True)
+
+
+def test_dispatch_default_name_conflicts():
+    def conflict(client):
+        pass
+
+    def other():
+        def conflict(client):
+            pass
+        return conflict
+
+    api(conflict, register=True)
+    with pytest.raises(ValueError):
+        api(other(), register=True)
+
+
+def test_dispatch_registration_is_opt_in():
+    def unlisted(client):
+        pass
+
+    api(unlisted)
+    assert 'bricks.unlisted' not in __bricks_registry__
+    unlisted.as_view(login_required=True)
+
+    def listed(client):
+        pass
+
+    api(listed, register=True)
+    assert 'bricks.listed' in __bricks_registry__
+    with pytest.raises(TypeError):
+        listed.as_view(login_required=True)
+
+
+#
+# Coalescing
+#
+def test_single_flight_threads():
+    group = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def func(x):
+        calls.append(x)
+        release.wait(5)
+        return x * 2
+
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(group.call, 'key', func, 21)
+                   for _ in range(4)]
+        while group.in_flight('key') < 4:
+            time.sleep(0.001)
+        release.set()
+        assert [f.result() for f in futures] == [42] * 4
+    assert calls == [21]
+
+
+def test_single_flight_shares_errors():
+    group = SingleFlight()
+
+    def func():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        group.call('key', func)
+    assert group.in_flight('key') == 0
+
+
+def test_single_flight_does_not_share_rejected_results():
+    group = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def func(x):
+        calls.append(x)
+        release.wait(5)
+        return [x]
+
+    with ThreadPoolExecutor(3) as executor:
+        futures = [executor.submit(group.call, 'key', func, 1,
+                                   share=lambda result: False)
+                   for _ in range(3)]
+        while group.in_flight('key') < 3:
+            time.sleep(0.001)
+        release.set()
+        assert [f.result() for f in futures] == [[1]] * 3
+    assert calls == [1, 1, 1]
+
+
+def test_single_flight_survives_cancelled_leader():
+    group = SingleFlight()
+    calls = []
+
+    async def func(x):
+        calls.append(x)
+        await asyncio.sleep(0.01)
+        return x * 2
+
+    async def main():
+        leader = asyncio.ensure_future(group.acall('key', func, 21))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(group.acall('key', func, 21))
+                   for _ in range(2)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await asyncio.gather(*waiters), leader.cancelled()
+
+    assert run_async(main()) == ([42, 42], True)
+    assert calls == [21, 21]
+
+
+def test_coalesce_key_includes_user_if_login_is_required():
+    class Client:
+        def __init__(self, pk):
+            self.user = type('User', (), {'pk': pk})()
+
+    public = RPCView(function=add, coalesce=True)
+    private = RPCView(function=add, coalesce=True, login_required=True)
+    assert public.get_coalesce_key(Client(1), [1], {}) == \
+        public.get_coalesce_key(Client(2), [1], {})
+    assert private.get_coalesce_key(Client(1), [1], {}) != \
+        private.get_coalesce_key(Client(2), [1], {})
+
+
+def test_coalesce_async_view():
+    calls = []
+
+    async def slow(client, x):
+        calls.append(x)
+        await asyncio.sleep(0.01)
+        return x
+
+    view = api(slow, coalesce=True, register=False).as_view()
+    payload = {'jsonrpc': '2.0', 'method': 'slow', 'params': [1], 'id': 1}
+
+    async def main():
+        return await asyncio.gather(
+            *[view(rpc_request(payload)) for _ in range(5)])
+
+    responses = run_async(main())
+    assert [loads(r.content.decode('utf8'))['result']
+            for r in responses] == [1] * 5
+    assert calls == [1]
+
+
+#
+# Concurrency limits
+#
+def test_limiter_rejects_when_queue_is_full():
+    limiter = ConcurrencyLimiter(1, max_queue=0)
+    assert limiter.acquire()
+    assert not limiter.acquire()
+    limiter.release()
+    assert limiter.acquire()
+    assert limiter.stats() == {'active': 1, 'waiting': 0, 'rejected': 1}
+
+
+def test_limiter_queue_timeout():
+    limiter = ConcurrencyLimiter(1, max_queue=1, timeout=0.01)
+    assert limiter.acquire()
+    assert not limiter.acquire()
+    assert not run_async(limiter.acquire_async())
+
+    timer = threading.Timer(0.01, limiter.release)
+    timer.start()
+    assert limiter.acquire(timeout=5)
+
+
+def test_limited_view_sheds_load():
+    release = threading.Event()
+
+    def slow(client):
+        release.wait(5)
+        return 'done'
+
+    api(slow, max_concurrency=1, retry_after=2, register=False)
+    view = slow.as_view()
+    with ThreadPoolExecutor(1) as executor:
+        future = executor.submit(rpc_call, view, [])
+        while slow.limiter.stats()['active'] == 0:
+            time.sleep(0.001)
+        error = rpc_call(view, [])['error']
+        release.set()
+        assert future.result()['result'] == 'done'
+
+    assert error['code'] == -32001
+    assert error['data']['retry_after'] == 2
+
+
+#
+# Streaming
+#
+def stream_lines(response):
+    assert response['Content-Type'] == 'application/x-ndjson'
+    content = b''.join(response.streaming_content).decode('utf8')
+    return [loads(line) for line in content.splitlines()]
+
+
+def count(client, n):
+    for i in range(n):
+        yield i
+    return 'done'
+
+
+async def async_count(client, n):
+    for i in range(n):
+        await asyncio.sleep(0)
+        yield {i}
+
+
+def test_stream_generator():
+    view = RPCView.as_view(function=count)
+    response = view(rpc_request({'jsonrpc': '2.0', 'method': 'count',
+                                 'params': [3], 'id': 1}))
+    lines = stream_lines(response)
+    assert [x['partial'] for x in lines[:-1]] == [0, 1, 2]
+    assert lines[-1] == {'jsonrpc': '2.0', 'id': 1, 'result': 'done'}
+
+
+def test_stream_generator_error():
+    def fail(client):
+        yield 1
+        raise ValueError('boom')
+
+    view = RPCView.as_view(function=fail)
+    response = view(rpc_request({'jsonrpc': '2.0', 'method': 'fail',
+                                 'id': 1}))
+    lines = stream_lines(response)
+    assert lines[0]['partial'] == 1
+    assert lines[1]['error']['message'] == 'boom'
+
+
+def test_stream_async_generator():
+    view = api(async_count, register=False).as_view()
+    payload = {'jsonrpc': '2.0', 'method': 'count', 'params': [2], 'id': 1}
+
+    async def main():
+        response = await view(rpc_request(payload))
+        return [line async for line in response.streaming_content]
+
+    lines = [loads(line) for line in run_async(main())]
+    assert [x['partial'] for x in lines[:-1]] == [{0}, {1}]
+    assert lines[-1]['result'] is None
+
+
+def test_stream_holds_limiter_until_closed():
+    limiter = ConcurrencyLimiter(1)
+    view = RPCView.as_view(function=count, limiter=limiter)
+    payload = {'jsonrpc': '2.0', 'method': 'count', 'params': [3], 'id': 1}
+
+    response = view(rpc_request(payload))
+    lines = iter(response.streaming_content)
+    assert loads(next(lines))['partial'] == 0
+    assert limiter.stats()['active'] == 1
+    assert rpc_call(view, [1])['error']['code'] == -32001
+    assert len(list(lines)) == 3
+    assert limiter.stats()['active'] == 0
+
+    # Streams closed by the server or discarded before iteration
+    response = view(rpc_request(payload))
+    next(iter(response.streaming_content))
+    response.close()
+    assert limiter.stats()['active'] == 0
+    view(rpc_request(payload))
+    gc.collect()
+    assert limiter.stats()['active'] == 0
+
+
+def test_async_stream_holds_limiter_until_closed():
+    limiter = ConcurrencyLimiter(1)
+    view = api(async_count, limiter=limiter, register=False).as_view()
+    payload = {'jsonrpc': '2.0', 'method': 'count', 'params': [2], 'id': 1}
+
+    async def main():
+        response = await view(rpc_request(payload))
+        lines = response.streaming_content.__aiter__()
+        await lines.__anext__()
+        active = limiter.stats()['active']
+        rejected = loads((await view(rpc_request(payload))).content)
+        rest = [line async for line in lines]
+        return active, rejected, rest
+
+    active, rejected, rest = run_async(main())
+    assert active == 1
+    assert rejected['error']['code'] == -32001
+    assert len(rest) == 2
+    assert limiter.stats()['active'] == 0
+
+
+def test_stream_in_batch_is_materialized():
+    view = RPCView.as_view(function=count, result_cache=LRUResultCache('c'))
+    calls = [{'jsonrpc': '2.0', 'method': 'count', 'params': [3], 'id': 1}]
+    assert rpc_batch(view, calls)[0]['result'] == [0, 1, 2]
+    assert rpc_batch(view, calls)[0]['result'] == [0, 1, 2]
+
+
+#
+# Background jobs
+#
+def test_background_job():
+    release = threading.Event()
+
+    def slow(client, x):
+        release.wait(5)
+        return x * 2
+
+    view = api(slow, background=True, register=False).as_view()
+    assert 'bricks.job-status' in __bricks_registry__
+    job = rpc_call(view, [21])['result']
+    assert job['status'] in ('pending', 'running')
+
+    status_view = BricksRPCDispatchView.as_view()
+    status = dispatch_call(status_view, 'bricks.job-status', [job['id']])
+    assert status['result']['status'] in ('pending', 'running')
+
+    release.set()
+    status = dispatch_call(status_view, 'bricks.job-status',
+                           {'id': job['id'], 'wait': 5})
+    assert status['result'] == {'id': job['id'], 'status': 'done',
+                                'result': 42}
+
+
+def test_background_job_error():
+    def fail(client):
+        raise ValueError('boom')
+
+    view = api(fail, background=True, register=False).as_view()
+    job = rpc_call(view, [])['result']
+    status = rpc_call(job_status.as_view(), {'id': job['id'], 'wait': 5})
+    assert status['result']['status'] == 'error'
+    assert status['result']['error']['message'] == 'boom'
+
+
+def test_job_status_checks_user():
+    store = MemoryJobStore()
+    job = Job(user=type('User', (), {'pk': 1})())
+    store.save(job)
+    assert store.get(job.id) is job
+    get_job_store().save(job)
+    error = rpc_call(job_status.as_view(), [job.id])['error']
+    assert error['data']['exception'] == 'bricks.rpc.jobs.JobNotFound'
+
+
+#
+# Metrics
+#
+def test_metrics_are_recorded():
+    sink = get_metrics_sink()
+    view = RPCView.as_view(function=add, name='test.metrics')
+    rpc_call(view, [1, 2])
+    rpc_call(view, [1, 'two'])
+    assert sink.requests('test.metrics') == 2
+    assert sink.errors('test.metrics') == {'builtins.TypeError': 1}
+
+    text = prometheus_view(RequestFactory().get('/metrics/')).content
+    text = text.decode('utf8')
+    assert 'bricks_rpc_requests_total{function="test.metrics"} 2' in text
+    for phase in ['decode', 'credentials', 'execute', 'encode']:
+        assert ('bricks_rpc_phase_seconds_count{function="test.metrics",'
+                'phase="%s"} 2' % phase) in text
+    assert ('bricks_rpc_phase_seconds_count{function="test.metrics",'
+            'phase="js_compile"} 1') in text
+    assert 'bricks_rpc_response_bytes_sum{function="test.metrics"}' in text
+
+
+def test_stream_metrics_are_recorded_when_closed():
+    sink = get_metrics_sink()
+    view = RPCView.as_view(function=count, name='test.stream-metrics')
+    response = view(rpc_request({'jsonrpc': '2.0', 'method': 'count',
+                                 'params': [2], 'id': 1}))
+    assert sink.requests('test.stream-metrics') == 0
+    assert len(stream_lines(response)) == 3
+    assert sink.requests('test.stream-metrics') == 1
+
+
+def test_metrics_histogram_rendering():
+    sink = PrometheusSink()
+    metrics = RequestMetrics('f"n', request_size=100)
+    metrics.add_time('execute', 0.003)
+    sink.record(metrics)
+    lines = sink.render().splitlines()
+    assert 'bricks_rpc_phase_seconds_bucket{function="f\\"n",' \
+           'phase="execute",le="0.0025"} 0' in lines
+    assert 'bricks_rpc_phase_seconds_bucket{function="f\\"n",' \
+           'phase="execute",le="0.005"} 1' in lines
+    assert 'bricks_rpc_request_bytes_bucket{function="f\\"n",' \
+           'le="128"} 1' in lines
+
+
+#
+# Parameter binding
+#
+def resize(client, width: int, height: int, scale: float = 1.0, *,
+           tags: Optional[set] = None):
+    return [width, height, scale, tags]
+
+
+def test_binder_validates_params():
+    binder = Binder(resize)
+    assert binder.bind([1, 2], {}) == ([1, 2], {})
+    with pytest.raises(InvalidParams, match='missing required'):
+        binder.bind([1], {})
+    with pytest.raises(InvalidParams, match='at most 3'):
+        binder.bind([1, 2, 3, 4], {})
+    with pytest.raises(InvalidParams, match='multiple values'):
+        binder.bind([1, 2], {'width': 1})
+    with pytest.raises(InvalidParams, match='unexpected'):
+        binder.bind([1, 2], {'depth': 1})
+
+
+def test_binder_coerces_annotated_params():
+    binder = Binder(resize)
+    args, kwargs = binder.bind(['1', 2.0], {'scale': 2, 'tags': ['a']})
+    assert args == [1, 2]
+    assert kwargs == {'scale': 2.0, 'tags': {'a'}}
+    assert isinstance(kwargs['scale'], float)
+    assert binder.bind([1, 2], {'tags': None})[1] == {'tags': None}
+    with pytest.raises(InvalidParams, match="'width' must be int"):
+        binder.bind([1.5, 2], {})
+
+
+def test_invalid_params_error():
+    view = api(resize, register=False).as_view()
+    assert rpc_call(view, {'width': '3', 'height': 4})['result'] == \
+        [3, 4, 1.0, None]
+    error = rpc_call(view, {'width': 'wide', 'height': 4})['error']
+    assert error['code'] == -32602
+    assert error['data']['param'] == 'width'
+    assert rpc_call(view, [1])['error']['code'] == -32602
+
+
+#
+# Request bodies
+#
+def test_body_size_limit():
+    view = RPCView.as_view(function=add, max_body_size=100)
+    assert rpc_call(view, [1, 2])['result'] == 3
+    response = view(rpc_request({'jsonrpc': '2.0', 'method': 'add', 'id': 1,
+                                 'params': list(range(50))}))
+    assert response.status_code == 413
+
+
+def test_body_is_read_in_chunks():
+    def total(client, values):
+        return sum(values)
+
+    view = RPCView.as_view(function=total, body_chunk_size=16,
+                           max_body_size=4096)
+    assert rpc_call(view, [list(range(100))])['result'] == 4950
+
+    # The running limit is enforced even without a Content-Length header
+    request = rpc_request({'jsonrpc': '2.0', 'method': 'total', 'id': 1,
+                           'params': [list(range(1000))]})
+    del request.META['CONTENT_LENGTH']
+    assert view(request).status_code == 413
+
+
+#
+# Notifications
+#
+def test_notification_runs_after_response():
+    release = threading.Event()
+    done = threading.Event()
+
+    def mark(client, x):
+        release.wait(5)
+        done.set()
+
+    view = RPCView.as_view(function=mark, defer_notifications=True)
+    response = view(rpc_request({'jsonrpc': '2.0', 'method': 'mark',
+                                 'params': [1]}))
+    assert response.status_code == 204
+    assert not done.is_set()
+    release.set()
+    assert done.wait(5)
+
+
+def test_notification_inline_execution():
+    calls = []
+
+    def func(client):
+        calls.append(1)
+        return 3
+
+    view = RPCView.as_view(function=func)
+    response = view(rpc_request({'jsonrpc': '2.0', 'method': 'f'}))
+    assert calls == [1]
+    assert response.status_code == 204
+    assert response.content == b''
+
+    view = AsyncRPCView.as_view(function=func)
+    response = run_async(view(rpc_request({'jsonrpc': '2.0',
+                                             'method': 'f'})))
+    assert calls == [1, 1]
+    assert response.status_code == 204
+
+
+def test_call_with_null_id_is_not_a_notification():
+    view = RPCView.as_view(function=add, defer_notifications=True)
+    assert rpc_call(view, [1, 2], id=None)['result'] == 3
+
+
+def test_bounded_submitter():
+    release = threading.Event()
+    with ThreadPoolExecutor(1) as executor:
+        submitter = BoundedSubmitter(executor, 2)
+        futures = [submitter.try_submit(release.wait, 5) for _ in range(3)]
+        assert futures[2] is None
+        release.set()
+        futures[0].result()
+        futures[1].result()
+        assert submitter.try_submit(len, []).result() == 0
+
+
+#
+# GET requests
+#
+def get_request(query='', **extra):
+    request = RequestFactory().get('/api/' + query, **extra)
+    request.user = AnonymousUser()
+    return request
+
+
+def power(client, x: int, n: int = 2):
+    return x ** n
+
+
+def test_get_is_forbidden_by_default():
+    view = RPCView.as_view(function=power)
+    assert view(get_request('?x=2')).status_code == 403
+
+
+def test_get_request_with_query_params():
+    view = RPCView.as_view(function=power, http_get=True, max_age=60)
+    response = view(get_request('?x=2&n=3'))
+    assert response.status_code == 200
+    assert loads(response.content.decode('utf8')) == \
+        {'jsonrpc': '2.0', 'result': 8}
+    assert 'max-age=60' in response['Cache-Control']
+    assert 'private' in response['Cache-Control']
+
+    response = view(get_request('?params=[3]'))
+    assert loads(response.content.decode('utf8'))['result'] == 9
+
+
+def test_get_request_public_opt_in():
+    view = RPCView.as_view(function=power, http_get=True, public=True)
+    response = view(get_request('?x=2'))
+    assert 'public' in response['Cache-Control']
+
+    view = RPCView.as_view(function=power, http_get=True, public=True,
+                           vary_on_user=True)
+    response = view(get_request('?x=2'))
+    assert 'private' in response['Cache-Control']
+    assert 'public' not in response['Cache-Control']
+
+
+def test_get_request_etag():
+    view = RPCView.as_view(function=power, http_get=True, etag=True)
+    response = view(get_request('?x=2'))
+    etag = response['ETag']
+    assert 'no-cache' in response['Cache-Control']
+
+    response = view(get_request('?x=2', HTTP_IF_NONE_MATCH=etag))
+    assert response.status_code == 304
+    assert response['ETag'] == etag
+    assert response.content == b''
+
+    response = view(get_request('?x=3', HTTP_IF_NONE_MATCH=etag))
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+
+def test_get_request_errors_are_not_cached():
+    view = RPCView.as_view(function=power, http_get=True, max_age=60,
+                           etag=True)
+    response = view(get_request('?x=two'))
+    assert loads(response.content.decode('utf8'))['error']['code'] == -32602
+    assert 'ETag' not in response
+    assert 'max-age=0' in response['Cache-Control']
+    assert view(get_request('?params=[1')).status_code == 400
+
+
+def test_get_request_async_view():
+    async def apower(client, x: int):
+        return x ** 2
+
+    view = AsyncRPCView.as_view(function=apower, http_get=True, etag=True)
+    response = run_async(view(get_request('?x=4')))
+    assert loads(response.content.decode('utf8'))['result'] == 16
+    assert 'ETag' in response
+
+
+#
+# WebSockets
+#
+@pytest.fixture
+def ws_app():
+    async def slow_echo(client, x, delay=0.0):
+        await asyncio.sleep(delay)
+        return x
+
+    def secret(client):
+        return 42
+
+    registry = {
+        'test.add': RPCView(function=add),
+        'test.echo': AsyncRPCView(function=slow_echo),
+        'test.count': RPCView(function=count),
+        'test.secret': RPCView(function=secret,
+                               perms_required=['auth.add_user']),
+    }
+    return WebSocketRPC(registry=registry)
+
+
+def ws_run(app, coro_func, **kwargs):
+    async def main():
+        kwargs.setdefault('user', AnonymousUser())
+        async with WebSocketTestClient(app, **kwargs) as client:
+            return await coro_func(client)
+
+    return run_async(main())
+
+
+def test_websocket_call(ws_app):
+    async def main(client):
+        return await client.call('test.add', 1, y=2)
+
+    assert ws_run(ws_app, main) == 3
+
+
+def test_websocket_multiplexes_calls(ws_app):
+    async def main(client):
+        await client.send({'jsonrpc': '2.0', 'method': 'test.echo',
+                           'params': {'x': 'slow', 'delay': 0.2}, 'id': 1})
+        await client.send({'jsonrpc': '2.0', 'method': 'test.echo',
+                           'params': {'x': 'fast'}, 'id': 2})
+        return [await client.receive(), await client.receive()]
+
+    first, second = ws_run(ws_app, main)
+    assert (first['id'], first['result']) == (2, 'fast')
+    assert (second['id'], second['result']) == (1, 'slow')
+
+
+def test_websocket_batch_and_errors(ws_app):
+    async def main(client):
+        await client.send([
+            {'jsonrpc': '2.0', 'method': 'test.add', 'params': [1, 2],
+             'id': 1},
+            {'jsonrpc': '2.0', 'method': 'test.add', 'params': [1]},
+            {'jsonrpc': '2.0', 'method': 'test.missing', 'id': 2},
+            {'jsonrpc': '2.0', 'method': 'test.secret', 'id': 3},
+        ])
+        batch = await client.receive()
+        await client.send('{invalid')
+        return batch, await client.receive()
+
+    batch, parse_error = ws_run(ws_app, main)
+    assert [r['id'] for r in batch] == [1, 2, 3]
+    assert batch[0]['result'] == 3
+    assert batch[1]['error']['code'] == -32601
+    assert batch[2]['error']['code'] == -32000
+    assert parse_error['error']['code'] == -32700
+
+
+def test_websocket_stream(ws_app):
+    async def main(client):
+        await client.send({'jsonrpc': '2.0', 'method': 'test.count',
+                           'params': [3], 'id': 1})
+        return [await client.receive() for _ in range(4)]
+
+    lines = ws_run(ws_app, main)
+    assert [x.get('partial') for x in lines[:3]] == [0, 1, 2]
+    assert lines[3]['result'] == 'done'
+
+
+def test_websocket_permission_checks_are_memoized_per_message(ws_app):
+    user = PermUser(set())
+
+    async def main(client):
+        call = {'jsonrpc': '2.0', 'method': 'test.secret', 'id': 1}
+        await client.send(call)
+        denied = await client.receive()
+        user.perms.add('auth.add_user')
+        await client.send([call, dict(call, id=2)])
+        return denied, await client.receive()
+
+    denied, batch = ws_run(ws_app, main, user=user)
+    assert denied['error']['code'] == -32000
+    assert [r['result'] for r in batch] == [42, 42]
+    assert user.checks == ['auth.add_user', 'auth.add_user']
+
+
+def test_websocket_rejects_foreign_origin(ws_app):
+    async def main():
+        client = WebSocketTestClient(
+            ws_app, user=AnonymousUser(),
+            headers=[('host', 'example.com'),
+                     ('origin', 'https://evil.com')])
+        return await client.connect(), client.close_code
+
+    assert run_async(main()) == (False, 4003)
+
+
+#
+# Routed page methods
+#
+class Page:
+    factor = 10
+
+    def scale(self, client, x: int):
+        return self.factor * x
+
+    def items(self, client, n: int):
+        for i in range(n):
+            yield self.factor + i
+
+
+def page_request(page, payload):
+    request = rpc_request(payload)
+    request._bricks_page = page
+    return request
+
+
+def test_page_method_view_is_shared_by_pages():
+    view = RPCView.as_view(function=page_method(Page.scale))
+    other = Page()
+    other.factor = 2
+    for page, expected in [(Page(), 30), (other, 6)]:
+        payload = {'jsonrpc': '2.0', 'method': 'scale', 'params': ['3'],
+                   'id': 1}
+        response = view(page_request(page, payload))
+        assert loads(response.content.decode('utf8'))['result'] == expected
+
+    payload = {'jsonrpc': '2.0', 'method': 'scale', 'params': [], 'id': 1}
+    response = view(page_request(other, payload))
+    assert loads(response.content.decode('utf8'))['error']['code'] == -32602
+
+
+def test_page_method_generators_and_request_argument():
+    method = page_method(Page.items)
+    assert is_stream_function(method)
+    view = RPCView.as_view(function=method)
+    response = view(page_request(Page(), {'jsonrpc': '2.0', 'id': 1,
+                                          'method': 'items', 'params': [2]}))
+    assert [x.get('partial') for x in stream_lines(response)][:2] == [10, 11]
+
+    def double(page, x):
+        return 2 * x
+
+    view = RPCView.as_view(function=page_method(double, False))
+    response = view(page_request(Page(), {'jsonrpc': '2.0', 'id': 1,
+                                          'method': 'double', 'params': [4]}))
+    assert loads(response.content.decode('utf8'))['result'] == 8
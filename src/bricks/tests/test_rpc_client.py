@@ -0,0 +1,215 @@
+import asyncio
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory
+
+from bricks.rpc import RPCView, BricksRPCDispatchView
+from bricks.rpc_client import (RPCClient, AsyncRPCClient, RPCError,
+                               TransportError)
+
+
+def run_async(coro):
+    # asyncio.run() requires Python 3.7
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def add(client, x, y=0):
+    return x + y
+
+
+def shift(client, date, days: int):
+    return date + datetime.timedelta(days=days)
+
+
+def count(client, n):
+    for i in range(n):
+        yield i
+
+
+def fail(client):
+    raise ValueError('bad value')
+
+
+REGISTRY = {
+    'test.add': RPCView(function=add),
+    'test.shift': RPCView(function=shift),
+    'test.fail': RPCView(function=fail),
+}
+
+VIEWS = {
+    '/api/': BricksRPCDispatchView.as_view(registry=REGISTRY),
+    '/api/count/': RPCView.as_view(function=count),
+}
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    pass
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.path == '/drop/':
+            # Close the connection without sending a response
+            self.server.dropped += 1
+            self.close_connection = True
+            return
+        view = VIEWS.get(self.path)
+        if view is None:
+            return self.send_error(404)
+        request = RequestFactory().post(self.path, body,
+                                        content_type='application/json')
+        request.user = AnonymousUser()
+        response = view(request)
+
+        self.send_response(response.status_code)
+        self.send_header('Content-Type', response.get('Content-Type', ''))
+        if response.streaming:
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for chunk in response.streaming_content:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            self.wfile.write(b'0\r\n\r\n')
+        else:
+            self.send_header('Content-Length', str(len(response.content)))
+            self.end_headers()
+            self.wfile.write(response.content)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.dropped = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def url(server):
+    return 'http://127.0.0.1:%s/api/' % server.server_address[1]
+
+
+def test_client_call_reuses_connections(server, url):
+    with RPCClient(url) as client:
+        connections = server.connections
+        assert client.call('test.add', 1, 2) == 3
+        assert client.call('test.add', 1, y=3) == 4
+        assert client.call('test.add', x=2) == 2
+        assert server.connections == connections + 1
+
+
+def test_client_json_types(url):
+    with RPCClient(url) as client:
+        date = datetime.date(2000, 1, 1)
+        assert client.call('test.shift', date, 2) == datetime.date(2000, 1, 3)
+
+
+def test_client_errors(url):
+    with RPCClient(url) as client:
+        with pytest.raises(RPCError) as info:
+            client.call('test.fail')
+        assert info.value.message == 'bad value'
+        assert info.value.data['exception'] == 'builtins.ValueError'
+
+        with pytest.raises(RPCError) as info:
+            client.call('test.missing')
+        assert info.value.code == -32601
+
+        with pytest.raises(TransportError) as info:
+            client.call('/missing/')
+        assert info.value.status == 404
+
+
+def test_client_batch(server, url):
+    with RPCClient(url) as client:
+        client.call('test.add', 0)
+        connections = server.connections
+        with client.batch() as batch:
+            x = batch.call('test.add', 1, 2)
+            y = batch.call('test.fail')
+            batch.notify('test.add', 1)
+            z = batch.call('/api/count/', 3)
+        assert x.result() == 3
+        with pytest.raises(RPCError):
+            y.result()
+        assert z.result() == [0, 1, 2]
+        assert server.connections == connections
+
+
+def test_client_stream(url):
+    with RPCClient(url) as client:
+        assert list(client.stream('/api/count/', 3)) == [0, 1, 2]
+        assert client.call('/api/count/', 2) == [0, 1]
+        assert list(client.stream('test.add', 1, 2)) == [3]
+
+
+def test_client_does_not_retry_sent_post(server, url):
+    with RPCClient(url) as client:
+        client.call('test.add', 0)
+        dropped = server.dropped
+        with pytest.raises(ConnectionError):
+            client.call('/drop/')
+        assert server.dropped == dropped + 1
+
+
+def test_async_client_does_not_retry_sent_post(server, url):
+    async def main():
+        async with AsyncRPCClient(url) as client:
+            await client.call('test.add', 0)
+            with pytest.raises(ConnectionError):
+                await client.call('/drop/')
+
+    dropped = server.dropped
+    run_async(main())
+    assert server.dropped == dropped + 1
+
+
+def test_async_batch_requires_async_with(url):
+    client = AsyncRPCClient(url)
+    with pytest.raises(TypeError):
+        with client.batch():
+            pass
+
+
+def test_async_client(server, url):
+    async def main():
+        async with AsyncRPCClient(url) as client:
+            connections = server.connections
+            results = [await client.call('test.add', i, 1) for i in range(3)]
+            assert server.connections == connections + 1
+
+            async with client.batch() as batch:
+                x = batch.call('test.add', 1, 2)
+                y = batch.call('/api/count/', 2)
+            items = [item async for item in client.stream('/api/count/', 3)]
+            with pytest.raises(RPCError):
+                await client.call('test.fail')
+            return results, x.result(), y.result(), items
+
+    results, x, y, items = run_async(main())
+    assert results == [1, 2, 3]
+    assert (x, y) == (3, [0, 1])
+    assert items == [0, 1, 2]
@@ -11,13 +11,32 @@ def _possible_qualnames(cls):
     """
 
     for subclass in cls.mro()[:-1]:
-        path = subclass.__module__
-        name = subclass.__qualname__
+        yield from _class_qualnames(subclass)
 
-        while path:
-            value = '%s.%s' % (path, name)
-            yield value
-            path, _, _ = path.rpartition('.')
+
+def _class_qualnames(cls):
+    """
+    Iterator over possible qualified names for cls, excluding its bases.
+    """
+
+    path = cls.__module__
+    name = cls.__qualname__
+    while path:
+        yield '%s.%s' % (path, name)
+        path, _, _ = path.rpartition('.')
+
+
+def _find_lazy(cls, lazy_registry):
+    """
+    Return a tuple (base, qualname) with the class in the mro of cls that
+    matches a qualified name in lazy_registry, or (None, None).
+    """
+
+    for base in cls.mro()[:-1]:
+        for qualname in _class_qualnames(base):
+            if qualname in lazy_registry:
+                return base, qualname
+    return None, None
 
 
 def lazy_singledispatch(func):
@@ -85,11 +104,13 @@ def lazy_singledispatch(func):
 
         cls = x.__class__
         if lazy_registry:
-            for qualname in _possible_qualnames(cls):
-                if qualname in lazy_registry:
-                    implementation = lazy_registry.pop(qualname)
-                    wrapper.register(cls, implementation)
-                    return wrapper(x, **kwargs)
+            # The implementation is registered for the class that matches the
+            # lazy name and not for cls, which may be a subclass.
+            base, qualname = _find_lazy(cls, lazy_registry)
+            if base is not None:
+                implementation = lazy_registry.pop(qualname)
+                wrapper.register(base, implementation)
+                return wrapper(x, *args, **kwargs)
         dispatch_cache[cls] = func
         return func(x, *args, **kwargs)
 